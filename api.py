@@ -1,10 +1,301 @@
-from fastapi import FastAPI
-from music import generate_song
+import asyncio
+import itertools
+import json
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import partial
+from typing import Optional
+from fastapi import FastAPI, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from music import bar_chord, generate_song, generate_songs, iter_bars, lyric_model_id
+from cache import ResponseCache, cache_key
+from audio.export import wav_chunks
+import metrics
 
-app = FastAPI()
+# Generation is CPU-bound, so it runs in a process pool and the event loop only
+# awaits results. MUSIC_API_WORKERS sets the pool size (default: one per core).
+WORKERS = int(os.environ.get("MUSIC_API_WORKERS", 0)) or os.cpu_count()
+STREAM_CHUNK_BARS = 16  # bars generated per job in streaming mode
+BATCH_CHUNK_SONGS = 64  # songs generated per job by /generate/batch
+# Request limits: larger values get a 422 rather than tying up the pool
+MAX_LENGTH = 4096       # bars per song
+MAX_BATCH_SONGS = 10_000
+# Part of every cache key and ETag, along with the lyric model in use; bump it
+# when seeded generation or the response format changes so cached bodies expire
+CACHE_VERSION = 1
+
+# Seeded requests are deterministic and cached. MUSIC_API_DISK_CACHE names an
+# SQLite file (e.g. cache.db next to songs.db) that backs the in-memory LRU.
+cache = ResponseCache(
+    maxsize=int(os.environ.get("MUSIC_API_CACHE_SIZE", 1024)),
+    disk_path=os.environ.get("MUSIC_API_DISK_CACHE") or None,
+    disk_max_bytes=int(os.environ.get("MUSIC_API_DISK_CACHE_BYTES", 64 * 1024 * 1024)),
+)
+
+# Metrics are on while the app runs unless MUSIC_METRICS=0; importing api leaves
+# them alone. MUSIC_PROFILE_DIR turns on the sampling profiler: every request
+# writes <dir>/<request id>.folded with the stacks of the threads and worker
+# processes that ran its jobs, under "thread" and "worker" root frames.
+METRICS = os.environ.get("MUSIC_METRICS", "1") != "0"
+PROFILE_DIR = os.environ.get("MUSIC_PROFILE_DIR") or None
+PROFILE_INTERVAL = float(os.environ.get("MUSIC_PROFILE_INTERVAL", 0.005))
+REQUEST_SECONDS = metrics.registry.histogram("music_request_seconds", "HTTP request latency, body included",
+                                             ("route", "method", "status"))
+POOL_WAIT_SECONDS = metrics.registry.histogram("music_pool_job_seconds", "Process-pool job round trip, queueing included",
+                                               ("job",))
+_request_profile = ContextVar("request_profile", default=None)
+
+def _cache_metrics():
+    kinds = {"entries": "gauge", "disk_bytes": "gauge"}
+    return [(f"music_cache_{name}" + ("" if name in kinds else "_total"), kinds.get(name, "counter"),
+             f"Response cache {name.replace('_', ' ')}", value) for name, value in cache.stats().items()]
+
+metrics.registry.register_collector(_cache_metrics)
+
+_pool = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS)
+    return _pool
+
+@asynccontextmanager
+async def lifespan(app):
+    was_enabled = metrics.enabled
+    metrics.enable(METRICS)
+    try:
+        yield
+    finally:
+        metrics.enable(was_enabled)
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+app = FastAPI(lifespan=lifespan)
+
+class MetricsMiddleware:
+    """Times every request (streamed bodies included) and, when profiling, samples its stacks."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not (metrics.enabled or PROFILE_DIR):
+            return await self.app(scope, receive, send)
+        status = 500
+        request_id = uuid.uuid4().hex[:16]
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if PROFILE_DIR:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", request_id.encode())]
+            await send(message)
+
+        # The event loop is shared by every request, so it is not sampled; the
+        # profile only collects the stacks of this request's jobs (run_job, _profiled)
+        profile = metrics.SamplingProfiler(PROFILE_INTERVAL) if PROFILE_DIR else None
+        token = _request_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")  # bounded label values
+            REQUEST_SECONDS.observe(time.perf_counter() - start, route, scope["method"], str(status))
+            _request_profile.reset(token)
+            if profile is not None:
+                await run_in_threadpool(profile.dump, os.path.join(PROFILE_DIR, f"{request_id}.folded"))
+
+app.add_middleware(MetricsMiddleware)
+
+async def run_in_pool(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    profile = _request_profile.get()
+    if not metrics.enabled and profile is None:
+        return await loop.run_in_executor(get_pool(), partial(fn, *args, **kwargs))
+    # Workers send back what they recorded (and sampled) along with the result
+    start = time.perf_counter()
+    result, snapshot, stacks = await loop.run_in_executor(
+        get_pool(), partial(metrics.run_job, fn, args, kwargs, metrics.enabled, profile and profile.interval))
+    POOL_WAIT_SECONDS.observe(time.perf_counter() - start, fn.__name__)
+    if snapshot:
+        metrics.registry.merge(snapshot)
+    if stacks:
+        profile.merge(stacks, prefix="worker")
+    return result
+
+def _profiled(interval, fn, *args, **kwargs):
+    """Run fn sampling only the calling thread; returns (result, folded stack counts)."""
+    with metrics.SamplingProfiler(interval) as profiler:
+        result = fn(*args, **kwargs)
+    return result, dict(profiler.counts)
+
+async def run_in_thread(fn, *args, **kwargs):
+    """run_in_threadpool, with the job's thread sampled into the request's profile when profiling."""
+    profile = _request_profile.get()
+    if profile is None:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    result, stacks = await run_in_threadpool(_profiled, profile.interval, fn, *args, **kwargs)
+    profile.merge(stacks, prefix="thread")
+    return result
+
+# Worker-side jobs: they serialize to JSON themselves so the event loop only
+# forwards bytes.
+def _song_json(title, key, scale, length, clef, seed=None):
+    song = generate_song(title=title, key=key, scale=scale, length=length, clef=clef, seed=seed)
+    with metrics.timer("api.serialize"):
+        return json.dumps({"title": title, "key": key, "scale": scale, "length": length, "clef": clef, "notes": song})
+
+def _bars_ndjson(title, key, scale, first_bar, bars, clef, seed=None):
+    song = generate_song(title=title, key=key, scale=scale, length=bars, clef=clef, seed=seed)
+    lyrics = song["lyrics"].split("\n")
+    lines = []
+    with metrics.timer("api.serialize"):
+        for i in range(bars):
+            bar = {"bar": first_bar + i, "notes": song["notes"][i * 4:(i + 1) * 4],
+                   "chord": bar_chord(key, scale, first_bar + i), "lyrics": lyrics[i] if i < len(lyrics) else ""}
+            lines.append(json.dumps(bar) + "\n")
+    return "".join(lines)
+
+def _songs_json(count, title, key, scale, length, clef, seed):
+    songs = generate_songs(count, title, key, scale, length, clef, seed=seed, compact=True)
+    with metrics.timer("api.serialize"):
+        return ",".join(json.dumps(song.to_dict()) for song in songs)
+
+async def _stream_bars(title, key, scale, length, clef, seed=None):
+    yield json.dumps({"title": title, "key": key, "scale": scale, "length": length, "clef": clef}) + "\n"
+    if seed is not None:
+        # A seeded song is drawn in one piece so it matches the non-streamed response
+        yield await run_in_pool(_bars_ndjson, title, key, scale, 0, length, clef, seed)
+        return
+    chunks = [(start, min(STREAM_CHUNK_BARS, length - start)) for start in range(0, length, STREAM_CHUNK_BARS)]
+    # Keep one chunk in flight ahead of the one being sent
+    pending = None
+    for start, bars in chunks:
+        job = asyncio.ensure_future(run_in_pool(_bars_ndjson, title, key, scale, start, bars, clef))
+        if pending is not None:
+            yield await pending
+        pending = job
+    if pending is not None:
+        yield await pending
+
+def _next_bars(bars, count):
+    """NDJSON lines for the next count bars of a music.iter_bars generator ("" once it is exhausted)."""
+    with metrics.timer("api.serialize"):
+        return "".join(json.dumps(bar) + "\n" for bar in itertools.islice(bars, count))
+
+async def _stream_endless(request, title, key, scale, clef, seed=None):
+    yield json.dumps({"title": title, "key": key, "scale": scale, "length": None, "clef": clef}) + "\n"
+    # One generator per response, advanced a chunk at a time off the event loop; it
+    # keeps no history, so the stream runs in constant memory until the client leaves
+    bars = iter_bars(key, scale, None, clef, seed=seed)
+    while not await request.is_disconnected():
+        chunk = await run_in_thread(_next_bars, bars, STREAM_CHUNK_BARS)
+        if not chunk:
+            return
+        yield chunk
 
 @app.get("/generate")
-def generate(title: str = "Untitled", key: str = "C", scale: str = "major", length: int = 16, clef: str = "treble"):
-    """Generate a song using music theory parameters."""
-    song = generate_song(title=title, key=key, scale=scale, length=length, clef=clef)
-    return {"title": title, "key": key, "scale": scale, "length": length, "clef": clef, "notes": song}
+async def generate(request: Request, title: str = "Untitled", key: str = "C", scale: str = "major",
+                   length: int = Query(16, ge=0, le=MAX_LENGTH),
+                   clef: str = "treble", seed: Optional[int] = None, stream: bool = False, endless: bool = False):
+    """Generate a song using music theory parameters.
+
+    With stream=true the song is sent as NDJSON: a header line, then one line
+    per bar as soon as its chunk has been generated. endless=true streams bars
+    (with their chord) without end, ignoring length. With a seed the response
+    is reproducible, cached and carries an ETag.
+    """
+    if endless:
+        return StreamingResponse(_stream_endless(request, title, key, scale, clef, seed), media_type="application/x-ndjson")
+    if stream:
+        return StreamingResponse(_stream_bars(title, key, scale, length, clef, seed), media_type="application/x-ndjson")
+    if seed is None:
+        body = await run_in_pool(_song_json, title, key, scale, length, clef)
+        return Response(body, media_type="application/json")
+    digest = cache_key(title=title, key=key, scale=scale, length=length, clef=clef, seed=seed,
+                       version=CACHE_VERSION, lyrics_model=lyric_model_id())
+    etag = f'"{digest}"'
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        cache.not_modified += 1
+        return Response(status_code=304, headers={"ETag": etag})
+    body = cache.get(digest)
+    if body is None and cache.disk is not None:
+        body = await run_in_thread(cache.get_disk, digest)
+    if body is None:
+        body = (await run_in_pool(_song_json, title, key, scale, length, clef, seed)).encode("utf-8")
+        if cache.disk is not None:
+            await run_in_thread(cache.put, digest, body)
+        else:
+            cache.put(digest, body)
+    return Response(body, media_type="application/json", headers={"ETag": etag})
+
+async def _stream_audio(request, chunks):
+    # Each block is rendered off the event loop just before it is sent, so the
+    # response never holds more than one block of the song
+    while not await request.is_disconnected():
+        chunk = await run_in_thread(next, chunks, b"")
+        if not chunk:
+            return
+        yield chunk
+
+@app.get("/render")
+async def render(request: Request, title: str = "Untitled", key: str = "C", scale: str = "major",
+                 length: int = Query(16, ge=0, le=MAX_LENGTH),
+                 clef: str = "treble", seed: Optional[int] = None, tempo: int = 120):
+    """Generate a song and stream it as a 16-bit mono WAV, rendered block by block."""
+    if tempo <= 0:
+        return PlainTextResponse("tempo must be positive", status_code=400)
+    song = await run_in_thread(generate_song, title=title, key=key, scale=scale, length=length, clef=clef, seed=seed)
+    return StreamingResponse(_stream_audio(request, wav_chunks(song, tempo)), media_type="audio/wav")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text format: request latency, per-function timings (worker ones included) and cache counters."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Hit/miss counters of the response cache."""
+    return cache.stats()
+
+class BatchRequest(BaseModel):
+    count: int = Field(10, ge=1, le=MAX_BATCH_SONGS)
+    title: str = "Untitled"
+    key: str = "C"
+    scale: str = "major"
+    length: int = Field(16, ge=0, le=MAX_LENGTH)
+    clef: str = "treble"
+    seed: Optional[int] = None
+
+async def _stream_batch(req):
+    yield '{"count": %d, "songs": [' % req.count
+    def submit(j):
+        start = j * BATCH_CHUNK_SONGS
+        # Chunk j is seeded with [seed, j], so a seeded batch is reproducible
+        seed = None if req.seed is None else [req.seed, j]
+        return asyncio.ensure_future(run_in_pool(_songs_json, min(BATCH_CHUNK_SONGS, req.count - start), req.title, req.key,
+                                                 req.scale, req.length, req.clef, seed))
+    chunks = -(-req.count // BATCH_CHUNK_SONGS)
+    # Keep every worker busy without holding the whole batch in memory
+    jobs = deque(submit(j) for j in range(min(chunks, 2 * WORKERS)))
+    for j in range(chunks):
+        body = await jobs.popleft()
+        if j + len(jobs) + 1 < chunks:
+            jobs.append(submit(j + len(jobs) + 1))
+        yield ("," if j else "") + body
+    yield "]}"
+
+@app.post("/generate/batch")
+async def generate_batch(req: BatchRequest):
+    """Generate many songs in one request, spread across the worker pool."""
+    return StreamingResponse(_stream_batch(req), media_type="application/json")
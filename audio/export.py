@@ -0,0 +1,77 @@
+# Chunked audio export: songs are rendered a block at a time and each block is written as soon as it is made,
+# so memory stays flat however long the song is
+import os
+import struct
+import wave
+import numpy as np
+from audio.render import SAMPLE_RATE, RenderPlan
+from metrics import timed
+
+BLOCK = 1 << 14  # frames rendered per chunk
+VOLUME = 0.2     # same level as audio.render.render_song
+# soundfile (libsndfile) format and subtype per extension; WAV needs no codec library
+CODECS = {'flac': ('FLAC', 'PCM_16'), 'ogg': ('OGG', 'VORBIS')}
+FORMATS = ('wav',) + tuple(CODECS)
+
+
+def _plan_chunks(plan, volume, block):
+    out = np.empty(min(block, plan.total), dtype=np.float32)
+    for start in range(0, plan.total, block):
+        stop = min(start + block, plan.total)
+        yield plan.render(start, stop, out[:stop - start], volume)
+
+
+def render_chunks(song, tempo=120, volume=VOLUME, sample_rate=SAMPLE_RATE, block=BLOCK):
+    """Yield a song's float32 samples block by block; one buffer is reused, so copy a block to keep it."""
+    return _plan_chunks(RenderPlan(song, tempo, sample_rate), volume, block)
+
+
+def pcm16(samples):
+    """Little-endian 16-bit PCM bytes of float samples in [-1, 1] ((frames, channels) arrays interleave)."""
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+
+def wav_header(frames, channels=1, sample_rate=SAMPLE_RATE):
+    """44-byte RIFF header of a 16-bit PCM WAV holding the given number of frames."""
+    size = frames * channels * 2
+    return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + size, b'WAVE', b'fmt ', 16, 1, channels, sample_rate,
+                       sample_rate * channels * 2, channels * 2, 16, b'data', size)
+
+
+def wav_chunks(song, tempo=120, volume=VOLUME, sample_rate=SAMPLE_RATE, block=BLOCK):
+    """Yield a complete mono WAV file as bytes: the header (the length is known from the plan), then PCM blocks."""
+    plan = RenderPlan(song, tempo, sample_rate)
+    yield wav_header(plan.total, 1, sample_rate)
+    for samples in _plan_chunks(plan, volume, block):
+        yield pcm16(samples)
+
+
+def write_audio(blocks, filename, sample_rate=SAMPLE_RATE, channels=1, format=None):
+    """Write float sample blocks to a WAV, FLAC or OGG file as they arrive; the format defaults to the extension.
+
+    FLAC and OGG need the optional soundfile package, imported on first use.
+    """
+    format = (format or os.path.splitext(filename)[1][1:] or 'wav').lower()
+    if format == 'wav':
+        with wave.open(filename, 'wb') as f:
+            f.setnchannels(channels)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            for samples in blocks:
+                f.writeframes(pcm16(samples))
+        return filename
+    if format not in CODECS:
+        raise ValueError(f"unsupported audio format {format!r}; expected one of {', '.join(FORMATS)}")
+    import soundfile  # optional codec library, loaded on first use
+    codec, subtype = CODECS[format]
+    with soundfile.SoundFile(filename, 'w', samplerate=sample_rate, channels=channels, subtype=subtype,
+                             format=codec) as f:
+        for samples in blocks:
+            f.write(samples)
+    return filename
+
+
+@timed
+def export_audio(song, filename, tempo=120, volume=VOLUME, sample_rate=SAMPLE_RATE, format=None, block=BLOCK):
+    """Render a song straight into an audio file (see write_audio for formats); returns the filename."""
+    return write_audio(render_chunks(song, tempo, volume, sample_rate, block), filename, sample_rate, 1, format)
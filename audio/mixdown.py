@@ -0,0 +1,153 @@
+# Multi-track mixdown: renders each Track by instrument in worker threads and sums them into stereo
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from core.song import CompactSong, as_compact
+from audio.render import SAMPLE_RATE, render_song
+from metrics import timed
+from theory import DRUM_NAMES
+
+# General MIDI programs used when a SoundFont is given; other instruments use the sine renderer
+INSTRUMENT_PROGRAMS = {'Piano': 0, 'Guitar': 24, 'Bass': 33, 'Synth': 80}
+DRUM_INSTRUMENTS = ('Drums',)
+TRACK_VOLUME = 0.2  # same level as audio.render.render_song
+
+
+def track_song(track):
+    """The notes of a Track as a CompactSong.
+
+    Track.notes may hold a CompactSong or song dict, theory.Note objects, or
+    note mappings (dicts or NoteViews) with at least 'note' and 'duration'.
+    """
+    notes = track.notes
+    if isinstance(notes, (CompactSong, dict)):
+        return as_compact(notes)
+    rows = []
+    for n in notes:
+        if hasattr(n, 'octave') and hasattr(n, 'name'):
+            n = {'note': n.name, 'duration': n.duration, 'dynamic': n.dynamic, 'frequency': n.frequency}
+        rows.append(n)
+    return CompactSong.from_dict({'notes': rows})
+
+
+def fingerprint(track, song, tempo, soundfont):
+    """Hash of everything a track render depends on; gain, pan and mute are applied at mix time."""
+    h = hashlib.blake2b(song.to_bytes(), digest_size=16)
+    h.update(repr((track.instrument, tempo, soundfont, song.chords)).encode())
+    return h.hexdigest()
+
+
+# Drums: one synthesized hit per DRUM_NAMES entry, placed at each note's onset
+def _drum_hit(name, sample_rate):
+    rng = np.random.default_rng(0)
+    if name == 'Kick':
+        t = np.arange(int(0.35 * sample_rate)) / sample_rate
+        return np.sin(2 * np.pi * (50 * t + 60 * (1 - np.exp(-t * 30)) / 30)) * np.exp(-t * 9)
+    if name.startswith('Tom'):
+        freq = {'Tom Low': 100, 'Tom Mid': 140, 'Tom High': 190}[name]
+        t = np.arange(int(0.3 * sample_rate)) / sample_rate
+        return np.sin(2 * np.pi * freq * t) * np.exp(-t * 12)
+    length, decay = {'Snare': (0.2, 20), 'Hi-Hat Closed': (0.06, 70), 'Hi-Hat Open': (0.3, 12),
+                     'Crash': (1.2, 3), 'Ride': (0.8, 5)}[name]
+    t = np.arange(int(length * sample_rate)) / sample_rate
+    noise = rng.uniform(-1, 1, len(t))
+    if name.startswith('Hi-Hat') or name in ('Crash', 'Ride'):
+        noise = np.diff(noise, prepend=0) / 2  # crude high-pass
+    if name == 'Snare':
+        noise = 0.6 * noise + 0.4 * np.sin(2 * np.pi * 180 * t)
+    return noise * np.exp(-t * decay)
+
+
+_drum_cache = {}
+
+def drum_hits(sample_rate=SAMPLE_RATE):
+    """MIDI number -> float32 one-shot for every DRUM_NAMES entry, built once per sample rate."""
+    hits = _drum_cache.get(sample_rate)
+    if hits is None:
+        hits = _drum_cache[sample_rate] = {midi: _drum_hit(name, sample_rate).astype(np.float32)
+                                           for midi, name in DRUM_NAMES.items()}
+    return hits
+
+
+def render_drums(song, tempo=120, volume=TRACK_VOLUME, sample_rate=SAMPLE_RATE):
+    """Mono drum track: pitches naming a DRUM_NAMES MIDI number play that drum, others cycle through the kit."""
+    hits = drum_hits(sample_rate)
+    kit = list(hits)
+    scale = sample_rate * 120 / tempo  # timing as in audio.render
+    starts = np.rint(song.onset.astype(np.float64) * scale).astype(np.int64).tolist()
+    ends = np.rint((song.onset + song.duration).astype(np.float64) * scale).astype(np.int64)
+    chosen = [hits[p] if p in hits else hits[kit[p % len(kit)]] for p in song.pitch.tolist()]
+    out = np.zeros(max([int(ends.max(initial=0))] + [s + len(h) for s, h in zip(starts, chosen)]), dtype=np.float32)
+    for start, hit in zip(starts, chosen):
+        out[start:start + len(hit)] += hit
+    out *= volume
+    return out
+
+
+@timed
+def render_track(track, song, tempo=120, soundfont=None, sample_rate=SAMPLE_RATE):
+    """Render one track as mono (sine, drums) or stereo (SoundFont) float32 samples."""
+    if track.instrument in DRUM_INSTRUMENTS:
+        return render_drums(song, tempo, sample_rate=sample_rate)
+    if soundfont is not None:
+        from audio.soundfont import render_soundfont
+        return render_soundfont(song, soundfont, INSTRUMENT_PROGRAMS.get(track.instrument, 0), tempo)
+    return render_song(song, tempo, TRACK_VOLUME, sample_rate)
+
+
+def pan_gains(pan):
+    """Constant-power (left, right) gains for pan in [-1, 1]."""
+    angle = (np.clip(pan, -1, 1) + 1) * np.pi / 4
+    return np.cos(angle), np.sin(angle)
+
+
+class Mixer:
+    """Mixes tracks into a stereo float32 buffer of shape (frames, 2).
+
+    Track renders are cached by fingerprint, so a mix only re-renders the
+    tracks whose notes, instrument or tempo changed; gain, pan and mute are
+    cheap and applied at every mix. Renders run in a thread pool; the NumPy
+    kernels (and FluidSynth) release the GIL while they work.
+    """
+    def __init__(self, tempo=120, soundfont=None, sample_rate=SAMPLE_RATE, workers=None):
+        self.tempo = tempo
+        self.soundfont = soundfont
+        self.sample_rate = sample_rate
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self._renders = {}  # fingerprint -> samples
+        self.rendered = 0   # tracks rendered by the last mix
+
+    def clear(self):
+        self._renders.clear()
+
+    @timed
+    def mix(self, tracks):
+        """Mix a MultiTrackSong or a list of Tracks; muted tracks are skipped but keep their cached render."""
+        tracks = list(getattr(tracks, 'tracks', tracks))
+        keys = []
+        pending = {}
+        for track in tracks:
+            song = track_song(track)
+            key = fingerprint(track, song, self.tempo, self.soundfont)
+            keys.append(key)
+            if not track.muted and key not in self._renders and key not in pending:
+                pending[key] = (track, song)
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(pending))) as pool:
+                futures = {key: pool.submit(render_track, track, song, self.tempo, self.soundfont, self.sample_rate)
+                           for key, (track, song) in pending.items()}
+                for key, future in futures.items():
+                    self._renders[key] = future.result()
+        self.rendered = len(pending)
+        # Forget renders of tracks that were removed or changed
+        self._renders = {key: self._renders[key] for key in keys if key in self._renders}
+        audible = [(track, key) for track, key in zip(tracks, keys) if not track.muted]
+        out = np.zeros((max((len(self._renders[k]) for _, k in audible), default=0), 2), dtype=np.float32)
+        for track, key in audible:
+            samples = self._renders[key]
+            left, right = pan_gains(track.pan)
+            if samples.ndim == 1:
+                samples = samples[:, None]
+            out[:len(samples)] += samples * np.array([left, right], dtype=np.float32) * track.gain
+        return out
@@ -1,2 +1,340 @@
-# Audio playback, synthesis, and soundfont support
-# ...move playback and soundfont code from music.py here...
+# Audio playback on one long-lived sounddevice OutputStream
+import threading
+import numpy as np
+from audio.render import RenderPlan, SAMPLE_RATE
+from audio.voices import VoiceEngine
+
+
+class RingBuffer:
+    """Fixed-size single-producer/single-consumer FIFO of frames (one sample per channel)."""
+    def __init__(self, capacity, channels=1):
+        self._data = np.zeros((capacity, channels) if channels > 1 else capacity, dtype=np.float32)
+        self._read = 0   # total samples ever read
+        self._write = 0  # total samples ever written
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def __len__(self):
+        return self._write - self._read
+
+    def space(self):
+        return self.capacity - len(self)
+
+    def write(self, samples):
+        n = min(len(samples), self.space())
+        i = self._write % self.capacity
+        head = min(n, self.capacity - i)
+        self._data[i:i + head] = samples[:head]
+        self._data[:n - head] = samples[head:n]
+        self._write += n
+        return n
+
+    def read(self, out):
+        n = min(len(out), len(self))
+        i = self._read % self.capacity
+        head = min(n, self.capacity - i)
+        out[:head] = self._data[i:i + head]
+        out[head:n] = self._data[:n - head]
+        self._read += n
+        return n
+
+    def clear(self):
+        self._read = self._write
+
+
+class TapBuffer:
+    """Overwriting ring of the most recent output samples, for visualisation.
+
+    The audio callback writes without locking and never waits; a reader may
+    occasionally see a block being overwritten, which a scope can live with.
+    """
+    def __init__(self, capacity):
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._write = 0  # total samples ever written
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def write(self, samples):
+        samples = samples[-self.capacity:]
+        n = len(samples)
+        i = self._write % self.capacity
+        head = min(n, self.capacity - i)
+        self._data[i:i + head] = samples[:head]
+        self._data[:n - head] = samples[head:]
+        self._write += n
+
+    def latest(self, out):
+        """Fill out with the newest len(out) samples, oldest first."""
+        n = min(len(out), self.capacity)
+        end = self._write
+        out[:len(out) - n] = 0
+        out[len(out) - n:] = self._data.take(np.arange(end - n, end) % self.capacity)
+        return out
+
+
+class BufferPlan:
+    """A prerendered (frames,) or (frames, channels) buffer, played like a RenderPlan at a fixed tempo."""
+    def __init__(self, samples):
+        self.samples = samples
+        self.total = len(samples)
+        self.tempo = None
+
+    def __len__(self):
+        return self.total
+
+    def render(self, start=0, stop=None, out=None, volume=1.0):
+        samples = self.samples[start:stop]
+        return samples * volume if volume != 1.0 else samples
+
+
+class CachedPlan:
+    """A RenderPlan that keeps what it renders, so every loop pass after the first replays those samples.
+
+    Samples are kept from the start of the song up to the furthest point
+    rendered in order; a range past that (playback resumed mid-song after a
+    tempo change) is rendered directly and kept from the next pass on.
+    """
+    def __init__(self, plan):
+        self.plan = plan
+        self.total = plan.total
+        self.tempo = plan.tempo
+        self.offsets, self.lengths = plan.offsets, plan.lengths
+        self._samples = np.empty(plan.total, dtype=np.float32)
+        self._cached = 0  # samples [0, _cached) are kept
+
+    def __len__(self):
+        return self.total
+
+    def render(self, start=0, stop=None, out=None, volume=1.0):
+        stop = self.total if stop is None else min(stop, self.total)
+        if start > self._cached:
+            return self.plan.render(start, stop, out, volume)
+        if stop > self._cached:
+            self.plan.render(self._cached, stop, self._samples[self._cached:stop])
+            self._cached = stop
+        samples = self._samples[start:stop]
+        return samples * volume if volume != 1.0 else samples
+
+
+class Player:
+    """Plays songs through a persistent stereo output stream fed from a ring buffer.
+
+    A feeder thread renders the song a few blocks ahead into the ring buffer and
+    the stream callback drains it. Songs are kept as they are rendered
+    (CachedPlan), so loop mode wraps around in that render. Volume, mute and stop are applied in the
+    callback; tempo changes re-plan the song and drop what was buffered, so all
+    of them are heard on the next audio block. Keyboard voices are mixed on top
+    by a VoiceEngine running in the same callback, and every block is copied to
+    tap for the live scope. Mono songs go to both channels; prerendered
+    buffers (play_buffer) may be stereo.
+    """
+    channels = 2
+
+    def __init__(self, sample_rate=SAMPLE_RATE, blocksize=256, buffer_blocks=8, tap_size=1 << 13):
+        self.sample_rate = sample_rate
+        self.blocksize = blocksize
+        self.volume = 0.2
+        self.muted = False
+        self.loop = False
+        self.plan = None
+        self._song = None
+        self._bars = None     # bar iterator being streamed by play_bars, None once exhausted
+        self._bar_tempo = 120
+        self._reverse = False
+        self._active = False
+        self._ring = RingBuffer(blocksize * buffer_blocks, self.channels)
+        self._render_pos = 0  # next plan sample the feeder renders
+        self._play_pos = 0    # next plan sample the callback outputs (negative while a previous bar's tail drains)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._done = threading.Event()
+        self._done.set()
+        self.voices = VoiceEngine(sample_rate)
+        self.tap = TapBuffer(tap_size)  # what was last sent to the device (channels averaged), for the scope
+        self._voice_block = np.zeros(blocksize, dtype=np.float32)
+        self._tap_block = np.zeros(blocksize, dtype=np.float32)
+        self._stream = None
+        self._feeder = None
+        self._closed = False
+
+    def start(self):
+        """Open the output stream once; later calls are no-ops."""
+        if self._stream is not None:
+            return
+        import sounddevice as sd  # PortAudio is only needed once something plays
+        self._stream = sd.OutputStream(samplerate=self.sample_rate, blocksize=self.blocksize, channels=self.channels,
+                                       dtype='float32', latency='low', callback=self._callback)
+        self._stream.start()
+        self._feeder = threading.Thread(target=self._feed, daemon=True)
+        self._feeder.start()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def _begin(self, plan, song=None, reverse=False, loop=False, bars=None, pos=0):
+        self.start()
+        with self._lock:
+            self._song, self._reverse, self.plan = song, reverse, plan
+            self._bars = bars
+            self.loop = loop
+            self._ring.clear()
+            self._render_pos = self._play_pos = pos
+            self._active = bars is not None or plan.total > pos
+            if self._active:
+                self._done.clear()
+            else:
+                self._done.set()
+        self._wake.set()
+
+    def play(self, song, tempo=120, loop=False, reverse=False):
+        self._begin(CachedPlan(RenderPlan(song, tempo, self.sample_rate, reverse)), song, reverse, loop)
+
+    def play_bars(self, bars, tempo=120):
+        """Stream bars ({'notes': [...]}, e.g. music.iter_bars) as they are produced.
+
+        The feeder pulls the next bar only when the current one is rendered, so
+        an endless iterator plays in constant memory until stop(). Tempo changes
+        apply from the next bar; loop and reverse do not apply.
+        """
+        bars = iter(bars)
+        first = next(bars, None)
+        if first is None:
+            return
+        self._bar_tempo = tempo
+        self._begin(RenderPlan(first, tempo, self.sample_rate), bars=bars)
+
+    def play_buffer(self, samples, loop=False, keep_position=False):
+        """Play prerendered (frames,) or (frames, 2) samples at full scale; volume and mute still apply.
+
+        keep_position swaps the buffer in under the one playing (a remix after
+        a track was muted, say) without restarting it. Returns the plan, which
+        stays self.plan while this buffer plays. Tempo changes do not apply.
+        """
+        plan = BufferPlan(np.asarray(samples, dtype=np.float32))
+        with self._lock:
+            pos = min(max(self._play_pos, 0), plan.total) if keep_position and self._active else 0
+        self._begin(plan, loop=loop, pos=pos)
+        return plan
+
+    def _next_bar(self, plan, bars):
+        """Swap in the plan of the next streamed bar (built outside the lock); False when the stream ended."""
+        bar = next(bars, None)
+        if bar is not None:
+            bar_plan = RenderPlan(bar, self._bar_tempo, self.sample_rate, phase=plan.end_phase)
+        with self._lock:
+            if self.plan is not plan or self._bars is not bars:
+                return True  # replaced meanwhile; the feeder picks up the new state
+            if bar is None:
+                self._bars = None
+                return False
+            self.plan = bar_plan
+            # The ring still holds the end of the finished bar, which plays before sample 0 of this one
+            self._play_pos -= plan.total
+            self._render_pos = 0
+        return True
+
+    def stop(self):
+        with self._lock:
+            self._active = False
+            self._bars = None
+            self._ring.clear()
+        self.voices.all_notes_off()
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Block until the current song ends or is stopped."""
+        return self._done.wait(timeout)
+
+    @property
+    def is_playing(self):
+        return not self._done.is_set()
+
+    def set_tempo(self, tempo):
+        """Re-plan the current song at a new tempo, keeping the playback position."""
+        if self._bars is not None:
+            self._bar_tempo = tempo
+            return
+        if self._song is None or tempo == self.plan.tempo:
+            return  # nothing to re-plan: idle, or a stopped bar stream
+        plan = CachedPlan(RenderPlan(self._song, tempo, self.sample_rate, self._reverse))
+        with self._lock:
+            old = self.plan
+            pos = 0
+            if 0 <= self._play_pos < old.total:
+                k = int(np.searchsorted(old.offsets, self._play_pos, side='right')) - 1
+                frac = (self._play_pos - old.offsets[k]) / max(int(old.lengths[k]), 1)
+                pos = int(plan.offsets[k] + frac * plan.lengths[k])
+            self.plan = plan
+            self._ring.clear()
+            self._render_pos = self._play_pos = pos
+        self._wake.set()
+
+    def note_on(self, name):
+        """Start a keyboard voice ("C4", "F#2", ...) from the next block on."""
+        self.start()
+        return self.voices.note_on(name)
+
+    def note_off(self, name):
+        self.voices.note_off(name)
+
+    def _feed(self):
+        block = np.empty(self.blocksize, dtype=np.float32)
+        while not self._closed:
+            with self._lock:
+                plan, pos, ready = self.plan, self._render_pos, self._active and self._ring.space() >= self.blocksize
+                bars = self._bars
+                if ready and pos >= plan.total:
+                    if self.loop:
+                        pos = self._render_pos = 0
+                    else:
+                        ready = False
+            if not ready and bars is not None and pos >= plan.total:
+                self._next_bar(plan, bars)
+                continue
+            if not ready:
+                self._wake.wait(self.blocksize / self.sample_rate / 2)
+                self._wake.clear()
+                continue
+            stop = min(pos + self.blocksize, plan.total)
+            n = stop - pos
+            samples = plan.render(pos, stop, block)[:n]
+            with self._lock:
+                # Drop the block if stop/play/set_tempo replaced the plan meanwhile
+                if plan is self.plan and pos == self._render_pos and self._active:
+                    self._ring.write(samples.reshape(n, -1))  # mono fills every channel
+                    self._render_pos = stop
+
+    def _callback(self, outdata, frames, time_info, status):
+        out = outdata
+        with self._lock:
+            n = self._ring.read(out)
+            if n:
+                self._play_pos += n
+                if self.loop and self._play_pos >= self.plan.total:
+                    self._play_pos %= self.plan.total
+            finished = (self._active and n == 0 and not self.loop and self._bars is None
+                        and self._render_pos >= self.plan.total)
+            if finished:
+                self._active = False
+            out[:n] *= 0.0 if self.muted else self.volume
+            out[n:] = 0
+        if frames > len(self._voice_block):
+            self._voice_block = np.zeros(frames, dtype=np.float32)
+            self._tap_block = np.zeros(frames, dtype=np.float32)
+        voice = self._voice_block[:frames]
+        voice[:] = 0
+        self.voices.render(voice)
+        out += voice[:, None]
+        self.tap.write(np.mean(out, axis=1, out=self._tap_block[:frames]))
+        if finished:
+            self._done.set()
+        self._wake.set()
@@ -0,0 +1,170 @@
+# Offline song renderer: turns a song dict into one float32 sample buffer
+import functools
+import numpy as np
+from theory import NOTE_TO_INT, note_to_freq
+from core.song import CompactSong, song_notes, song_chords
+from metrics import timed
+
+SAMPLE_RATE = 44100
+TWO_PI = 2 * np.pi
+ENVELOPE = (0.005, 0.05, 0.7, 0.03)  # ADSR: attack, decay and release in seconds, sustain level
+MAX_VOICES = 4       # the melody plus up to three chord tones
+BAR_NOTES = 4        # melody notes under each chord, as in music.BAR_NOTES
+CHORD_OCTAVE = 3     # chords sound an octave below the melody
+CHORD_GAIN = 0.25    # level of each chord tone against the melody's 1.0
+
+
+def note_frequency(note):
+    """Frequency of a note dict; notes without 'frequency' are taken from octave 4."""
+    if 'frequency' in note:
+        return note['frequency']
+    if note.get('note') in NOTE_TO_INT:
+        return note_to_freq(note['note'], 4)
+    return 440.0
+
+
+def chord_frequencies(chord):
+    """Frequencies of a chord's tones in close position upwards from its root in CHORD_OCTAVE."""
+    root = NOTE_TO_INT[chord['root']]
+    pcs = np.array([NOTE_TO_INT[n] for n in chord['chord']])
+    midi = 12 * (CHORD_OCTAVE + 1) + root + (pcs - root) % 12
+    return 440.0 * 2.0 ** ((midi - 69) / 12)
+
+
+@functools.lru_cache(maxsize=None)
+def envelope_tables(sample_rate=SAMPLE_RATE, envelope=ENVELOPE):
+    """(head, tail) gain tables: head indexed by samples since note-on (attack, decay, then sustain
+    from the last entry on), tail by samples left before note-off (the release ramp, 1 from its end on)."""
+    attack, decay, sustain, release = envelope
+    a, d, r = max(1, int(attack * sample_rate)), int(decay * sample_rate), max(1, int(release * sample_rate))
+    head = np.concatenate([np.arange(a) / a, 1 - (1 - sustain) * np.arange(d) / max(d, 1), [sustain]])
+    tail = (np.arange(r) + 1) / r
+    return head.astype(np.float32), tail.astype(np.float32)
+
+
+def _phases(steps, lengths, phase):
+    """Phase at the start of each segment of a voice, carried on from the one before and wrapped."""
+    phases = np.full(len(steps), phase, dtype=np.float64)
+    if len(steps) > 1:
+        np.cumsum(steps[:-1] * lengths[:-1], out=phases[1:])
+        phases[1:] += phase
+        np.mod(phases, TWO_PI, out=phases)
+    return phases
+
+
+class RenderPlan:
+    """Sample layout of a song, computed once so any range can be rendered directly.
+
+    The melody is voice 0; each tone of the song's chords (one chord per
+    BAR_NOTES melody notes) is another voice, up to max_voices in all. Every
+    voice is a run of segments covering the whole song, each with its sample
+    offset, angular step, gain and starting phase; the phase carries on from
+    the previous segment so the sine stays continuous across boundaries. The
+    segments of all voices sit in flat arrays, voice after voice, so a block is
+    rendered for every voice at once as one (voices, frames) array. envelope
+    (see ENVELOPE) shapes each note through precomputed tables; None gives bare
+    sines.
+    """
+    def __init__(self, song, tempo=120, sample_rate=SAMPLE_RATE, reverse=False, phase=0.0, envelope=ENVELOPE,
+                 max_voices=MAX_VOICES):
+        self.sample_rate = sample_rate
+        self.tempo = tempo
+        if isinstance(song, CompactSong):
+            freqs, durations = song.frequencies(), song.duration.astype(np.float64)
+        else:
+            notes = song_notes(song)
+            freqs = np.fromiter((note_frequency(n) for n in notes), dtype=np.float64, count=len(notes))
+            durations = np.fromiter((n['duration'] for n in notes), dtype=np.float64, count=len(notes))
+        lengths = (sample_rate * durations * (120 / tempo)).astype(np.int64)
+        voices = [(freqs, lengths, np.ones(len(freqs)))]
+        chords = song_chords(song)[:(len(freqs) + BAR_NOTES - 1) // BAR_NOTES] if max_voices > 1 else []
+        if chords:
+            # Chord k lasts as long as melody notes k*BAR_NOTES onwards; bars past the last chord are silent
+            bars = np.add.reduceat(lengths, np.arange(0, len(lengths), BAR_NOTES))
+            tones = [chord_frequencies(chord) for chord in chords]
+            for j in range(min(max_voices - 1, max(map(len, tones)))):
+                f = np.zeros(len(bars))
+                f[:len(tones)] = [t[j] if j < len(t) else 0.0 for t in tones]
+                voices.append((f, bars, np.where(f > 0, CHORD_GAIN, 0.0)))
+        if reverse:
+            voices = [(f[::-1], n[::-1], g[::-1]) for f, n, g in voices]
+        # The melody's own layout, which the player uses to map positions between tempos
+        self.lengths = voices[0][1]
+        self.offsets = np.zeros(len(freqs) + 1, dtype=np.int64)
+        np.cumsum(self.lengths, out=self.offsets[1:])
+        self.total = int(self.offsets[-1])
+        self.steps = TWO_PI * voices[0][0] / sample_rate
+        # A plan that continues another one (the next bar of a stream) starts the melody at its end_phase
+        self.phases = _phases(self.steps, self.lengths, phase)
+        self.end_phase = float((self.phases[-1] + self.steps[-1] * self.lengths[-1]) % TWO_PI) if len(freqs) else phase
+        self.voices = len(voices)
+        self._starts = np.concatenate([np.cumsum(n) - n for _, n, _ in voices])
+        self._ends = self._starts + np.concatenate([n for _, n, _ in voices])
+        steps = [self.steps] + [TWO_PI * f / sample_rate for f, _, _ in voices[1:]]
+        phases = [self.phases] + [_phases(step, n, 0.0) for step, (_, n, _) in zip(steps[1:], voices[1:])]
+        # Per segment: starting phase and step in cycles rather than radians, and the gain
+        self._cycles = np.concatenate(phases) / TWO_PI
+        self._rates = np.concatenate(steps) / TWO_PI
+        self._gains = np.concatenate([g for _, _, g in voices]).astype(np.float32)
+        # Sorted search keys: voice v's segment starts shifted by v * (total + 1)
+        sizes = [len(n) for _, n, _ in voices]
+        self._keys = self._starts + np.repeat(np.arange(self.voices) * (self.total + 1), sizes)
+        self.envelope = envelope_tables(sample_rate, envelope) if envelope is not None else None
+
+    def __len__(self):
+        return self.total
+
+    def render(self, start=0, stop=None, out=None, volume=1.0):
+        """Render samples [start, stop) of all voices mixed into out (allocated when not given)."""
+        stop = self.total if stop is None else min(stop, self.total)
+        start = min(start, stop)
+        if out is None:
+            out = np.empty(stop - start, dtype=np.float32)
+        n = stop - start
+        if n == 0:
+            return out
+        # Only the segments overlapping the range are looked up, voice by voice with one search;
+        # each is expanded to its clipped length, which gives every voice exactly n samples
+        base = np.arange(self.voices) * (self.total + 1)
+        first, last = np.searchsorted(self._keys, np.concatenate([base + start, base + stop - 1]), side='right').reshape(2, -1) - 1
+        segments = np.concatenate([np.arange(f, l + 1) for f, l in zip(first.tolist(), last.tolist())])
+        counts = np.clip(self._ends[segments], start, stop) - np.clip(self._starts[segments], start, stop)
+
+        def expand(values):
+            return np.repeat(values[segments], counts).reshape(self.voices, n)
+
+        idx = np.arange(start, stop, dtype=np.int64)
+        t = idx - expand(self._starts)
+        # Phase in cycles, wrapped to [-0.5, 0.5] in float64 so the float32 sine
+        # (several times faster than float64's) loses no precision on long notes
+        cycles = expand(self._cycles)
+        cycles += expand(self._rates) * t
+        cycles -= np.rint(cycles)
+        wave = cycles.astype(np.float32)
+        wave *= TWO_PI
+        np.sin(wave, out=wave)
+        if self.envelope is not None:
+            head, tail = self.envelope
+            wave *= head.take(np.minimum(t, len(head) - 1, out=t))
+            left = expand(self._ends)
+            left -= idx + 1
+            wave *= tail.take(np.minimum(left, len(tail) - 1, out=left))
+        if self.voices > 1:
+            wave *= expand(self._gains)
+            np.sum(wave, axis=0, out=out[:n])
+        else:
+            np.copyto(out[:n], wave[0], casting='same_kind')
+        if volume != 1.0:
+            out[:n] *= volume
+        return out
+
+
+@timed
+def render_song(song, tempo=120, volume=0.2, sample_rate=SAMPLE_RATE, reverse=False, block=1 << 14):
+    """Render a whole song into a single preallocated float32 buffer."""
+    plan = RenderPlan(song, tempo, sample_rate, reverse)
+    wave = np.empty(plan.total, dtype=np.float32)
+    for start in range(0, plan.total, block):
+        stop = min(start + block, plan.total)
+        plan.render(start, stop, wave[start:stop], volume)
+    return wave
@@ -0,0 +1,42 @@
+# Signal reduction for the live scope: min/max envelopes and a windowed FFT spectrum
+import numpy as np
+from audio.render import SAMPLE_RATE
+
+
+def column_starts(n, width):
+    """Index of the first of n items in each of min(width, n) near-equal consecutive groups."""
+    columns = min(width, n)
+    return np.arange(columns) * n // columns
+
+
+def minmax_envelope(samples, width):
+    """Reduce samples to (mins, maxs) of one column each, at most width columns wide.
+
+    All samples are split into near-equal consecutive groups, one per column,
+    so peaks survive the decimation and none are dropped.
+    """
+    if not len(samples):
+        return samples[:0], samples[:0]
+    starts = column_starts(len(samples), width)
+    return np.minimum.reduceat(samples, starts), np.maximum.reduceat(samples, starts)
+
+
+class Spectrum:
+    """Magnitude spectrum in dB of the last size samples, reusing one precomputed window."""
+    _windows = {}  # size -> Hann window, shared by all instances
+
+    def __init__(self, size=2048, sample_rate=SAMPLE_RATE, floor_db=-100.0):
+        self.size = size
+        self.floor_db = floor_db
+        window = self._windows.get(size)
+        if window is None:
+            window = self._windows[size] = np.hanning(size).astype(np.float32)
+        self.window = window
+        self.scale = 2 / window.sum()  # a full-scale sine reads 0 dB
+        self.freqs = np.fft.rfftfreq(size, 1 / sample_rate)
+        self._frame = np.empty(size, dtype=np.float32)
+
+    def __call__(self, samples):
+        np.multiply(samples[-self.size:], self.window, out=self._frame)
+        magnitude = np.abs(np.fft.rfft(self._frame)) * self.scale
+        return np.maximum(20 * np.log10(np.maximum(magnitude, 1e-12)), self.floor_db)
@@ -0,0 +1,145 @@
+# Offline SoundFont rendering: no audio driver, samples are pulled from FluidSynth as fast as it can make them
+import os
+import threading
+import wave
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from audio.render import SAMPLE_RATE
+from core.song import as_compact
+from smf import VELOCITIES
+from metrics import timed
+
+BLOCK = 4096         # most frames pulled from the synth per get_samples call
+RELEASE = 1.0        # seconds rendered after the last note-off so releases can ring out
+GAIN = 0.2
+ALL_SOUND_OFF = 120  # MIDI controller number
+
+
+class PooledSynth:
+    """A driverless fluidsynth.Synth with one SoundFont loaded and a program selected on channel 0."""
+    def __init__(self, path, program=0, bank=0, sample_rate=SAMPLE_RATE, gain=GAIN):
+        import fluidsynth  # optional backend, loaded on first use
+        self.path = path
+        self.program = program
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()  # one render at a time per synth
+        self.synth = fluidsynth.Synth(gain=gain, samplerate=sample_rate)
+        self.sfid = self.synth.sfload(path)
+        self.synth.program_select(0, self.sfid, bank, program)
+
+    def reset(self):
+        self.synth.cc(0, ALL_SOUND_OFF, 0)
+
+    def delete(self):
+        self.synth.delete()
+
+
+class SynthPool:
+    """Synths keyed by (SoundFont path, program), so each .sf2 is loaded once per program."""
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self._synths = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, program=0):
+        key = (os.path.abspath(path), program)
+        with self._lock:
+            synth = self._synths.get(key)
+            if synth is None:
+                synth = self._synths[key] = PooledSynth(key[0], program, sample_rate=self.sample_rate)
+            return synth
+
+    def close(self):
+        with self._lock:
+            for synth in self._synths.values():
+                synth.delete()
+            self._synths.clear()
+
+    def __len__(self):
+        return len(self._synths)
+
+
+# One pool per process; batch workers each fill their own
+pool = SynthPool()
+
+
+def _events(song, tempo, sample_rate):
+    """Sorted (frame, is_on, pitch, velocity) arrays; note-offs come first at equal frames."""
+    song = as_compact(song)
+    scale = sample_rate * 120 / tempo  # same timing as audio.render: duration 1 lasts 1 s at 120
+    start = np.rint(song.onset.astype(np.float64) * scale).astype(np.int64)
+    end = start + np.rint(song.duration.astype(np.float64) * scale).astype(np.int64)
+    pitch = song.pitch.astype(np.int64)
+    frames = np.concatenate([end, start])
+    is_on = np.repeat([0, 1], len(song))
+    order = np.lexsort((is_on, frames))
+    velocity = np.concatenate([np.zeros(len(song), dtype=np.int64), VELOCITIES[song.dynamic]])
+    return frames[order], is_on[order], np.concatenate([pitch, pitch])[order], velocity[order]
+
+
+def render_blocks(synth, song, tempo=120, block=BLOCK):
+    """Yield interleaved stereo int16 blocks of a song rendered on a PooledSynth, including the release tail."""
+    fs = synth.synth
+    frames, is_on, pitches, velocities = _events(song, tempo, synth.sample_rate)
+    total = (int(frames[-1]) if len(frames) else 0) + int(RELEASE * synth.sample_rate)
+    with synth.lock:
+        synth.reset()
+        now = 0
+        for frame, on, pitch, velocity in zip(frames.tolist(), is_on.tolist(), pitches.tolist(), velocities.tolist()):
+            while now < frame:
+                n = min(block, frame - now)
+                yield fs.get_samples(n)
+                now += n
+            if on:
+                fs.noteon(0, pitch, velocity)
+            else:
+                fs.noteoff(0, pitch)
+        while now < total:
+            n = min(block, total - now)
+            yield fs.get_samples(n)
+            now += n
+        synth.reset()
+
+
+@timed
+def render_soundfont(song, soundfont_path, program=0, tempo=120):
+    """Render a song offline through a SoundFont; returns float32 stereo samples of shape (frames, 2)."""
+    synth = pool.get(soundfont_path, program)
+    blocks = [np.asarray(b, dtype=np.int16) for b in render_blocks(synth, song, tempo)]
+    if not blocks:
+        return np.zeros((0, 2), dtype=np.float32)
+    out = np.concatenate(blocks).astype(np.float32)
+    out *= 1 / 32768
+    return out.reshape(-1, 2)
+
+
+@timed
+def render_soundfont_wav(song, filename, soundfont_path, program=0, tempo=120):
+    """Render a song offline straight into a 16-bit stereo WAV file, block by block."""
+    synth = pool.get(soundfont_path, program)
+    with wave.open(filename, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(synth.sample_rate)
+        for b in render_blocks(synth, song, tempo):
+            f.writeframes(np.asarray(b, dtype='<i2').tobytes())
+    return filename
+
+
+def _render_job(args):
+    song, filename, soundfont_path, program, tempo = args
+    if filename is None:
+        return render_soundfont(song, soundfont_path, program, tempo)
+    return render_soundfont_wav(song, filename, soundfont_path, program, tempo)
+
+
+def render_batch(songs, soundfont_path, filenames=None, program=0, tempo=120, workers=None):
+    """Render many songs in parallel worker processes, each with its own synth pool.
+
+    Returns the rendered arrays, or the filenames written when filenames are given.
+    """
+    songs = [as_compact(song) for song in songs]
+    filenames = filenames or [None] * len(songs)
+    jobs = [(song, filename, soundfont_path, program, tempo) for song, filename in zip(songs, filenames)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_render_job, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count())))))
@@ -0,0 +1,92 @@
+# Polyphonic voice engine for the virtual keyboard, rendered inside the audio callback
+from collections import deque
+import numpy as np
+from theory import PITCH_INDEX, PITCH_FREQS, KEYBOARD_LOW, KEYBOARD_HIGH
+from audio.render import SAMPLE_RATE, TWO_PI
+
+NOTE_ON = 1
+NOTE_OFF = 0
+
+
+# Voices are keyed by MIDI number; names resolve through the theory pitch registry
+def key_number(name):
+    """MIDI number of a piano key name ("A0" .. "C8", sharps or flats), or None."""
+    key = PITCH_INDEX.get(name)
+    return key if key is not None and KEYBOARD_LOW <= key <= KEYBOARD_HIGH else None
+
+
+class VoiceEngine:
+    """Mixes keyboard voices block by block.
+
+    The UI thread only appends (event, key) tuples to a deque, which is safe
+    without a lock; the audio callback drains it at the start of every block.
+    All sounding voices are rendered together as one (voices, frames) array.
+    """
+    def __init__(self, sample_rate=SAMPLE_RATE, max_voices=16, amplitude=0.2, attack=0.005, release=0.08):
+        self.sample_rate = sample_rate
+        self.max_voices = max_voices
+        self.amplitude = amplitude
+        self._attack_rate = 1.0 / max(attack * sample_rate, 1)
+        self._release_rate = 1.0 / max(release * sample_rate, 1)
+        self._events = deque()
+        self._key = np.full(max_voices, -1, dtype=np.int64)
+        self._step = np.zeros(max_voices)
+        self._phase = np.zeros(max_voices)
+        self._level = np.zeros(max_voices)
+        self._rate = np.zeros(max_voices)    # envelope slope per sample, negative while releasing
+        self._age = np.zeros(max_voices, dtype=np.int64)
+        self._clock = 0
+
+    def note_on(self, name):
+        """Queue a key press; returns False for names that are not on the keyboard."""
+        key = key_number(name)
+        if key is None:
+            return False
+        self._events.append((NOTE_ON, key))
+        return True
+
+    def note_off(self, name):
+        key = key_number(name)
+        if key is not None:
+            self._events.append((NOTE_OFF, key))
+
+    def all_notes_off(self):
+        for key in self._key[self._key >= 0]:
+            self._events.append((NOTE_OFF, int(key)))
+
+    def _handle(self, event, key):
+        held = np.flatnonzero(self._key == key)
+        if event == NOTE_OFF:
+            self._rate[held] = -self._release_rate
+            return
+        if len(held):
+            slot = held[0]
+        else:
+            free = np.flatnonzero(self._key < 0)
+            # Steal the oldest voice when every slot is busy
+            slot = free[0] if len(free) else int(np.argmin(self._age))
+            self._phase[slot] = 0.0
+            self._level[slot] = 0.0
+        self._clock += 1
+        self._key[slot] = key
+        self._step[slot] = TWO_PI * PITCH_FREQS[key] / self.sample_rate
+        self._rate[slot] = self._attack_rate
+        self._age[slot] = self._clock
+
+    def render(self, out):
+        """Add the sounding voices into out (a float32 block)."""
+        while self._events:
+            self._handle(*self._events.popleft())
+        active = np.flatnonzero(self._key >= 0)
+        if not len(active):
+            return out
+        frames = len(out)
+        t = np.arange(frames)
+        phase = self._phase[active, None] + self._step[active, None] * t
+        env = np.clip(self._level[active, None] + self._rate[active, None] * (t + 1), 0.0, 1.0)
+        out += self.amplitude * (env * np.sin(phase)).sum(axis=0)
+        self._phase[active] = np.mod(self._phase[active] + self._step[active] * frames, TWO_PI)
+        self._level[active] = env[:, -1]
+        done = active[(self._rate[active] < 0) & (env[:, -1] <= 0.0)]
+        self._key[done] = -1
+        return out
@@ -0,0 +1,55 @@
+# Insert throughput: per-call connections (the old db.py) vs. the pooled WAL connection and save_songs.
+# Run from the project root: python -m benchmarks.bench_db
+import os
+import sqlite3
+import tempfile
+import time
+import db
+
+ROW = ('Bench', 'C', 'major', 'treble', "[{'note': 'C', 'duration': 1}]", 'Oh love, you make me sky')
+
+
+def legacy_save_song(path, title, key, scale, clef, notes, lyrics):
+    """db.save_song before connection pooling: connect, insert, commit, close."""
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute('''INSERT INTO songs (title, key, scale, clef, notes, lyrics) VALUES (?, ?, ?, ?, ?, ?)''',
+              (title, key, scale, clef, notes, lyrics))
+    conn.commit()
+    conn.close()
+
+
+def fresh_db(directory, name):
+    db.close_connection()
+    db.DB_NAME = os.path.join(directory, name)
+    db.init_db()
+    return db.DB_NAME
+
+
+def rate(fn, rows):
+    start = time.perf_counter()
+    fn()
+    return rows / (time.perf_counter() - start)
+
+
+def main(rows=2000, bulk_rows=100000):
+    saved_name = db.DB_NAME
+    with tempfile.TemporaryDirectory() as tmp:
+        path = fresh_db(tmp, 'legacy.db')
+        db.close_connection()
+        # The old code never enabled WAL, so run it against a rollback-journal file
+        sqlite3.connect(path).execute('PRAGMA journal_mode=DELETE').fetchall()
+        legacy = rate(lambda: [legacy_save_song(path, *ROW) for _ in range(rows)], rows)
+        fresh_db(tmp, 'pooled.db')
+        pooled = rate(lambda: [db.save_song(*ROW) for _ in range(rows)], rows)
+        fresh_db(tmp, 'bulk.db')
+        bulk = rate(lambda: db.save_songs(ROW for _ in range(bulk_rows)), bulk_rows)
+        db.close_connection()
+    db.DB_NAME = saved_name
+    print(f"{'per-call connect (old)':<26} {legacy:>12,.0f} rows/s")
+    print(f"{'pooled save_song':<26} {pooled:>12,.0f} rows/s")
+    print(f"{'save_songs (executemany)':<26} {bulk:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# MIDI export: mido message objects (the old export_midi) vs. the array-based SMF writer and the batch API.
+# Run from the project root: python -m benchmarks.bench_midi
+import os
+import tempfile
+import time
+import mido
+from mido import MidiFile, MidiTrack, Message
+from music import generate_songs, export_midi, export_midi_batch
+from smf import encode_smf
+from theory import NOTES
+
+
+def mido_export(song, filename):
+    """export_midi before the SMF writer."""
+    mid = MidiFile()
+    track = MidiTrack()
+    mid.tracks.append(track)
+    track.append(mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(120)))
+    for note in song['notes']:
+        midi_note = 60 + NOTES.index(note['note'])
+        duration = int(480 * note['duration'])
+        track.append(Message('note_on', note=midi_note, velocity=64, time=0))
+        track.append(Message('note_off', note=midi_note, velocity=64, time=duration))
+    mid.save(filename)
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main(count=500, length=64):
+    songs = generate_songs(count, 'Bench', 'C', 'major', length, with_lyrics=False, seed=0)
+    compact = generate_songs(count, 'Bench', 'C', 'major', length, with_lyrics=False, seed=0, compact=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        names = [os.path.join(tmp, f'{i}.mid') for i in range(count)]
+        results = [
+            ('mido (old export_midi)', timed(lambda: [mido_export(s, n) for s, n in zip(songs, names)])),
+            ('export_midi, dict songs', timed(lambda: [export_midi(s, n) for s, n in zip(songs, names)])),
+            ('export_midi, CompactSong', timed(lambda: [export_midi(s, n) for s, n in zip(compact, names)])),
+            ('encode_smf only', timed(lambda: [encode_smf(s) for s in compact])),
+            ('export_midi_batch', timed(lambda: export_midi_batch(compact, names))),
+        ]
+    print(f"{count} songs x {length * 4} notes")
+    for name, seconds in results:
+        print(f"{name:<26} {seconds:>8.3f} s {count / seconds:>10,.0f} songs/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Render time vs. note count for the offline renderer and the old per-note concatenate loop.
+# Run from the project root: python -m benchmarks.bench_render
+import random
+import time
+import numpy as np
+from audio.render import render_song, SAMPLE_RATE
+
+NOTE_FREQS = [261.63, 293.66, 329.63, 349.23, 392.00, 440.00, 493.88]
+DURATIONS = [1, 0.5, 2, 0.25]
+
+
+def make_song(n_notes, seed=0):
+    rng = random.Random(seed)
+    return {'notes': [{'note': 'A', 'duration': rng.choice(DURATIONS), 'frequency': rng.choice(NOTE_FREQS)}
+                      for _ in range(n_notes)]}
+
+
+def concatenate_loop(song, tempo=120, volume=0.2):
+    """The per-note loop MusicGUI._play_notes used before the renderer."""
+    wave = np.array([])
+    for note in song['notes']:
+        duration = note['duration'] * (120 / tempo)
+        t = np.linspace(0, duration, int(SAMPLE_RATE * duration), False)
+        wave = np.concatenate((wave, volume * np.sin(2 * np.pi * note['frequency'] * t)))
+    return wave
+
+
+def best_of(fn, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes=(64, 128, 256, 512, 1024), legacy_limit=512):
+    print(f"{'notes':>6} {'render (s)':>11} {'us/note':>8} {'concat (s)':>11} {'us/note':>8}")
+    for n in sizes:
+        song = make_song(n)
+        fast = best_of(render_song, song)
+        line = f"{n:>6} {fast:>11.4f} {fast / n * 1e6:>8.1f}"
+        if n <= legacy_limit:
+            slow = best_of(concatenate_loop, song, repeat=1)
+            line += f" {slow:>11.4f} {slow / n * 1e6:>8.1f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# Import time of the entry points, each measured in a fresh interpreter, against an enforceable budget.
+# Run from the project root: python -m benchmarks.bench_startup [--runs N] [--budget api=0.8 ...]
+# Exits with status 1 when a module is over budget or imports one of the optional backends.
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Seconds, compared with the median over --runs fresh interpreters
+BUDGETS = {'theory': 0.25, 'music': 0.3, 'db': 0.3, 'api': 1.0}
+
+# Backends that must only load on first use
+LAZY_MODULES = ('fluidsynth', 'mido', 'sounddevice', 'soundfile', 'smf', 'matplotlib', 'tkinter')
+
+PROBE = '''import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(' '.join(m for m in {lazy!r} if m in sys.modules))
+'''
+
+
+def measure(module, runs):
+    """Median import time of module and the lazy backends it pulled in; raises ImportError if the import fails."""
+    times = []
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, '-c', PROBE.format(module=module, lazy=LAZY_MODULES)],
+                              capture_output=True, text=True)
+        if proc.returncode:
+            raise ImportError(proc.stderr.strip().splitlines()[-1])
+        out = proc.stdout.splitlines()
+        times.append(float(out[0]))
+    loaded = out[1].split() if len(out) > 1 else []
+    return statistics.median(times), loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', nargs='*', default=[], metavar='MODULE=SECONDS',
+                        help='override or add a budget')
+    args = parser.parse_args(argv)
+    budgets = dict(BUDGETS)
+    for item in args.budget:
+        module, seconds = item.split('=')
+        budgets[module] = float(seconds)
+    failed = False
+    for module, budget in budgets.items():
+        try:
+            seconds, loaded = measure(module, args.runs)
+        except ImportError as e:
+            print(f"{'import ' + module:<16} FAIL  {e}")
+            failed = True
+            continue
+        ok = seconds <= budget and not loaded
+        failed |= not ok
+        extra = f"  loaded {', '.join(loaded)}" if loaded else ''
+        print(f"{'import ' + module:<16} {seconds * 1000:>8.1f} ms  budget {budget * 1000:>6.0f} ms  "
+              f"{'ok' if ok else 'FAIL'}{extra}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
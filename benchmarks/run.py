@@ -0,0 +1,148 @@
+# Runs the benchmarks in benchmarks/suite.py, saves the results as JSON and compares them with a baseline.
+# Run from the project root: python -m benchmarks.run [--filter NAME] [--save-baseline] [--threshold 1.25]
+# Exits with status 1 when any benchmark is slower than threshold x its baseline time.
+import argparse
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import numpy as np
+from benchmarks import suite
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+RESULTS = os.path.join(HERE, 'results.json')
+BASELINE = os.path.join(HERE, 'baseline.json')
+REPEAT = 5
+THRESHOLD = 1.25  # fail when a benchmark takes 25% longer than its baseline
+SAMPLE_TIME = 0.05  # fast benchmarks are looped until one sample takes about this long
+
+
+def discover(pattern=None):
+    """(name, class, method name, param) for every time_* method of every Time* class in the suite."""
+    found = []
+    for cls_name, cls in inspect.getmembers(suite, inspect.isclass):
+        if not cls_name.startswith('Time') or cls.__module__ != suite.__name__:
+            continue
+        params = getattr(cls, 'params', [None])
+        for method in sorted(m for m in vars(cls) if m.startswith('time_')):
+            for param in params:
+                name = f"{cls_name}.{method}" + (f"({param})" if param is not None else '')
+                if pattern is None or pattern in name:
+                    found.append((name, cls, method, param))
+    return found
+
+
+def run_one(cls, method, param, repeat):
+    """Best and median time per call over repeat samples.
+
+    Calls shorter than SAMPLE_TIME are repeated number times per sample so
+    timer resolution and noise do not dominate, as timeit's autorange does.
+    setup/teardown run once around the whole group, or around every sample
+    when the class sets number (as asv does), for benchmarks that change the
+    state they measure.
+    """
+    bench = cls()
+    args = () if param is None else (param,)
+    per_sample = hasattr(bench, 'number')
+
+    def setup():
+        if hasattr(bench, 'setup'):
+            bench.setup(*args)
+
+    def teardown():
+        if hasattr(bench, 'teardown'):
+            bench.teardown(*args)
+
+    def sample(number):
+        if per_sample:
+            setup()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                fn(*args)
+            return (time.perf_counter() - start) / number
+        finally:
+            if per_sample:
+                teardown()
+
+    fn = getattr(bench, method)
+    if not per_sample:
+        setup()
+    try:
+        number = bench.number if per_sample else max(1, int(SAMPLE_TIME / max(sample(1), 1e-9)))
+        times = [sample(number) for _ in range(getattr(bench, 'repeat', repeat))]
+    finally:
+        if not per_sample:
+            teardown()
+    return {'min': min(times), 'median': float(np.median(times)), 'repeat': len(times), 'number': number}
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=HERE).stdout.strip()
+    except OSError:
+        commit = ''
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'machine': platform.machine(),
+            'system': platform.system(), 'cpus': os.cpu_count(), 'commit': commit,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results, baseline, threshold):
+    """Names of benchmarks whose best time exceeds threshold x the baseline's."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        ratio = result['min'] / base['min']
+        result['ratio'] = ratio
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--output', default=RESULTS)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    parser.add_argument('--save-baseline', action='store_true', help='also write the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+    results = {}
+    for name, cls, method, param in discover(args.filter):
+        results[name] = run_one(cls, method, param, args.repeat)
+    # A run that records the baseline is not judged against the old one
+    regressions = [] if args.save_baseline else compare(results, baseline, args.threshold)
+
+    print(f"{'benchmark':<48} {'min (ms)':>10} {'median (ms)':>12} {'vs baseline':>12}")
+    for name, result in results.items():
+        ratio = f"{result['ratio']:.2f}x" if 'ratio' in result else '-'
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f"{name:<48} {result['min'] * 1e3:>10.3f} {result['median'] * 1e3:>12.3f} {ratio:>12}{flag}")
+
+    report = {'machine': machine_info(), 'threshold': args.threshold, 'benchmarks': results}
+    paths = [args.output] + ([args.baseline] if args.save_baseline else [])
+    for path in paths:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+    if not baseline and not args.save_baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) slower than {args.threshold:.2f}x baseline")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
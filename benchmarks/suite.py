@@ -0,0 +1,120 @@
+# Benchmarks run by benchmarks.run, written asv-style: Time* classes with optional
+# params, setup(param) and teardown(param), and time_* methods timed per param.
+# All inputs come from fixed seeds so runs on the same machine are comparable.
+import os
+import random
+import tempfile
+import music
+import db
+from audio.render import render_song
+
+DB_ROWS = 10_000
+
+
+class TimeGenerate:
+    """generate_song / generate_any_song, the interactive (random module) path."""
+    params = [4, 16, 64]
+
+    def setup(self, length):
+        random.seed(0)
+
+    def time_generate_song(self, length):
+        music.generate_song('Bench', 'C', 'major', length)
+
+    def time_generate_any_song(self, length):
+        music.generate_any_song('Bench', 'C', 'major', length)
+
+    def time_generate_songs_batch(self, length):
+        music.generate_songs(100, 'Bench', 'C', 'major', length, seed=0)
+
+
+class TimeSynthesis:
+    """What MusicGUI._play_notes renders, without the GUI or an audio device."""
+    params = [16, 64]
+
+    def setup(self, length):
+        self.song = music.generate_song('Bench', 'C', 'major', length, seed=0)
+        self.arrangement = music.generate_any_song('Bench', 'C', 'major', length, seed=0)
+
+    def time_render_song(self, length):
+        render_song(self.song)
+
+    def time_render_arrangement(self, length):
+        """Melody and triads: four voices."""
+        render_song(self.arrangement)
+
+
+class TimeMidi:
+    params = [16, 64]
+
+    def setup(self, length):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'bench.mid')
+        self.song = music.generate_song('Bench', 'C', 'major', length, seed=0)
+        music.export_midi(self.song, self.path)
+
+    def teardown(self, length):
+        self.tmp.cleanup()
+
+    def time_export_midi(self, length):
+        music.export_midi(self.song, self.path)
+
+    def time_import_midi(self, length):
+        music.import_midi(self.path)
+
+
+class TimeDatabase:
+    """save_song and get_songs on a throwaway database of DB_ROWS rows.
+
+    save_song grows the table, so every sample gets a fresh database (number = 1).
+    """
+    repeat = 3
+    number = 1
+
+    def setup(self):
+        self.saved_name = db.DB_NAME
+        self.tmp = tempfile.TemporaryDirectory()
+        db.close_connection()
+        db.DB_NAME = os.path.join(self.tmp.name, 'bench.db')
+        db.init_db()
+        self.song = music.generate_song('Bench', 'C', 'major', 4, seed=0)
+        db.save_songs(('Bench', 'C', 'major', 'treble', self.song, self.song['lyrics']) for _ in range(DB_ROWS))
+
+    def teardown(self):
+        db.close_connection()
+        db.DB_NAME = self.saved_name
+        self.tmp.cleanup()
+
+    def time_save_song_10k(self):
+        for _ in range(DB_ROWS):
+            db.save_song('Bench', 'C', 'major', 'treble', self.song, self.song['lyrics'])
+
+    def time_get_songs(self):
+        db.get_songs()
+
+
+class TimeApi:
+    """/generate throughput through the FastAPI test client (process pool included)."""
+    requests = 200
+    repeat = 3
+
+    def setup(self):
+        from fastapi.testclient import TestClient
+        import api
+        self.client = TestClient(api.app)
+        self.client.__enter__()
+        self.client.get('/generate', params={'length': 4})  # start the worker pool
+        self.seed = 1 << 20  # clear of the seed time_generate_cached uses
+
+    def teardown(self):
+        self.client.__exit__(None, None, None)
+
+    def time_generate_requests(self):
+        # Seeds keep counting across repeats, so no request is served from the cache
+        for seed in range(self.seed, self.seed + self.requests):
+            self.client.get('/generate', params={'length': 4, 'seed': seed})
+        self.seed += self.requests
+
+    def time_generate_cached(self):
+        for _ in range(self.requests):
+            self.client.get('/generate', params={'length': 4, 'seed': 0})
@@ -0,0 +1,137 @@
+# Response cache for deterministic (seeded) generation requests
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(**params):
+    """Stable hex digest of request parameters; equal parameters give equal keys."""
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """SQLite-backed cache tier that evicts least recently used entries past max_bytes."""
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS cache (
+            key TEXT PRIMARY KEY,
+            body BLOB,
+            size INTEGER,
+            accessed REAL
+        )''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        self._conn.commit()
+        self.size = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM cache').fetchone()[0]
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT body FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE cache SET accessed = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+            return bytes(row[0])
+
+    def put(self, key, body):
+        with self._lock:
+            old = self._conn.execute('SELECT size FROM cache WHERE key = ?', (key,)).fetchone()
+            self._conn.execute('INSERT OR REPLACE INTO cache (key, body, size, accessed) VALUES (?, ?, ?, ?)',
+                               (key, body, len(body), time.time()))
+            self.size += len(body) - (old[0] if old else 0)
+            if self.size > self.max_bytes:
+                victims = []
+                for victim, size in self._conn.execute('SELECT key, size FROM cache WHERE key != ? ORDER BY accessed', (key,)):
+                    if self.size <= self.max_bytes:
+                        break
+                    victims.append((victim,))
+                    self.size -= size
+                self._conn.executemany('DELETE FROM cache WHERE key = ?', victims)
+                self.evictions += len(victims)
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+class ResponseCache:
+    """Bounded in-process LRU of response bodies with an optional DiskCache behind it.
+
+    get() only looks at memory so it is safe to call from the event loop;
+    get_disk() and put() may touch SQLite and belong in a worker thread when a
+    disk tier is configured.
+    """
+    def __init__(self, maxsize=1024, disk_path=None, disk_max_bytes=64 * 1024 * 1024):
+        self.maxsize = maxsize
+        self.disk = DiskCache(disk_path, disk_max_bytes) if disk_path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self.evictions = 0
+        self.not_modified = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def get_disk(self, key):
+        if self.disk is None:
+            return None
+        body = self.disk.get(key)
+        if body is None:
+            self.disk_misses += 1
+            return None
+        self.disk_hits += 1
+        self._remember(key, body)
+        return body
+
+    def put(self, key, body):
+        self._remember(key, body)
+        if self.disk is not None:
+            self.disk.put(key, body)
+
+    def _remember(self, key, body):
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        stats = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'not_modified': self.not_modified,
+            'entries': len(self._entries),
+        }
+        if self.disk is not None:
+            stats.update({
+                'disk_hits': self.disk_hits,
+                'disk_misses': self.disk_misses,
+                'disk_evictions': self.disk.evictions,
+                'disk_bytes': self.disk.size,
+            })
+        return stats
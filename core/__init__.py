@@ -1,3 +1,4 @@
 # Core music theory, types, and logic
 from .theory import *
 from .multitrack import *
+from .song import *
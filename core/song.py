@@ -0,0 +1,264 @@
+# Compact struct-of-arrays song representation
+import math
+import struct
+import numpy as np
+from theory import NOTES, NOTE_TO_INT, DURATION_NAMES, DYNAMICS, CLEFS, NOTE_FREQS, transpose_pitches, invert_pitches, intervals
+
+__all__ = ['CompactSong', 'NoteView', 'song_notes', 'song_chords', 'as_compact', 'DYNAMIC_CODES', 'CLEF_CODES']
+
+DYNAMIC_CODES = {d: i for i, d in enumerate(DYNAMICS)}
+CLEF_CODES = {c: i for i, c in enumerate(CLEFS)}
+DEFAULT_DYNAMIC = DYNAMIC_CODES['mf']
+
+# Keys each note dict carries, per song layout
+NOTE_FIELDS = ('note', 'duration', 'duration_name', 'dynamic', 'clef', 'frequency')  # generate_song
+MELODY_FIELDS = ('note', 'duration', 'clef')                                        # generate_any_song
+LAYOUT_FIELDS = {'notes': NOTE_FIELDS, 'melody': MELODY_FIELDS}
+LAYOUTS = list(LAYOUT_FIELDS)
+
+# Binary note format: header, then pitch/dynamic/clef bytes, float32 durations
+# and, only when they are not the running sum of durations, float32 onsets.
+MAGIC = b'SONG'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBBxfI')  # magic, version, layout, flags, tempo (BPM), note count
+FLAG_ONSETS = 1
+
+# Frequency of every MIDI pitch, scaled by octave from the rounded 4th-octave NOTE_FREQS
+# table. generate_song stores those rounded values in its note dicts (261.63 for C4),
+# so NoteView and to_dict reproduce them exactly; theory.PITCH_FREQS is exact equal
+# temperament and differs in the last decimals.
+NOTE_TABLE_FREQS = np.array([NOTE_FREQS[NOTES[m % 12]] * 2.0 ** (m // 12 - 5) for m in range(128)])
+
+
+def song_notes(song):
+    """Return the notes of a song dict or CompactSong as a sequence of note mappings."""
+    if isinstance(song, CompactSong):
+        return song
+    return song['notes'] if 'notes' in song else song.get('melody', [])
+
+
+def song_chords(song):
+    """Return the chords ({'root', 'chord'} dicts, one per bar) of a song, or of one music.iter_bars bar."""
+    if isinstance(song, CompactSong):
+        return song.chords or []
+    if 'chord' in song:
+        return [song['chord']]
+    return song.get('chords') or []
+
+
+def _number(x):
+    """Durations come back as ints when whole, as in DURATIONS."""
+    x = float(x)
+    return int(x) if x.is_integer() else x
+
+
+class NoteView:
+    """Read-only view of one note of a CompactSong; supports note['key'] like the dict format."""
+    __slots__ = ('_song', '_i')
+
+    def __init__(self, song, i):
+        self._song = song
+        self._i = i
+
+    @property
+    def midi(self):
+        return int(self._song.pitch[self._i])
+
+    @property
+    def note(self):
+        return NOTES[self.midi % 12]
+
+    @property
+    def octave(self):
+        return self.midi // 12 - 1
+
+    @property
+    def duration(self):
+        return _number(self._song.duration[self._i])
+
+    @property
+    def duration_name(self):
+        return DURATION_NAMES.get(self.duration)
+
+    @property
+    def dynamic(self):
+        return DYNAMICS[self._song.dynamic[self._i]]
+
+    @property
+    def clef(self):
+        return CLEFS[self._song.clef[self._i]]
+
+    @property
+    def frequency(self):
+        return float(NOTE_TABLE_FREQS[self.midi])
+
+    @property
+    def onset(self):
+        return float(self._song.onset[self._i])
+
+    def __getitem__(self, key):
+        if key not in self._song.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self._song.fields
+
+    def get(self, key, default=None):
+        return self[key] if key in self._song.fields else default
+
+    def keys(self):
+        return self._song.fields
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self._song.fields}
+
+    def __repr__(self):
+        return f"{self.note}{self.octave}({self.duration}, {self.dynamic})"
+
+
+class CompactSong:
+    """A song stored as parallel arrays, one element per note.
+
+    pitch is the MIDI number (int8), duration is in quarter notes (float32),
+    dynamic and clef are indexes into DYNAMICS and CLEFS (uint8) and onset is
+    the start of each note in quarter notes. layout records which dict format
+    the song converts back to ('notes' for generate_song, 'melody' for
+    generate_any_song).
+    """
+    __slots__ = ('pitch', 'duration', 'dynamic', 'clef', 'onset', 'lyrics', 'chords', 'layout', 'tempo')
+
+    def __init__(self, pitch, duration, dynamic=None, clef=None, onset=None, lyrics='', chords=None, layout='notes', tempo=120):
+        self.pitch = np.asarray(pitch, dtype=np.int8)
+        self.duration = np.asarray(duration, dtype=np.float32)
+        n = len(self.pitch)
+        self.dynamic = np.full(n, DEFAULT_DYNAMIC, dtype=np.uint8) if dynamic is None else np.asarray(dynamic, dtype=np.uint8)
+        self.clef = np.zeros(n, dtype=np.uint8) if clef is None else np.asarray(clef, dtype=np.uint8)
+        if onset is None:
+            onset = np.zeros(n, dtype=np.float32)
+            np.cumsum(self.duration[:-1], out=onset[1:])
+        self.onset = np.asarray(onset, dtype=np.float32)
+        self.lyrics = lyrics
+        self.chords = chords
+        self.layout = layout
+        self.tempo = tempo
+
+    @property
+    def fields(self):
+        return LAYOUT_FIELDS[self.layout]
+
+    def __len__(self):
+        return len(self.pitch)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return NoteView(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield NoteView(self, i)
+
+    def __repr__(self):
+        return f"CompactSong({len(self)} notes, {self.layout})"
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in ('pitch', 'duration', 'dynamic', 'clef', 'onset'))
+
+    def frequencies(self):
+        return NOTE_TABLE_FREQS[self.pitch]
+
+    def intervals(self):
+        return intervals(self.pitch.astype(np.int64))
+
+    def _with_pitch(self, pitch):
+        return CompactSong(np.clip(pitch, 0, 127), self.duration, self.dynamic, self.clef, self.onset,
+                           self.lyrics, self.chords, self.layout, self.tempo)
+
+    def transposed(self, semitones):
+        return self._with_pitch(transpose_pitches(self.pitch.astype(np.int64), semitones))
+
+    def inverted(self, axis=None):
+        """Melodic inversion around axis (a MIDI number; default the first note)."""
+        return self._with_pitch(invert_pitches(self.pitch.astype(np.int64), axis))
+
+    def retrograde(self):
+        """Notes in reverse order, each ending where it used to start counted from the song's end."""
+        ends = self.onset + self.duration
+        onset = (ends.max() if len(self) else 0) - ends
+        return CompactSong(self.pitch[::-1], self.duration[::-1], self.dynamic[::-1], self.clef[::-1],
+                           onset[::-1], self.lyrics, self.chords, self.layout, self.tempo)
+
+    def to_bytes(self):
+        """Pack the note arrays into the versioned binary format (lyrics and chords are not included)."""
+        default_onset = CompactSong(self.pitch, self.duration).onset
+        flags = 0 if np.array_equal(self.onset, default_onset) else FLAG_ONSETS
+        parts = [HEADER.pack(MAGIC, FORMAT_VERSION, LAYOUTS.index(self.layout), flags, self.tempo, len(self)),
+                 self.pitch.tobytes(), self.dynamic.tobytes(), self.clef.tobytes(), self.duration.astype('<f4').tobytes()]
+        if flags & FLAG_ONSETS:
+            parts.append(self.onset.astype('<f4').tobytes())
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data, lyrics='', chords=None):
+        magic, version, layout, flags, tempo, n = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError("not a packed song")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"unsupported song format version {version}")
+        pos = HEADER.size
+        def take(dtype, size):
+            nonlocal pos
+            arr = np.frombuffer(data, dtype=dtype, count=n, offset=pos).copy()
+            pos += n * size
+            return arr
+        pitch, dynamic, clef, duration = take(np.int8, 1), take(np.uint8, 1), take(np.uint8, 1), take('<f4', 4)
+        onset = take('<f4', 4) if flags & FLAG_ONSETS else None
+        return cls(pitch, duration, dynamic, clef, onset, lyrics, chords, LAYOUTS[layout], tempo)
+
+    @classmethod
+    def from_dict(cls, song):
+        """Build from a generate_song / generate_any_song dict."""
+        layout = 'notes' if 'notes' in song else 'melody'
+        notes = song_notes(song)
+        pitch = np.empty(len(notes), dtype=np.int8)
+        for i, n in enumerate(notes):
+            octave = 4
+            if 'frequency' in n:
+                octave += round(math.log2(n['frequency'] / NOTE_FREQS[n['note']]))
+            pitch[i] = NOTE_TO_INT[n['note']] + 12 * (octave + 1)
+        return cls(
+            pitch,
+            [n['duration'] for n in notes],
+            [DYNAMIC_CODES[n.get('dynamic', 'mf')] for n in notes],
+            [CLEF_CODES[n.get('clef', 'treble')] for n in notes],
+            lyrics=song.get('lyrics', ''),
+            chords=song.get('chords'),
+            layout=layout,
+        )
+
+    def to_dict(self):
+        """Convert back to the dict format this song was built from."""
+        names = [NOTES[p % 12] for p in self.pitch.tolist()]
+        durations = [_number(d) for d in self.duration.tolist()]
+        if self.layout == 'melody':
+            clefs = [CLEFS[c] for c in self.clef.tolist()]
+            melody = [{'note': n, 'duration': d, 'clef': c} for n, d, c in zip(names, durations, clefs)]
+            return {'melody': melody, 'chords': self.chords or [], 'lyrics': self.lyrics}
+        notes = [{
+            'note': n,
+            'duration': d,
+            'duration_name': DURATION_NAMES.get(d),
+            'dynamic': DYNAMICS[y],
+            'clef': CLEFS[c],
+            'frequency': float(f),
+        } for n, d, y, c, f in zip(names, durations, self.dynamic.tolist(), self.clef.tolist(), self.frequencies().tolist())]
+        return {'notes': notes, 'lyrics': self.lyrics}
+
+
+def as_compact(song):
+    """Accept either format and return a CompactSong."""
+    return song if isinstance(song, CompactSong) else CompactSong.from_dict(song)
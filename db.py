@@ -1,11 +1,65 @@
+import ast
+import itertools
 import sqlite3
+import threading
+import numpy as np
+import dedup
+from core.song import CompactSong, as_compact
+from metrics import timed
 
 DB_NAME = 'songs.db'
+CHUNK_SIZE = 500  # rows per transaction in save_songs
+PAGE_SIZE = 100   # rows per page in get_songs_page / iter_songs
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS songs (
+# songs.notes_format: how the notes column is encoded
+NOTES_REPR = 0    # str() of a list of note dicts (rows written before schema version 1)
+NOTES_PACKED = 1  # CompactSong.to_bytes()
+
+LIST_COLUMNS = ('id', 'title', 'key', 'scale', 'clef', 'created_at')
+
+# Melody index: each song's notes are indexed as overlapping runs of GRAM_SIZE
+# semitone intervals, so a query matches in any key. Intervals are clipped to
+# +-MAX_INTERVAL and packed into one integer per n-gram, which melody_fts
+# stores as a word; FTS5 then provides the inverted index and BM25 ranking.
+GRAM_SIZE = 3
+MAX_INTERVAL = 24
+SEARCH_LIMIT = 20
+
+# Every thread reuses one connection per database file
+_local = threading.local()
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def get_connection():
+    """Return this thread's connection to DB_NAME, opening and tuning it on first use."""
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(DB_NAME)
+    if conn is None:
+        conn = sqlite3.connect(DB_NAME)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')    # safe with WAL, no fsync per commit
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-16000')     # 16 MB page cache
+        conn.execute('PRAGMA mmap_size=268435456')   # 256 MB
+        conn.execute('PRAGMA busy_timeout=5000')
+        conns[DB_NAME] = conn
+    if DB_NAME not in _schema_ready:
+        with _schema_lock:
+            if DB_NAME not in _schema_ready:
+                _create_schema(conn)
+                _schema_ready.add(DB_NAME)
+    return conn
+
+def close_connection():
+    """Close this thread's connection to DB_NAME, if it has one."""
+    conn = getattr(_local, 'conns', {}).pop(DB_NAME, None)
+    if conn is not None:
+        conn.close()
+
+def _create_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS songs (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         title TEXT,
         key TEXT,
@@ -15,20 +69,314 @@ def init_db():
         lyrics TEXT
     )''')
     conn.commit()
-    conn.close()
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for target, migrate in enumerate(MIGRATIONS[version:], start=version + 1):
+        conn.execute('BEGIN')  # DDL included, so a failed migration leaves nothing behind
+        with conn:
+            migrate(conn)
+            conn.execute(f'PRAGMA user_version = {target}')
 
-def save_song(title, key, scale, clef, notes, lyrics):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''INSERT INTO songs (title, key, scale, clef, notes, lyrics) VALUES (?, ?, ?, ?, ?, ?)''',
-              (title, key, scale, clef, notes, lyrics))
-    conn.commit()
-    conn.close()
-
-def get_songs():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('SELECT * FROM songs')
-    songs = c.fetchall()
-    conn.close()
-    return songs
+def _migrate_packed_notes(conn):
+    """v1: binary notes with a format column, created_at, and indexes for listing."""
+    conn.execute('ALTER TABLE songs ADD COLUMN notes_format INTEGER NOT NULL DEFAULT 0')
+    conn.execute('ALTER TABLE songs ADD COLUMN created_at TEXT')
+    conn.execute("UPDATE songs SET created_at = datetime('now')")
+    rows = conn.execute('SELECT id, notes FROM songs')
+    updates = []
+    for song_id, notes in rows:
+        try:
+            blob = encode_notes(notes)
+        except (ValueError, SyntaxError, KeyError, TypeError):
+            continue  # unreadable legacy row: left as NOTES_REPR
+        updates.append((blob, NOTES_PACKED, song_id))
+    conn.executemany('UPDATE songs SET notes = ?, notes_format = ? WHERE id = ?', updates)
+    for column in ('title', 'key', 'scale', 'created_at'):
+        conn.execute(f'CREATE INDEX IF NOT EXISTS songs_{column} ON songs ({column})')
+
+def _migrate_search(conn):
+    """v2: FTS5 indexes over title/lyrics and over melody n-grams, kept in sync with songs."""
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS songs_fts USING fts5(title, lyrics, content='songs', content_rowid='id')")
+    # The melody index holds one token per interval n-gram; its rows are written by save_song(s)
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS melody_fts USING fts5(grams)")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS songs_fts_insert AFTER INSERT ON songs BEGIN
+        INSERT INTO songs_fts (rowid, title, lyrics) VALUES (new.id, new.title, new.lyrics);
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS songs_fts_delete AFTER DELETE ON songs BEGIN
+        INSERT INTO songs_fts (songs_fts, rowid, title, lyrics) VALUES ('delete', old.id, old.title, old.lyrics);
+        DELETE FROM melody_fts WHERE rowid = old.id;
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS songs_fts_update AFTER UPDATE OF title, lyrics ON songs BEGIN
+        INSERT INTO songs_fts (songs_fts, rowid, title, lyrics) VALUES ('delete', old.id, old.title, old.lyrics);
+        INSERT INTO songs_fts (rowid, title, lyrics) VALUES (new.id, new.title, new.lyrics);
+    END""")
+    conn.execute("INSERT INTO songs_fts (songs_fts) VALUES ('rebuild')")
+    rows = []
+    for song_id, notes, notes_format in conn.execute('SELECT id, notes, notes_format FROM songs'):
+        try:
+            pitches = decode_notes(notes, notes_format).pitch
+        except (ValueError, SyntaxError, KeyError, TypeError):
+            continue
+        rows += _melody_rows(song_id, [pitches])
+    conn.executemany('INSERT INTO melody_fts (rowid, grams) VALUES (?, ?)', rows)
+
+def _migrate_minhash(conn):
+    """v3: MinHash signature per song and its LSH band keys, for near-duplicate checks (see dedup.py).
+
+    Band rows of deleted songs are left behind: ids are never reused
+    (AUTOINCREMENT) and lookups join songs, so they are simply skipped.
+    """
+    conn.execute('ALTER TABLE songs ADD COLUMN minhash BLOB')
+    conn.execute("""CREATE TABLE IF NOT EXISTS song_bands (
+        band INTEGER NOT NULL,
+        song_id INTEGER NOT NULL,
+        PRIMARY KEY (band, song_id)
+    ) WITHOUT ROWID""")
+    updates, bands = [], []
+    for song_id, notes, notes_format in conn.execute('SELECT id, notes, notes_format FROM songs').fetchall():
+        try:
+            song = decode_notes(notes, notes_format)
+        except (ValueError, SyntaxError, KeyError, TypeError):
+            continue
+        sigs, keys = _dedup_keys([song])
+        updates.append((dedup.to_blob(sigs[0]), song_id))
+        bands += [(band, song_id) for band in keys[0]]
+    conn.executemany('UPDATE songs SET minhash = ? WHERE id = ?', updates)
+    conn.executemany('INSERT INTO song_bands (band, song_id) VALUES (?, ?)', bands)
+
+MIGRATIONS = [_migrate_packed_notes, _migrate_search, _migrate_minhash]
+
+def _pack_grams(pitches, n):
+    """Packed interval n-gram of every window of n + 1 consecutive pitches."""
+    digits = np.clip(np.diff(pitches), -MAX_INTERVAL, MAX_INTERVAL) + MAX_INTERVAL
+    windows = np.lib.stride_tricks.sliding_window_view(digits, n)
+    return windows @ (2 * MAX_INTERVAL + 1) ** np.arange(n - 1, -1, -1, dtype=np.int64)
+
+def melody_ngrams(pitches, n=GRAM_SIZE):
+    """Packed interval n-grams of a melody, one per note after the first n, in order."""
+    pitches = np.asarray(pitches, dtype=np.int64)
+    if len(pitches) <= n:
+        return np.zeros(0, dtype=np.int64)
+    return _pack_grams(pitches, n)
+
+def _melody_rows(first_id, melodies, n=GRAM_SIZE):
+    """(song_id, n-gram tokens) rows of melody_fts for melodies saved with consecutive ids from first_id.
+
+    All melodies go through _pack_grams as one concatenated array; windows that
+    span two songs are dropped.
+    """
+    lengths = np.array([len(p) for p in melodies], dtype=np.int64)
+    if lengths.sum() <= n:
+        return []
+    grams = _pack_grams(np.concatenate(melodies).astype(np.int64), n)
+    owner = np.repeat(np.arange(len(melodies)), lengths)
+    grams = grams[owner[:-n] == owner[n:]].tolist()
+    bounds = np.concatenate([[0], np.cumsum(np.maximum(lengths - n, 0))]).tolist()
+    return [(first_id + i, ' '.join(map(str, grams[lo:hi]))) for i, (lo, hi) in enumerate(zip(bounds, bounds[1:])) if hi > lo]
+
+def _as_song(notes):
+    if isinstance(notes, str):
+        notes = ast.literal_eval(notes)  # never eval(): the text comes from the database
+    if isinstance(notes, list):
+        notes = {'notes': notes}
+    return as_compact(notes)
+
+def encode_notes(notes):
+    """Pack notes (CompactSong, song dict, list of note dicts or its str()) into a blob."""
+    return _as_song(notes).to_bytes()
+
+def decode_notes(notes, notes_format=NOTES_PACKED, lyrics=''):
+    """Inverse of encode_notes; legacy text rows are parsed safely."""
+    if notes_format == NOTES_PACKED:
+        return CompactSong.from_bytes(notes, lyrics)
+    return CompactSong.from_dict({'notes': ast.literal_eval(notes), 'lyrics': lyrics})
+
+def init_db():
+    get_connection()
+
+def _dedup_keys(songs):
+    """MinHash signature (None for songs too short to have one) and LSH band keys of each song."""
+    sigs = dedup.signatures(songs)
+    valid = [sig for sig in sigs if sig is not None]
+    bands = iter(dedup.band_hashes(valid).tolist() if valid else ())
+    return sigs, [next(bands) if sig is not None else [] for sig in sigs]
+
+def _similar(conn, sig, bands, threshold):
+    """(song_id, similarity) of saved songs sharing an LSH band with sig and at least threshold similar."""
+    if not bands:
+        return []
+    rows = conn.execute(f"""SELECT id, minhash FROM songs WHERE id IN
+                            (SELECT song_id FROM song_bands WHERE band IN ({', '.join('?' * len(bands))}))""", bands).fetchall()
+    rows = [(song_id, blob) for song_id, blob in rows if blob is not None]
+    if not rows:
+        return []
+    sims = dedup.similarity(sig, np.stack([dedup.from_blob(blob) for _, blob in rows])).tolist()
+    return sorted(((song_id, sim) for (song_id, _), sim in zip(rows, sims) if sim >= threshold), key=lambda r: -r[1])
+
+@timed
+def find_duplicates(notes, threshold=dedup.THRESHOLD):
+    """Saved songs whose estimated similarity to notes reaches threshold, as (song_id, similarity), closest first."""
+    sigs, bands = _dedup_keys([_as_song(notes)])
+    return [] if sigs[0] is None else _similar(get_connection(), sigs[0], bands[0], threshold)
+
+def _unique_rows(conn, sigs, bands, threshold):
+    """Indexes of the rows of a batch that are neither near-duplicates of saved songs nor of earlier rows."""
+    keep = []
+    pending = {}  # band key -> signatures of rows kept so far
+    for i, (sig, row_bands) in enumerate(zip(sigs, bands)):
+        if sig is not None:
+            if _similar(conn, sig, row_bands, threshold):
+                continue
+            near = [other for band in row_bands for other in pending.get(band, ())]
+            if near and (dedup.similarity(sig, np.stack(near)) >= threshold).any():
+                continue
+            for band in row_bands:
+                pending.setdefault(band, []).append(sig)
+        keep.append(i)
+    return keep
+
+@timed
+def save_song(title, key, scale, clef, notes, lyrics, duplicate_threshold=None):
+    """Insert a song and return its id.
+
+    With duplicate_threshold (0-1), a song at least that similar to a saved one
+    is not inserted and None is returned; the check and the insert happen in
+    one write transaction.
+    """
+    conn = get_connection()
+    song = _as_song(notes)
+    sigs, bands = _dedup_keys([song])
+    with conn:
+        if duplicate_threshold is not None:
+            conn.execute('BEGIN IMMEDIATE')
+            if sigs[0] is not None and _similar(conn, sigs[0], bands[0], duplicate_threshold):
+                return None
+        cur = conn.execute('''INSERT INTO songs (title, key, scale, clef, notes, lyrics, notes_format, created_at, minhash)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'), ?)''',
+                           (title, key, scale, clef, song.to_bytes(), lyrics, NOTES_PACKED, dedup.to_blob(sigs[0])))
+        conn.executemany('INSERT INTO melody_fts (rowid, grams) VALUES (?, ?)', _melody_rows(cur.lastrowid, [song.pitch]))
+        conn.executemany('INSERT INTO song_bands (band, song_id) VALUES (?, ?)', [(band, cur.lastrowid) for band in bands[0]])
+    return cur.lastrowid
+
+@timed
+def save_songs(batch, chunk_size=CHUNK_SIZE, duplicate_threshold=None):
+    """Insert (title, key, scale, clef, notes, lyrics) rows, committing every chunk_size rows.
+
+    Returns the number of rows saved. With duplicate_threshold, rows that are
+    near-duplicates of saved songs or of earlier rows in the batch are skipped.
+    """
+    conn = get_connection()
+    rows = iter(batch)
+    saved = 0
+    while True:
+        chunk = [(title, key, scale, clef, _as_song(notes), lyrics)
+                 for title, key, scale, clef, notes, lyrics in itertools.islice(rows, chunk_size)]
+        if not chunk:
+            return saved
+        sigs, bands = _dedup_keys([row[4] for row in chunk])
+        with conn:
+            if duplicate_threshold is not None:
+                conn.execute('BEGIN IMMEDIATE')
+                keep = _unique_rows(conn, sigs, bands, duplicate_threshold)
+                chunk, sigs, bands = [chunk[i] for i in keep], [sigs[i] for i in keep], [bands[i] for i in keep]
+                if not chunk:
+                    continue
+            conn.executemany('''INSERT INTO songs (title, key, scale, clef, notes, lyrics, notes_format, created_at, minhash)
+                                  VALUES (?, ?, ?, ?, ?, ?, ?, datetime('now'), ?)''',
+                             [(title, key, scale, clef, song.to_bytes(), lyrics, NOTES_PACKED, dedup.to_blob(sig))
+                              for (title, key, scale, clef, song, lyrics), sig in zip(chunk, sigs)])
+            # The transaction holds the write lock, so the chunk got consecutive ids ending at last_insert_rowid
+            first_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0] - len(chunk) + 1
+            conn.executemany('INSERT INTO melody_fts (rowid, grams) VALUES (?, ?)',
+                             _melody_rows(first_id, [row[4].pitch for row in chunk]))
+            conn.executemany('INSERT INTO song_bands (band, song_id) VALUES (?, ?)',
+                             [(band, first_id + i) for i, row_bands in enumerate(bands) for band in row_bands])
+        saved += len(chunk)
+
+@timed
+def get_songs(columns=LIST_COLUMNS, **filters):
+    """All matching rows as a list, read page by page through iter_songs; iterate iter_songs to stream them."""
+    return list(iter_songs(columns=columns, **filters))
+
+@timed
+def get_song(song_id):
+    """Return one song as a dict with its notes decoded to a CompactSong, or None."""
+    row = get_connection().execute(
+        'SELECT id, title, key, scale, clef, notes, lyrics, notes_format, created_at FROM songs WHERE id = ?',
+        (song_id,)).fetchone()
+    if row is None:
+        return None
+    song_id, title, key, scale, clef, notes, lyrics, notes_format, created_at = row
+    return {'id': song_id, 'title': title, 'key': key, 'scale': scale, 'clef': clef, 'created_at': created_at,
+            'song': decode_notes(notes, notes_format, lyrics)}
+
+def _filters(title, key, scale, since, until):
+    clauses, params = [], []
+    if title:
+        # Prefix match written as a range so the title index is used
+        clauses.append('title >= ? AND title < ?')
+        params += [title, title + '\uffff']
+    for column, value in (('key', key), ('scale', scale)):
+        if value is not None:
+            clauses.append(f'{column} = ?')
+            params.append(value)
+    if since is not None:
+        clauses.append('created_at >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('created_at < ?')
+        params.append(until)
+    return clauses, params
+
+@timed
+def get_songs_page(after_id=0, limit=PAGE_SIZE, title=None, key=None, scale=None, since=None, until=None, columns=LIST_COLUMNS):
+    """One page of songs with id > after_id, in id order.
+
+    Returns (rows, next_cursor); pass next_cursor as after_id for the next page
+    and stop when it is None. Lyrics and notes are only read when listed in
+    columns, so listing stays cheap.
+    """
+    if 'id' not in columns:
+        columns = ('id',) + tuple(columns)
+    clauses, params = _filters(title, key, scale, since, until)
+    clauses.insert(0, 'id > ?')
+    params.insert(0, after_id)
+    sql = f"SELECT {', '.join(columns)} FROM songs WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?"
+    rows = get_connection().execute(sql, params + [limit]).fetchall()
+    id_index = columns.index('id')
+    next_cursor = rows[-1][id_index] if len(rows) == limit else None
+    return rows, next_cursor
+
+def iter_songs(batch_size=PAGE_SIZE, **filters):
+    """Yield matching rows page by page, holding at most batch_size rows at a time."""
+    cursor = 0
+    while cursor is not None:
+        rows, cursor = get_songs_page(cursor, batch_size, **filters)
+        yield from rows
+
+def _fts_query(text, field=None):
+    """Match text as a phrase whose last word may be a prefix ("love in the sk" finds "love in the sky")."""
+    query = '"' + text.replace('"', '""') + '"*'
+    return f'{field} : {query}' if field else query
+
+@timed
+def search_songs(text, field=None, limit=SEARCH_LIMIT, columns=LIST_COLUMNS):
+    """Songs whose title or lyrics (or only field, 'title' or 'lyrics') contain text, best BM25 match first."""
+    if not text.strip():
+        return []
+    sql = (f"SELECT {', '.join('songs.' + c for c in columns)} FROM songs_fts JOIN songs ON songs.id = songs_fts.rowid "
+           "WHERE songs_fts MATCH ? ORDER BY rank LIMIT ?")
+    return get_connection().execute(sql, (_fts_query(text, field), limit)).fetchall()
+
+@timed
+def search_melody(pitches, limit=SEARCH_LIMIT):
+    """Rank songs by the interval n-grams they share with a query melody (MIDI numbers, any key).
+
+    Returns (song_id, title, score) rows, best first; score is FTS5's BM25, so
+    n-grams that few songs contain count for more than common stepwise runs.
+    """
+    grams = np.unique(melody_ngrams(pitches))
+    if not len(grams):
+        return []
+    sql = """SELECT songs.id, songs.title, -melody_fts.rank FROM melody_fts JOIN songs ON songs.id = melody_fts.rowid
+             WHERE melody_fts MATCH ? ORDER BY melody_fts.rank LIMIT ?"""
+    return get_connection().execute(sql, (' OR '.join(map(str, grams.tolist())), limit)).fetchall()
@@ -0,0 +1,185 @@
+# Near-duplicate detection: MinHash signatures over each melody's (interval, duration) shingles, banded for LSH
+# Usage: python dedup.py [--db songs.db] [--threshold 0.8] [--workers N]
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from core.song import as_compact
+
+NUM_PERM = 64
+BANDS, ROWS = 16, 4  # NUM_PERM = BANDS * ROWS; pairs above about (1/BANDS) ** (1/ROWS) = 0.5 become candidates
+SHINGLE = 3          # consecutive (interval, duration) steps per shingle
+THRESHOLD = 0.8      # estimated Jaccard similarity at which two melodies count as duplicates
+MAX_INTERVAL = 24
+DURATION_STEPS = 16  # durations are compared in sixty-fourth notes
+PAGE_ROWS = 5000     # rows per worker job in cluster()
+
+# Hash family h(x) = (a * x + b) mod PRIME. The seed is fixed: signatures are
+# stored in songs.db, so every process and every release must draw the same a, b.
+PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(0x6d696e68)
+PERM_A = _rng.integers(1, PRIME, NUM_PERM, dtype=np.int64)[:, None]
+PERM_B = _rng.integers(0, PRIME, NUM_PERM, dtype=np.int64)[:, None]
+FNV_OFFSET, FNV_PRIME = np.uint64(0xcbf29ce484222325), np.uint64(0x100000001b3)
+
+
+def _step_codes(pitch, duration):
+    """One code per step between consecutive notes: the interval and the next note's duration."""
+    steps = np.clip(np.diff(pitch.astype(np.int64)), -MAX_INTERVAL, MAX_INTERVAL) + MAX_INTERVAL
+    durations = np.clip(np.rint(duration[1:] * DURATION_STEPS), 0, 255).astype(np.int64)
+    return steps * 256 + durations
+
+
+def _pack(codes, k):
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+    return windows @ ((2 * MAX_INTERVAL + 1) * 256) ** np.arange(k - 1, -1, -1, dtype=np.int64) % PRIME
+
+
+def _minhash(keys):
+    return (PERM_A * keys + PERM_B) % PRIME  # (NUM_PERM, len(keys))
+
+
+def shingles(song, k=SHINGLE):
+    """Distinct hashed runs of k (interval, duration) steps; transposition-invariant."""
+    song = as_compact(song)
+    if len(song) < 2:
+        return np.zeros(0, dtype=np.int64)
+    codes = _step_codes(song.pitch, song.duration)
+    return np.unique(_pack(codes, min(k, len(codes))))
+
+
+def signature(song):
+    """uint32 MinHash signature of NUM_PERM values, or None for songs with fewer than two notes."""
+    x = shingles(song)
+    return _minhash(x).min(axis=1).astype(np.uint32) if len(x) else None
+
+
+def signatures(songs, k=SHINGLE):
+    """signature() of every song, with the shingles of all songs longer than k steps hashed as one array."""
+    songs = [as_compact(song) for song in songs]
+    out = [signature(song) if len(song) <= k else None for song in songs]
+    full = [i for i, song in enumerate(songs) if len(song) > k]
+    if full:
+        lengths = np.array([len(songs[i]) for i in full])
+        codes = _step_codes(np.concatenate([songs[i].pitch for i in full]),
+                            np.concatenate([songs[i].duration for i in full]))
+        owner = np.repeat(np.arange(len(full)), lengths)
+        keys = _pack(codes, k)[owner[:-k] == owner[k:]]  # drop windows spanning two songs
+        # Each song has lengths - k windows; the minimum over repeats equals the minimum over the set
+        starts = np.concatenate([[0], np.cumsum(lengths - k)[:-1]])
+        mins = np.minimum.reduceat(_minhash(keys), starts, axis=1).astype(np.uint32)
+        for col, i in enumerate(full):
+            out[i] = mins[:, col]
+    return out
+
+
+def band_hashes(signatures):
+    """int64 LSH bucket key per band, shape (songs, BANDS); the band number is mixed in so bands never collide."""
+    sigs = np.asarray(signatures, dtype=np.uint64).reshape(-1, BANDS, ROWS)
+    h = np.full(sigs.shape[:2], FNV_OFFSET, dtype=np.uint64) ^ np.arange(BANDS, dtype=np.uint64)
+    for j in range(ROWS):
+        h = (h ^ sigs[:, :, j]) * FNV_PRIME
+    return h.view(np.int64)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity: the fraction of equal MinHash values (b may be a stack of signatures)."""
+    return np.mean(np.asarray(a) == np.asarray(b), axis=-1)
+
+
+def to_blob(sig):
+    return None if sig is None else sig.astype('<u4').tobytes()
+
+
+def from_blob(blob):
+    return None if blob is None else np.frombuffer(blob, dtype='<u4')
+
+
+def _signature_job(args):
+    """Worker job: (ids, signatures) for rows with lo < id <= hi, computing any the table lacks."""
+    import db
+    db_name, lo, hi = args
+    db.DB_NAME = db_name
+    ids, sigs = [], []
+    rows = db.get_connection().execute(
+        'SELECT id, notes, notes_format, minhash FROM songs WHERE id > ? AND id <= ?', (lo, hi))
+    missing = []
+    for song_id, notes, notes_format, blob in rows:
+        if blob is not None:
+            ids.append(song_id)
+            sigs.append(from_blob(blob))
+            continue
+        try:
+            missing.append((song_id, db.decode_notes(notes, notes_format)))
+        except (ValueError, SyntaxError, KeyError, TypeError):
+            pass
+    for (song_id, _), sig in zip(missing, signatures([song for _, song in missing])):
+        if sig is not None:
+            ids.append(song_id)
+            sigs.append(sig)
+    return np.array(ids, dtype=np.int64), np.array(sigs, dtype=np.uint32).reshape(-1, NUM_PERM)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def cluster(threshold=THRESHOLD, workers=None, page_rows=PAGE_ROWS):
+    """Group every song in db.DB_NAME with its near-duplicates; returns lists of ids, largest group first.
+
+    Worker processes read (or compute) signatures for id ranges. The parent
+    merges identical signatures, buckets the rest by band and checks each
+    bucket's pairs, so the work grows with bucket sizes rather than n^2.
+    """
+    import db
+    lo, hi = db.get_connection().execute('SELECT COALESCE(MIN(id), 1) - 1, COALESCE(MAX(id), 0) FROM songs').fetchone()
+    jobs = [(db.DB_NAME, start, min(start + page_rows, hi)) for start in range(lo, hi, page_rows)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_signature_job, jobs))
+    ids = np.concatenate([p[0] for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+    sigs = np.concatenate([p[1] for p in parts]) if parts else np.zeros((0, NUM_PERM), dtype=np.uint32)
+    # Exact copies share one signature row from here on
+    unique, owner = np.unique(sigs, axis=0, return_inverse=True)
+    owner = owner.reshape(-1)
+    parent = list(range(len(unique)))
+    bands = band_hashes(unique)
+    for b in range(BANDS):
+        order = np.argsort(bands[:, b], kind='stable')
+        keys = bands[order, b]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        for start, end in zip(starts, np.r_[starts[1:], len(keys)]):
+            if end - start < 2:
+                continue
+            members = order[start:end]
+            block = max(1, (1 << 24) // (len(members) * NUM_PERM))  # rows compared at once, about 16 MB
+            for first in range(0, len(members), block):
+                sims = similarity(unique[members[first:first + block], None], unique[members][None])
+                for i, j in zip(*np.nonzero(sims >= threshold)):
+                    ri, rj = _find(parent, members[first + i]), _find(parent, members[j])
+                    if ri != rj:
+                        parent[rj] = ri
+    groups = {}
+    for song_id, row in zip(ids.tolist(), owner.tolist()):
+        groups.setdefault(_find(parent, row), []).append(song_id)
+    return sorted((g for g in groups.values() if len(g) > 1), key=lambda g: (-len(g), g[0]))
+
+
+def main(argv=None):
+    import db
+    parser = argparse.ArgumentParser(description="List groups of near-duplicate songs in the database.")
+    parser.add_argument('--db', default=db.DB_NAME, help="database file (default: %(default)s)")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="similarity from 0 to 1 (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=None, help="signature processes (default: one per core)")
+    args = parser.parse_args(argv)
+    db.DB_NAME = args.db
+    groups = cluster(args.threshold, args.workers)
+    for group in groups:
+        print(' '.join(map(str, group)))
+    print(f"{len(groups)} groups, {sum(len(g) - 1 for g in groups)} redundant songs", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
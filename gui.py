@@ -1,31 +1,35 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from music import generate_song, generate_any_song, play_song_with_soundfont
-from db import init_db, save_song, get_songs
+from music import generate_song, generate_any_song, play_song_with_soundfont, iter_bars
+from db import init_db, save_song, iter_songs
 import threading
-import sounddevice as sd
-import numpy as np
+import queue
 import matplotlib
 matplotlib.use('TkAgg')
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
 from theory import Track
+from audio.render import SAMPLE_RATE
+from core.song import song_notes
+from audio.playback import Player
+from audio.mixdown import Mixer, TRACK_VOLUME
+from audio.export import export_audio
+from audio.scope import Spectrum, column_starts, minmax_envelope
+from dedup import THRESHOLD as DUPLICATE_THRESHOLD
+import numpy as np
 
-KEYBOARD_NOTES = [
-    {'note': 'C', 'frequency': 261.63},
-    {'note': 'D', 'frequency': 293.66},
-    {'note': 'E', 'frequency': 329.63},
-    {'note': 'F', 'frequency': 349.23},
-    {'note': 'G', 'frequency': 392.00},
-    {'note': 'A', 'frequency': 440.00},
-    {'note': 'B', 'frequency': 493.88},
-]
+SHOW_SONGS_LIMIT = 500
+SCOPE_FPS = 30
+SCOPE_SAMPLES = 2048  # about 46 ms at 44.1 kHz, also the FFT size
+SPECTRUM_FLOOR_DB = -100.0
+POLL_MS = 100  # how often the Tk thread checks on background jobs
 
 class MusicGUI(tk.Tk):
     def __init__(self):
         super().__init__()
         self.title("Music Program")
         self.geometry("900x800")
+        self.player = Player()
         init_db()
         self.create_menu()
         self.create_toolbar()
@@ -39,6 +43,7 @@ class MusicGUI(tk.Tk):
         file_menu = tk.Menu(menubar, tearoff=0)
         file_menu.add_command(label="New Song", command=self.generate)
         file_menu.add_command(label="Save Song", command=self.save_song)
+        file_menu.add_command(label="Export Audio...", command=self.export_audio)
         file_menu.add_separator()
         file_menu.add_command(label="Exit", command=self.quit)
         menubar.add_cascade(label="File", menu=file_menu)
@@ -80,7 +85,7 @@ class MusicGUI(tk.Tk):
         self.tempo_slider.pack(side=tk.LEFT, padx=5)
         # Play mode
         ttk.Label(panel, text="Play Mode:").pack(side=tk.LEFT, padx=10)
-        self.play_mode = ttk.Combobox(panel, values=["Normal", "Loop", "Reverse"])
+        self.play_mode = ttk.Combobox(panel, values=["Normal", "Loop", "Reverse", "Endless"])
         self.play_mode.set("Normal")
         self.play_mode.pack(side=tk.LEFT, padx=5)
         # Add Stop button to control panel
@@ -89,12 +94,26 @@ class MusicGUI(tk.Tk):
         self.mute_var = tk.BooleanVar(value=False)
         self.mute_check = ttk.Checkbutton(panel, text="Mute", variable=self.mute_var)
         self.mute_check.pack(side=tk.LEFT, padx=10)
+        # Controls act on the running stream from the next audio block on
+        self.volume_var.trace_add('write', self._on_volume)
+        self.tempo_var.trace_add('write', self._on_tempo)
+        self.mute_var.trace_add('write', self._on_mute)
+        self.play_mode.bind('<<ComboboxSelected>>', self._on_play_mode)
+
+    def _on_volume(self, *args):
+        self.player.volume = self.volume_var.get()
+
+    def _on_tempo(self, *args):
+        self.player.set_tempo(self.tempo_var.get())
+
+    def _on_mute(self, *args):
+        self.player.muted = self.mute_var.get()
+
+    def _on_play_mode(self, event=None):
+        self.player.loop = self.play_mode.get() == "Loop"
 
     def stop_playback(self):
-        try:
-            sd.stop()
-        except Exception:
-            pass
+        self.player.stop()
 
     def create_widgets(self):
         ttk.Label(self, text="Title:").pack()
@@ -124,9 +143,14 @@ class MusicGUI(tk.Tk):
         self.lyrics_box.pack(fill=tk.BOTH, expand=True)
         self.osc_frame = tk.Frame(self)
         self.osc_frame.pack(fill=tk.BOTH, expand=True)
+        self.spectrum_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.osc_frame, text="Spectrum", variable=self.spectrum_var,
+                        command=lambda: self.osc_canvas and self._reset_scope()).pack(anchor=tk.W)
         self.osc_canvas = None
+        self._scope_job = None
+        self._scope_samples = np.zeros(SCOPE_SAMPLES, dtype=np.float32)
+        self.spectrum = Spectrum(SCOPE_SAMPLES, SAMPLE_RATE, SPECTRUM_FLOOR_DB)
         self.current_song = None
-        self.last_wave = None
 
     def generate(self):
         title = self.title_entry.get()
@@ -168,7 +192,10 @@ class MusicGUI(tk.Tk):
         self.lyrics_box.insert(tk.END, song_data['lyrics'])
 
     def play_song(self):
-        if not self.current_song or not (self.current_song.get('notes') or self.current_song.get('melody')):
+        if self.play_mode.get() == "Endless":
+            self._play_endless()
+            return
+        if not self.current_song or not len(song_notes(self.current_song)):
             messagebox.showinfo("Info", "No song generated.")
             return
         # Ask user if they want real instrument sound
@@ -177,57 +204,88 @@ class MusicGUI(tk.Tk):
             sf_path = filedialog.askopenfilename(title="Select SoundFont (.sf2)", filetypes=[("SoundFont Files", "*.sf2")])
             if not sf_path:
                 return
-            from music import play_song_with_soundfont
-            threading.Thread(target=play_song_with_soundfont, args=(self.current_song, sf_path), daemon=True).start()
+            self.player.volume = self.volume_var.get()
+            self.player.muted = self.mute_var.get()
+            # Rendering takes a moment, so it runs off the Tk thread; playback then goes through the player
+            threading.Thread(target=play_song_with_soundfont, daemon=True, args=(self.current_song, sf_path),
+                             kwargs={'tempo': self.tempo_var.get(), 'player': self.player,
+                                     'loop': self.play_mode.get() == "Loop"}).start()
         else:
-            threading.Thread(target=self._play_notes, daemon=True).start()
+            self._play_notes()
 
     def _play_notes(self):
-        sample_rate = 44100
-        wave = np.array([])
-        volume = 0.0 if getattr(self, 'mute_var', None) and self.mute_var.get() else (self.volume_var.get() if hasattr(self, 'volume_var') else 0.2)
-        tempo = self.tempo_var.get() if hasattr(self, 'tempo_var') else 120
-        play_mode = self.play_mode.get() if hasattr(self, 'play_mode') else "Normal"
-        notes = self.current_song['notes'] if 'notes' in self.current_song else self.current_song.get('melody', [])
-        if play_mode == "Reverse":
-            notes = list(reversed(notes))
-        if play_mode == "Loop":
-            for _ in range(2):  # Play twice for demo; can be made user-configurable
-                for note in notes:
-                    freq = note['frequency'] if 'frequency' in note else 440.0
-                    duration = note['duration'] * (120 / tempo)
-                    t = np.linspace(0, duration, int(sample_rate * duration), False)
-                    tone = volume * np.sin(2 * np.pi * freq * t)
-                    wave = np.concatenate((wave, tone))
-                    sd.play(tone, sample_rate)
-                    sd.wait()
-            self.last_wave = wave
-            return
-        for note in notes:
-            freq = note['frequency'] if 'frequency' in note else 440.0
-            duration = note['duration'] * (120 / tempo)
-            t = np.linspace(0, duration, int(sample_rate * duration), False)
-            tone = volume * np.sin(2 * np.pi * freq * t)
-            wave = np.concatenate((wave, tone))
-            sd.play(tone, sample_rate)
-            sd.wait()
-        self.last_wave = wave
+        self.player.volume = self.volume_var.get()
+        self.player.muted = self.mute_var.get()
+        play_mode = self.play_mode.get()
+        self.player.play(self.current_song, tempo=self.tempo_var.get(), loop=play_mode == "Loop", reverse=play_mode == "Reverse")
+
+    def _play_endless(self):
+        # Bars are generated by the player's feeder as it needs them, so playback starts at once
+        bars = iter_bars(self.key_entry.get(), self.scale_entry.get(), None, self.clef_combo.get(), with_lyrics=False)
+        self.player.volume = self.volume_var.get()
+        self.player.muted = self.mute_var.get()
+        self.player.play_bars(bars, tempo=self.tempo_var.get())
 
     def show_oscilloscope(self):
-        if self.last_wave is None:
-            messagebox.showinfo("Info", "No audio to display. Play a song first.")
-            return
-        if self.osc_canvas:
-            self.osc_canvas.get_tk_widget().destroy()
+        """Start the live scope; it follows whatever the player sends to the device."""
+        if self.osc_canvas is None:
+            self._build_scope()
+        if self._scope_job is None:
+            self._scope_tick()
+
+    def _build_scope(self):
         fig = Figure(figsize=(6, 2), dpi=100)
-        ax = fig.add_subplot(111)
-        ax.plot(self.last_wave[:44100])  # Show first second
-        ax.set_title("Oscilloscope View (First Second)")
-        ax.set_xlabel("Sample")
-        ax.set_ylabel("Amplitude")
+        self.osc_ax = fig.add_subplot(111)
         self.osc_canvas = FigureCanvasTkAgg(fig, master=self.osc_frame)
-        self.osc_canvas.draw()
         self.osc_canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        # Artists are made once; each frame only swaps their data and blits them
+        self.osc_line, = self.osc_ax.plot([], [], linewidth=1, animated=True)
+        self.osc_canvas.get_tk_widget().bind('<Configure>', self._reset_scope)
+        self._reset_scope()
+
+    def _reset_scope(self, event=None):
+        """Resize the buffers to the widget width and grab a fresh background for blitting."""
+        width = max(self.osc_canvas.get_tk_widget().winfo_width(), 2)
+        spectrum = self.spectrum_var.get()
+        # Columns cover equal runs of FFT bins (DC dropped) or of samples; ticks show what a column starts at
+        if spectrum:
+            values = self.spectrum.freqs[1:]
+            self.osc_ax.set_ylim(SPECTRUM_FLOOR_DB, 0)
+            self.osc_ax.set_xlabel("Frequency (Hz)")
+        else:
+            values = (np.arange(len(self._scope_samples)) - len(self._scope_samples)) * (1000 / SAMPLE_RATE)
+            self.osc_ax.set_ylim(-1, 1)
+            self.osc_ax.set_xlabel("Time (ms)")
+        starts = column_starts(len(values), width)
+        ticks = np.linspace(0, len(starts) - 1, 6).astype(int)
+        self.osc_ax.set_xlim(0, len(starts) - 1)
+        self.osc_ax.set_xticks(ticks)
+        self.osc_ax.set_xticklabels([f"{values[starts[t]]:.0f}" for t in ticks])
+        self.osc_ax.set_title("Spectrum (dB)" if spectrum else "Oscilloscope (live)")
+        self._scope_width = width
+        # Vertical min-max stroke per pixel column: x = 0, 0, 1, 1, ...
+        self.osc_line.set_xdata(np.repeat(np.arange(width), 2))
+        self.osc_line.set_ydata(np.zeros(2 * width))
+        self.osc_canvas.draw()
+        self._scope_background = self.osc_canvas.copy_from_bbox(self.osc_ax.bbox)
+
+    def _scope_tick(self):
+        if not self.osc_canvas.get_tk_widget().winfo_exists():
+            self._scope_job = None
+            return
+        self.player.tap.latest(self._scope_samples)
+        if self.spectrum_var.get():
+            lows, highs = minmax_envelope(self.spectrum(self._scope_samples)[1:], self._scope_width)
+            lows = highs  # one value per column reads better than a band for a spectrum
+        else:
+            lows, highs = minmax_envelope(self._scope_samples, self._scope_width)
+        y = np.full(2 * self._scope_width, np.nan)
+        y[:2 * len(lows):2], y[1:2 * len(highs):2] = lows, highs
+        self.osc_line.set_ydata(y)
+        self.osc_canvas.restore_region(self._scope_background)
+        self.osc_ax.draw_artist(self.osc_line)
+        self.osc_canvas.blit(self.osc_ax.bbox)
+        self._scope_job = self.after(1000 // SCOPE_FPS, self._scope_tick)
 
     def save_song(self):
         if not self.current_song:
@@ -237,16 +295,50 @@ class MusicGUI(tk.Tk):
         key = self.key_entry.get()
         scale = self.scale_entry.get()
         clef = self.clef_combo.get()
-        notes_str = str(self.current_song['notes'])
         lyrics = self.current_song['lyrics']
-        save_song(title, key, scale, clef, notes_str, lyrics)
+        if save_song(title, key, scale, clef, self.current_song, lyrics, duplicate_threshold=DUPLICATE_THRESHOLD) is None:
+            messagebox.showinfo("Not Saved", "A nearly identical song is already in the database.")
+            return
         messagebox.showinfo("Saved", "Song saved to database.")
 
+    def export_audio(self):
+        if not self.current_song or not len(song_notes(self.current_song)):
+            messagebox.showinfo("Info", "No song generated.")
+            return
+        filename = filedialog.asksaveasfilename(title="Export Audio", defaultextension=".wav", filetypes=[
+            ("WAV Files", "*.wav"), ("FLAC Files", "*.flac"), ("Ogg Vorbis Files", "*.ogg")])
+        if filename:
+            results = queue.Queue()
+            threading.Thread(target=self._export_audio, args=(self.current_song, filename, self.tempo_var.get(), results),
+                             daemon=True).start()
+            self._poll_export(results)
+
+    def _export_audio(self, song, filename, tempo, results):
+        # Worker thread: rendered and written block by block, so long songs never sit in memory whole.
+        # Tk is not thread-safe, so the outcome goes through results to _poll_export.
+        try:
+            export_audio(song, filename, tempo)
+        except (ImportError, ValueError, OSError) as e:
+            results.put((messagebox.showerror, "Export Failed", str(e)))
+        else:
+            results.put((messagebox.showinfo, "Exported", f"Audio written to {filename}"))
+
+    def _poll_export(self, results):
+        try:
+            show, title, message = results.get_nowait()
+        except queue.Empty:
+            self.after(POLL_MS, self._poll_export, results)
+        else:
+            show(title, message)
+
     def show_songs(self):
-        songs = get_songs()
         self.result.delete(1.0, tk.END)
-        for s in songs:
-            self.result.insert(tk.END, f"{s[1]} ({s[2]} {s[3]} {s[4]})\nLyrics: {s[6]}\n---\n")
+        columns = ('id', 'title', 'key', 'scale', 'clef', 'lyrics')
+        for i, s in enumerate(iter_songs(columns=columns)):
+            if i == SHOW_SONGS_LIMIT:
+                self.result.insert(tk.END, f"(showing the first {SHOW_SONGS_LIMIT} songs)\n")
+                break
+            self.result.insert(tk.END, f"{s[1]} ({s[2]} {s[3]} {s[4]})\nLyrics: {s[5]}\n---\n")
 
     def show_keyboard(self):
         kb_win = tk.Toplevel(self)
@@ -260,7 +352,8 @@ class MusicGUI(tk.Tk):
                 key_order.append(f"{note}{octave}")
         key_buttons = {}
         for i, note in enumerate(key_order):
-            btn = tk.Button(kb_frame, text=note, width=4, height=8, bg='white', command=lambda n=note: self.play_keyboard_note(n))
+            btn = tk.Button(kb_frame, text=note, width=4, height=8, bg='white')
+            self._bind_key(btn, note)
             btn.grid(row=0, column=i, padx=1, pady=1)
             key_buttons[note] = btn
         # Add black keys
@@ -269,24 +362,20 @@ class MusicGUI(tk.Tk):
             for note, offset in black_key_offsets.items():
                 note_name = f"{note}#{octave}"
                 col = white_keys.index(note) + (octave - 1) * 7
-                btn = tk.Button(kb_frame, text=note_name, width=2, height=4, bg='black', fg='white', command=lambda n=note_name: self.play_keyboard_note(n))
+                btn = tk.Button(kb_frame, text=note_name, width=2, height=4, bg='black', fg='white')
+                self._bind_key(btn, note_name)
                 btn.place(x=(col + offset) * 32, y=0)
 
+    def _bind_key(self, btn, note_name):
+        # Sound starts on press and is released on mouse-up, without waiting on the audio device
+        btn.bind('<ButtonPress-1>', lambda e, n=note_name: self.play_keyboard_note(n))
+        btn.bind('<ButtonRelease-1>', lambda e, n=note_name: self.release_keyboard_note(n))
+
     def play_keyboard_note(self, note_name):
-        # Find frequency for note_name
-        freq = None
-        for n in KEYBOARD_NOTES:
-            if n['note'] == note_name:
-                freq = n['frequency']
-                break
-        if freq is None:
-            return
-        sample_rate = 44100
-        duration = 0.5
-        t = np.linspace(0, duration, int(sample_rate * duration), False)
-        tone = 0.2 * np.sin(2 * np.pi * freq * t)
-        sd.play(tone, sample_rate)
-        sd.wait()
+        self.player.note_on(note_name)
+
+    def release_keyboard_note(self, note_name):
+        self.player.note_off(note_name)
 
     def create_multitrack_panel(self):
         panel = tk.LabelFrame(self, text="Multi-Track Editor", padx=5, pady=5)
@@ -302,12 +391,22 @@ class MusicGUI(tk.Tk):
         self.track_instr_combo = ttk.Combobox(panel, values=["Piano", "Guitar", "Drums", "Bass", "Synth"])
         self.track_instr_combo.set("Piano")
         self.track_instr_combo.pack(side=tk.LEFT, padx=5)
+        self.track_mute_btn = ttk.Button(panel, text="Mute/Unmute", command=self.toggle_track_mute)
+        self.track_mute_btn.pack(side=tk.LEFT, padx=5)
+        self.track_mix_btn = ttk.Button(panel, text="Mix Down", command=self.mix_tracks)
+        self.track_mix_btn.pack(side=tk.LEFT, padx=5)
         self.tracks = []
+        self.mixer = Mixer()
+        self._mix_lock = threading.Lock()
+        self._mix_plan = None  # the Player plan of the last mixdown played
 
     def add_track(self):
         name = self.track_name_entry.get() or f"Track {len(self.tracks)+1}"
         instr = self.track_instr_combo.get()
         track = Track(name, instr)
+        # A new track takes a copy of the current song's notes
+        if self.current_song:
+            track.notes = list(song_notes(self.current_song))
         self.tracks.append(track)
         self.track_listbox.insert(tk.END, f"{name} ({instr})")
 
@@ -317,6 +416,38 @@ class MusicGUI(tk.Tk):
             idx = sel[0]
             self.track_listbox.delete(idx)
             del self.tracks[idx]
+            self._remix_if_playing()
+
+    def toggle_track_mute(self):
+        sel = self.track_listbox.curselection()
+        if sel:
+            idx = sel[0]
+            track = self.tracks[idx]
+            track.muted = not track.muted
+            self.track_listbox.delete(idx)
+            self.track_listbox.insert(idx, f"{track.name} ({track.instrument})" + (" [muted]" if track.muted else ""))
+            self._remix_if_playing()
+
+    def mix_tracks(self):
+        if not any(track.notes for track in self.tracks):
+            messagebox.showinfo("Info", "No tracks with notes. Generate a song, then add a track.")
+            return
+        self.mixer.tempo = self.tempo_var.get()
+        self.player.volume = self.volume_var.get()
+        self.player.muted = self.mute_var.get()
+        loop = self.play_mode.get() == "Loop"
+        threading.Thread(target=self._play_mix, args=(list(self.tracks), loop), daemon=True).start()
+
+    def _remix_if_playing(self):
+        """Swap a playing mixdown for one with the current tracks, from the same position."""
+        if self.player.is_playing and self._mix_plan is not None and self.player.plan is self._mix_plan:
+            threading.Thread(target=self._play_mix, args=(list(self.tracks), self.player.loop, True), daemon=True).start()
+
+    def _play_mix(self, tracks, loop=False, keep_position=False):
+        with self._mix_lock:  # the mixer's render cache is not shared between threads
+            mix = self.mixer.mix(tracks)
+            # Tracks render at TRACK_VOLUME; the player's volume and mute apply on top, as for songs
+            self._mix_plan = self.player.play_buffer(mix / TRACK_VOLUME, loop, keep_position)
 
 if __name__ == "__main__":
     app = MusicGUI()
@@ -0,0 +1,65 @@
+# Bulk MIDI ingestion: parse a directory of .mid files in parallel and load them into songs.db
+# Usage: python ingest.py DIRECTORY [--workers N] [--db songs.db]
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import db
+from smf import read_smf
+
+MIDI_EXTENSIONS = ('.mid', '.midi')
+
+
+def find_midi_files(directory):
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(MIDI_EXTENSIONS):
+                yield os.path.join(root, name)
+
+
+def parse_file(path):
+    """Worker job: return a songs row for one file, or None and the error if it cannot be parsed."""
+    try:
+        song = read_smf(path)
+    except Exception as e:  # any malformed file is reported, never allowed to abort the whole run
+        return path, None, f"{type(e).__name__}: {e}"
+    title = os.path.splitext(os.path.basename(path))[0]
+    clef = 'bass' if len(song) and song.pitch.mean() < 60 else 'treble'
+    return path, (title, None, None, clef, song, ''), None
+
+
+def ingest_directory(directory, workers=None, chunk_size=db.CHUNK_SIZE, verbose=False):
+    """Parse every MIDI file under directory and bulk-insert it; returns (saved, failed, seconds)."""
+    start = time.perf_counter()
+    paths = list(find_midi_files(directory))
+    failed = []
+    def rows(results):
+        for path, row, error in results:
+            if row is None:
+                failed.append((path, error))
+                if verbose:
+                    print(f"skipped {path}: {error}")
+            else:
+                yield row
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunks = max(1, len(paths) // (4 * (workers or os.cpu_count())))
+        saved = db.save_songs(rows(pool.map(parse_file, paths, chunksize=chunks)), chunk_size)
+    return saved, failed, time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import a directory of MIDI files into the song database.")
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int, default=None, help="parser processes (default: one per core)")
+    parser.add_argument('--db', default=db.DB_NAME, help="database file (default: %(default)s)")
+    parser.add_argument('--verbose', action='store_true', help="list files that could not be parsed")
+    args = parser.parse_args(argv)
+    db.DB_NAME = args.db
+    saved, failed, seconds = ingest_directory(args.directory, args.workers, verbose=args.verbose)
+    total = saved + len(failed)
+    print(f"{saved} songs imported, {len(failed)} failed, {total} files in {seconds:.2f} s "
+          f"({total / seconds if seconds else 0:.1f} files/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# Markov lyric engine trained from songs.db lyrics or a text corpus
+# Usage: python lyrics.py train [--db songs.db] [--corpus FILE ...] [--order 2] [-o lyrics.model]
+#        python lyrics.py sample lyrics.model [--lines 8] [--seed N]
+import argparse
+import mmap
+import re
+import struct
+from collections import Counter
+import numpy as np
+
+BOS, EOS = '<s>', '</s>'  # token ids 0 and 1: line start padding and line end
+MAX_WORDS = 12            # tokens sampled per line at most
+TOKEN_RE = re.compile(r"[a-z0-9']+|[,.!?]")
+PUNCTUATION = frozenset(',.!?')
+
+# File format: header, then 8-byte aligned arrays in the order of ARRAYS, then the
+# vocabulary as newline-separated UTF-8. Loading maps the file, so processes share its pages.
+MAGIC = b'LYRM'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBxxIIIIQ')  # magic, version, order, vocab, states, edges, start state, vocab bytes
+ARRAYS = (('indptr', np.int64), ('tokens', np.int32), ('cumulative', np.int64), ('next_state', np.int32))
+
+
+def tokenize(line):
+    return TOKEN_RE.findall(line.lower())
+
+
+def detokenize(tokens):
+    text = ''
+    for token in tokens:
+        text += token if token in PUNCTUATION or not text else ' ' + token
+    return text[:1].upper() + text[1:]
+
+
+class LyricModel:
+    """Order-n Markov chain over word tokens stored as integer arrays (CSR layout).
+
+    Row s of the transition table covers edges indptr[s]:indptr[s+1]; each edge
+    has its next token, the state reached (context shifted by that token) and a
+    running count. cumulative is one cumsum over all edges, so a row's edges
+    span [cumulative[lo-1], cumulative[hi-1]) and a single searchsorted picks
+    the next edge for many lines in different states at once.
+    """
+    max_words = MAX_WORDS
+
+    def __init__(self, order, vocab, indptr, tokens, cumulative, next_state, start_state):
+        self.order = order
+        self.vocab = vocab
+        self.indptr = indptr
+        self.tokens = tokens
+        self.cumulative = cumulative
+        self.next_state = next_state
+        self.start_state = start_state
+        self._words = np.array(vocab, dtype=object)
+
+    @property
+    def n_states(self):
+        return len(self.indptr) - 1
+
+    @classmethod
+    def train(cls, lines, order=2):
+        """Count (context of order tokens -> next token) transitions over the given lines."""
+        vocab = [BOS, EOS]
+        index = {BOS: 0, EOS: 1}
+        counts = Counter()
+        for line in lines:
+            words = tokenize(line)
+            if not words:
+                continue
+            ids = [0] * order + [index.setdefault(w, len(index)) for w in words] + [1]
+            for i in range(order, len(ids)):
+                counts[tuple(ids[i - order:i]), ids[i]] += 1
+        vocab += sorted(index, key=index.get)[2:]
+        # Every context is a state; contexts only reached at a line end have no edges
+        states = {(0,) * order: 0}
+        for context, token in sorted(counts):
+            states.setdefault(context, len(states))
+        edges = sorted(counts.items(), key=lambda item: (states[item[0][0]], item[0][1]))
+        for (context, token), _ in edges:
+            states.setdefault(context[1:] + (token,), len(states))
+        row = np.array([states[context] for (context, _), _ in edges], dtype=np.int64)
+        indptr = np.zeros(len(states) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(row, minlength=len(states)), out=indptr[1:])
+        tokens = np.array([token for (_, token), _ in edges], dtype=np.int32)
+        cumulative = np.cumsum([n for _, n in edges], dtype=np.int64)
+        next_state = np.array([states[context[1:] + (token,)] for (context, token), _ in edges], dtype=np.int32)
+        return cls(order, vocab, indptr, tokens, cumulative, next_state, 0)
+
+    def sample_tokens(self, u):
+        """Token ids for a (lines, steps) array of uniform draws; EOS (1) marks and pads the end of a line."""
+        lines, steps = u.shape
+        out = np.ones((lines, steps), dtype=np.int32)
+        if not len(self.tokens):
+            return out
+        state = np.full(lines, self.start_state, dtype=np.int64)
+        alive = np.ones(lines, dtype=bool)
+        for step in range(steps):
+            lo, hi = self.indptr[state], self.indptr[state + 1]
+            alive &= hi > lo
+            first = np.where(lo > 0, self.cumulative[lo - 1], 0)
+            span = np.where(alive, self.cumulative[hi - 1] - first, 0)
+            target = first + (u[:, step] * span).astype(np.int64)
+            edge = np.searchsorted(self.cumulative, target, side='right')
+            edge = np.minimum(edge, len(self.tokens) - 1)
+            token = np.where(alive, self.tokens[edge], 1)
+            out[:, step] = token
+            alive &= token != 1
+            if not alive.any():
+                break
+            state = np.where(alive, self.next_state[edge], self.start_state)
+        return out
+
+    def sample(self, u):
+        """One lyric line per row of uniform draws (shape (lines, steps))."""
+        ids = self.sample_tokens(np.asarray(u, dtype=np.float64))
+        lengths = np.argmax(ids == 1, axis=1)
+        lengths[(ids != 1).all(axis=1)] = ids.shape[1]
+        words = self._words[ids]
+        return [detokenize(row[:n]) for row, n in zip(words.tolist(), lengths.tolist())]
+
+    def generate(self, lines, rng=None, max_words=MAX_WORDS):
+        rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+        return self.sample(rng.random((lines, max_words)))
+
+    def save(self, path):
+        blob = '\n'.join(self.vocab).encode('utf-8')
+        arrays = {'indptr': self.indptr, 'tokens': self.tokens, 'cumulative': self.cumulative,
+                  'next_state': self.next_state}
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, self.order, len(self.vocab), self.n_states,
+                                len(self.tokens), self.start_state, len(blob)))
+            for name, dtype in ARRAYS:
+                f.write(b'\0' * (-f.tell() % 8))
+                f.write(np.ascontiguousarray(arrays[name], dtype=np.dtype(dtype).newbyteorder('<')).tobytes())
+            f.write(blob)
+
+    @classmethod
+    def load(cls, path):
+        """Map a saved model read-only; the arrays are views into the shared mapping."""
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, order, n_vocab, n_states, n_edges, start_state, blob_size = HEADER.unpack_from(mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a lyric model")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported lyric model version {version}")
+        counts = {'indptr': n_states + 1, 'tokens': n_edges, 'cumulative': n_edges, 'next_state': n_edges}
+        pos = HEADER.size
+        arrays = {}
+        for name, dtype in ARRAYS:
+            pos += -pos % 8
+            dtype = np.dtype(dtype).newbyteorder('<')
+            arrays[name] = np.frombuffer(mm, dtype=dtype, count=counts[name], offset=pos)
+            pos += counts[name] * dtype.itemsize
+        vocab = bytes(mm[pos:pos + blob_size]).decode('utf-8').split('\n')
+        return cls(order, vocab, arrays['indptr'], arrays['tokens'], arrays['cumulative'], arrays['next_state'],
+                   start_state)
+
+
+def db_lines(**filters):
+    """Lyric lines of every song in the database (see db.iter_songs for filters)."""
+    import db
+    for _, lyrics in db.iter_songs(columns=('id', 'lyrics'), **filters):
+        if lyrics:
+            yield from lyrics.splitlines()
+
+
+def corpus_lines(paths):
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            yield from f
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or sample the Markov lyric model.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    train = commands.add_parser('train', help="train from songs.db and/or text files (one lyric line per line)")
+    train.add_argument('--db', help="database to read lyrics from")
+    train.add_argument('--corpus', nargs='*', default=[], help="text files to read lyrics from")
+    train.add_argument('--order', type=int, default=2, help="words of context (default: %(default)s)")
+    train.add_argument('-o', '--output', default='lyrics.model')
+    sample = commands.add_parser('sample', help="print lines from a trained model")
+    sample.add_argument('model')
+    sample.add_argument('--lines', type=int, default=8)
+    sample.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.command == 'train':
+        import itertools
+        sources = [corpus_lines(args.corpus)]
+        if args.db:
+            import db
+            db.DB_NAME = args.db
+            sources.append(db_lines())
+        model = LyricModel.train(itertools.chain(*sources), args.order)
+        model.save(args.output)
+        print(f"{len(model.vocab) - 2} words, {model.n_states} states, {len(model.tokens)} transitions -> {args.output}")
+    else:
+        print('\n'.join(LyricModel.load(args.model).generate(args.lines, args.seed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+# Lightweight instrumentation: counters, histograms, a timing decorator and a sampling profiler.
+# Disabled unless MUSIC_METRICS is set (or enable() is called); a disabled timer costs one global lookup.
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Counts
+
+enabled = os.environ.get('MUSIC_METRICS', '') not in ('', '0')
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    """Monotonic count per combination of label values."""
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values -> float
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        if not enabled:
+            return
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+    def merge(self, values):
+        with self._lock:
+            for labels, value in values.items():
+                self.values[labels] = self.values.get(labels, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+    def samples(self):
+        for labels, value in sorted(self.snapshot().items()):
+            yield self.name + '_total' + _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """Bucketed observations (cumulative on export) with their sum and count, per label values."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values = {}  # label values -> [count per bucket (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        if not enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {labels: [list(counts), total] for labels, (counts, total) in self.values.items()}
+
+    def merge(self, values):
+        with self._lock:
+            for labels, (counts, total) in values.items():
+                entry = self.values.get(labels)
+                if entry is None:
+                    entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+                entry[0] = [a + b for a, b in zip(entry[0], counts)]
+                entry[1] += total
+
+    def reset(self):
+        with self._lock:
+            self.values.clear()
+
+    def samples(self):
+        for labels, (counts, total) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield self.name + '_bucket' + _format_labels(self.labelnames, labels, [('le', le)]), cumulative
+            yield self.name + '_sum' + _format_labels(self.labelnames, labels), total
+            yield self.name + '_count' + _format_labels(self.labelnames, labels), cumulative
+
+
+class Registry:
+    """Named metrics plus collectors that report values owned elsewhere at scrape time."""
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, help, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collect):
+        """collect() returns (name, kind, help, value) tuples, e.g. ('cache_hits_total', 'counter', ..., 3)."""
+        self.collectors.append(collect)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def merge(self, snapshot):
+        """Add a snapshot (from a worker process, say) into these metrics."""
+        for name, values in snapshot.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{sample} {value}' for sample, value in metric.samples())
+        for collect in self.collectors:
+            for name, kind, help, value in collect():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+FUNCTION_SECONDS = registry.histogram('music_function_seconds', 'Wall time of instrumented functions', ('function',))
+
+
+def timed(fn=None, *, name=None):
+    """Record each call's wall time in music_function_seconds{function=name}."""
+    if fn is None:
+        return functools.partial(timed, name=name)
+    label = name or f'{fn.__module__}.{fn.__qualname__}'
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return fn(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            FUNCTION_SECONDS.observe(time.perf_counter() - start, label)
+    return wrapper
+
+
+class timer:
+    """with timer('api.serialize'): ... records like timed(), for a block instead of a function."""
+    __slots__ = ('label', 'histogram', 'start')
+
+    def __init__(self, label, histogram=FUNCTION_SECONDS):
+        self.label = label
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter() if enabled else None
+        return self
+
+    def __exit__(self, *exc):
+        if self.start is not None:
+            self.histogram.observe(time.perf_counter() - self.start, self.label)
+
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every interval seconds from a background thread.
+
+    counts maps folded stacks ("file:function;file:function", root first) to
+    sample counts, which is what flamegraph.pl and speedscope read.
+    """
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.counts = _Counts()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def merge(self, counts, prefix=None):
+        for stack, n in counts.items():
+            self.counts[f'{prefix};{stack}' if prefix else stack] += n
+
+    def folded(self):
+        return ''.join(f'{stack} {n}\n' for stack, n in self.counts.most_common())
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(self.folded())
+
+
+def run_job(fn, args, kwargs, collect=False, profile_interval=None):
+    """Process-pool wrapper: run fn and return (result, metrics delta, folded stack counts).
+
+    The worker's registry is reset first, so the snapshot holds only what this
+    job recorded; the caller merges it into its own registry.
+    """
+    if collect:
+        enable()
+        registry.reset()
+    profiler = SamplingProfiler(profile_interval).start() if profile_interval else None
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+    return result, registry.snapshot() if collect else None, dict(profiler.counts) if profiler else None
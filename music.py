@@ -1,31 +1,11 @@
+import os
 import numpy as np
 import random
-from theory import get_scale, get_chord, NOTES
-import mido
-from mido import MidiFile, MidiTrack, Message
-import fluidsynth
-
-NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
-SCALES = {
-    'major': [2, 2, 1, 2, 2, 2, 1],
-    'minor': [2, 1, 2, 2, 1, 2, 2]
-}
-
-# Note durations in quarter notes (1 = quarter, 0.5 = eighth, etc.)
-DURATIONS = [1, 0.5, 2, 0.25]  # quarter, eighth, half, sixteenth
-DURATION_NAMES = {1: 'quarter', 0.5: 'eighth', 2: 'half', 0.25: 'sixteenth'}
-
-# Dynamics
-DYNAMICS = ['pp', 'p', 'mp', 'mf', 'f', 'ff']
-
-# Clefs
-CLEFS = ['treble', 'bass']
-
-# Note frequencies for A4 = 440Hz
-NOTE_FREQS = {
-    'C': 261.63, 'C#': 277.18, 'D': 293.66, 'D#': 311.13, 'E': 329.63, 'F': 349.23,
-    'F#': 369.99, 'G': 392.00, 'G#': 415.30, 'A': 440.00, 'A#': 466.16, 'B': 493.88
-}
+from concurrent.futures import ProcessPoolExecutor
+from theory import SCALE_NOTES, scale_pitch_classes, get_chord, NOTES, DURATIONS, DURATION_NAMES, DYNAMICS, CLEFS, NOTE_FREQS, NOTE_TO_INT
+from theory import PITCH_COUNT, PITCH_NAMES, PITCH_FREQS, KEYBOARD_LOW, KEYBOARD_HIGH, GUITAR, DRUM_NAMES
+from core.song import CompactSong, CLEF_CODES, as_compact
+from metrics import timed
 
 # Simple lyric templates
 LYRIC_TEMPLATES = [
@@ -37,44 +17,39 @@ LYRIC_TEMPLATES = [
 # Generate random words for lyrics
 WORDS = ["love", "sky", "dream", "light", "night", "heart", "song", "fire", "rain", "star"]
 
+# Reference tables (KEYBOARD_NOTES, MIDI_NOTES, guitar_notes) are views of the
+# theory pitch registry, built on first access through the module __getattr__
+# below. Use theory.PITCH_INDEX / nearest_pitch / GUITAR.positions for lookups.
+
 # Keyboard note mapping (piano keys, 88-key standard)
-KEYBOARD_NOTES = []
 A0_FREQ = 27.5
-for i in range(88):
-    freq = A0_FREQ * (2 ** (i / 12))
-    # Note name calculation
-    note_name = NOTES[i % 12] + str((i + 9) // 12)
-    KEYBOARD_NOTES.append({'note': note_name, 'frequency': freq})
+
+def _keyboard_notes():
+    return [{'note': PITCH_NAMES[m], 'frequency': float(PITCH_FREQS[m])} for m in range(KEYBOARD_LOW, KEYBOARD_HIGH + 1)]
 
 # MIDI note numbers (0-127)
-MIDI_NOTES = [{'note': NOTES[n % 12] + str(n // 12 - 1), 'midi': n, 'frequency': 440.0 * 2 ** ((n - 69) / 12)} for n in range(128)]
+def _midi_notes():
+    return [{'note': PITCH_NAMES[m], 'midi': m, 'frequency': float(PITCH_FREQS[m])} for m in range(PITCH_COUNT)]
 
 # Guitar standard tuning (EADGBE, 6 strings, 12 frets)
-GUITAR_STRINGS = ['E2', 'A2', 'D3', 'G3', 'B3', 'E4']
-GUITAR_FRETS = 12
-guitar_notes = []
-for s, open_note in enumerate(GUITAR_STRINGS):
-    base_idx = NOTES.index(open_note[:-1])
-    octave = int(open_note[-1])
-    for f in range(GUITAR_FRETS + 1):
-        note_idx = (base_idx + f) % 12
-        note_oct = octave + ((base_idx + f) // 12)
-        note_name = NOTES[note_idx] + str(note_oct)
-        freq = NOTE_FREQS[NOTES[note_idx]] * (2 ** (note_oct - 4))
-        guitar_notes.append({'string': s+1, 'fret': f, 'note': note_name, 'frequency': freq})
+GUITAR_STRINGS = list(GUITAR.strings)
+GUITAR_FRETS = GUITAR.frets
+
+def _guitar_notes():
+    return [{'string': s + 1, 'fret': f, 'note': PITCH_NAMES[m], 'frequency': float(PITCH_FREQS[m])}
+            for s, row in enumerate(GUITAR.midi.tolist()) for f, m in enumerate(row)]
+
+_LAZY_TABLES = {'KEYBOARD_NOTES': _keyboard_notes, 'MIDI_NOTES': _midi_notes, 'guitar_notes': _guitar_notes}
+
+def __getattr__(name):
+    build = _LAZY_TABLES.get(name)
+    if build is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    table = globals()[name] = build()  # later lookups find the global and skip __getattr__
+    return table
 
 # Drum kit (basic mapping)
-DRUM_KIT = [
-    {'name': 'Kick', 'midi': 36},
-    {'name': 'Snare', 'midi': 38},
-    {'name': 'Hi-Hat Closed', 'midi': 42},
-    {'name': 'Hi-Hat Open', 'midi': 46},
-    {'name': 'Tom Low', 'midi': 41},
-    {'name': 'Tom Mid', 'midi': 45},
-    {'name': 'Tom High', 'midi': 48},
-    {'name': 'Crash', 'midi': 49},
-    {'name': 'Ride', 'midi': 51}
-]
+DRUM_KIT = [{'name': name, 'midi': midi} for midi, name in DRUM_NAMES.items()]
 
 # Advanced lyric generator using templates and random words
 GENERIC_WORDS = [
@@ -90,18 +65,42 @@ GENERIC_TEMPLATES = [
 ]
 
 def get_scale(key: str, scale: str):
-    """Return the notes in the given key and scale."""
-    if key not in NOTES or scale not in SCALES:
-        return []
-    intervals = SCALES[scale]
-    idx = NOTES.index(key)
-    scale_notes = [key]
-    for step in intervals:
-        idx = (idx + step) % 12
-        scale_notes.append(NOTES[idx])
-    return scale_notes
+    """Return the notes in the given key and scale, or [] if either is unknown."""
+    return list(SCALE_NOTES.get((key, scale), ()))
+
+# Lyrics fill the templates above unless MUSIC_LYRICS_MODEL names a Markov
+# model trained with lyrics.py; the model file is mapped on first use.
+LYRICS_MODEL_PATH = os.environ.get('MUSIC_LYRICS_MODEL') or None
+_lyric_model = None
+_lyric_model_id = None
+
+def lyric_model():
+    """The model named by LYRICS_MODEL_PATH, or None when unset."""
+    global _lyric_model
+    if _lyric_model is None and LYRICS_MODEL_PATH:
+        from lyrics import LyricModel
+        _lyric_model = LyricModel.load(LYRICS_MODEL_PATH)
+    return _lyric_model
+
+def lyric_model_id():
+    """Identity of the lyric model this process uses ('' for the templates): path, size and mtime.
+
+    Taken once, like the model itself is loaded once, so it names the model
+    being served even if the file is retrained afterwards.
+    """
+    global _lyric_model_id
+    if _lyric_model_id is None:
+        if LYRICS_MODEL_PATH:
+            st = os.stat(LYRICS_MODEL_PATH)
+            _lyric_model_id = f'{os.path.abspath(LYRICS_MODEL_PATH)}:{st.st_size}:{st.st_mtime_ns}'
+        else:
+            _lyric_model_id = ''
+    return _lyric_model_id
 
 def generate_lyrics(length: int):
+    model = lyric_model()
+    if model is not None:
+        return '\n'.join(model.generate(length, random.getrandbits(64)))  # follows random.seed()
     lines = []
     for _ in range(length):
         template = random.choice(LYRIC_TEMPLATES)
@@ -111,6 +110,9 @@ def generate_lyrics(length: int):
     return '\n'.join(lines)
 
 def generate_lyrics_advanced(length: int):
+    model = lyric_model()
+    if model is not None:
+        return '\n'.join(model.generate(length, random.getrandbits(64)))
     lines = []
     for _ in range(length):
         template = random.choice(GENERIC_TEMPLATES)
@@ -122,35 +124,55 @@ def generate_lyrics_advanced(length: int):
         lines.append(template.format(word1=word1, word2=word2, word3=word3, verb1=verb1, verb2=verb2))
     return '\n'.join(lines)
 
+BAR_NOTES = 4  # every generator writes four notes per bar
+
+def _bar_chord(scale_notes, bar):
+    """I-IV-V chord of one bar, as used by generate_any_song."""
+    i = bar * BAR_NOTES
+    root = scale_notes[0] if i % 8 == 0 else scale_notes[3] if i % 8 == 4 else scale_notes[4]
+    return {'root': root, 'chord': get_chord(root, 'major')}
+
+def bar_chord(key: str, scale: str, bar: int):
+    """Chord of one bar as iter_bars gives it, or None if the key or scale is unknown."""
+    scale_notes = get_scale(key, scale)
+    return _bar_chord(scale_notes, bar) if scale_notes else None
+
+def _progression(scale_notes, length):
+    return [_bar_chord(scale_notes, bar) for bar in range(length)]
+
 # Algorithm to generate any song (melody, chords, lyrics)
-def generate_any_song(title: str, key: str, scale: str, length: int, clef: str = 'treble', with_lyrics: bool = True):
+@timed
+def generate_any_song(title: str, key: str, scale: str, length: int, clef: str = 'treble', with_lyrics: bool = True, seed=None):
+    if seed is not None:
+        return generate_any_songs(1, title, key, scale, length, clef, with_lyrics, seed)[0]
     # Melody: use scale notes
     scale_notes = get_scale(key, scale)
     if not scale_notes:
         return {'notes': [], 'chords': [], 'lyrics': ''}
     melody = []
-    chords = []
     for i in range(length * 4):
         note = random.choice(scale_notes)
         duration = random.choice([1, 0.5, 2, 0.25])
         melody.append({'note': note, 'duration': duration, 'clef': clef})
-        # Chord progression: I-IV-V or random
-        if i % 4 == 0:
-            root = scale_notes[0] if i % 8 == 0 else scale_notes[3] if i % 8 == 4 else scale_notes[4]
-            chord = get_chord(root, 'major')
-            chords.append({'root': root, 'chord': chord})
+    # Chord progression: I-IV-V or random
+    chords = _progression(scale_notes, length)
     lyrics = generate_lyrics_advanced(length) if with_lyrics else ''
     return {'melody': melody, 'chords': chords, 'lyrics': lyrics}
 
 # Generate a song as a list of note dictionaries with pitch, duration, and dynamics.
 # Each note: {'note': str, 'duration': float, 'dynamic': str, 'clef': str, 'frequency': float}
 # Returns: {'notes': [...], 'lyrics': str}
-def generate_song(title: str, key: str, scale: str, length: int, clef: str = 'treble', with_lyrics: bool = True):
+@timed
+def generate_song(title: str, key: str, scale: str, length: int, clef: str = 'treble', with_lyrics: bool = True, seed=None):
     """
     Generate a song as a list of note dictionaries with pitch, duration, and dynamics.
     Each note: {'note': str, 'duration': float, 'dynamic': str, 'clef': str, 'frequency': float}
     Returns: {'notes': [...], 'lyrics': str}
+    Passing a seed draws from numpy instead of the random module; the result
+    equals generate_songs(1, ..., seed=seed)[0].
     """
+    if seed is not None:
+        return generate_songs(1, title, key, scale, length, clef, with_lyrics, seed)[0]
     scale_notes = get_scale(key, scale)
     if not scale_notes:
         return {'notes': [], 'lyrics': ''}
@@ -171,40 +193,191 @@ def generate_song(title: str, key: str, scale: str, length: int, clef: str = 'tr
     lyrics = generate_lyrics(length) if with_lyrics else ''
     return {'notes': song, 'lyrics': lyrics}
 
-def export_midi(song, filename="output.mid"):
-    mid = MidiFile()
-    track = MidiTrack()
-    mid.tracks.append(track)
-    tempo = mido.bpm2tempo(120)
-    track.append(mido.MetaMessage('set_tempo', tempo=tempo))
-    for note in song['notes'] if 'notes' in song else song.get('melody', []):
-        midi_note = 60 + NOTES.index(note['note'])  # C4 = 60
-        duration = int(480 * note['duration'])
-        track.append(Message('note_on', note=midi_note, velocity=64, time=0))
-        track.append(Message('note_off', note=midi_note, velocity=64, time=duration))
-    mid.save(filename)
+# Batch generation. Every song owns one contiguous row of uniform draws:
+# per-note choice columns first, then one column per lyric slot. A row only
+# depends on the seed and its index, so song i of a batch is the same whatever
+# the batch size, and generate_song(seed=s) is song 0 of any batch with seed s.
+def _draw_rows(count, length, note_fields, lyric_slots, seed):
+    n = length * 4
+    rng = np.random.default_rng(seed)
+    rows = rng.random((count, n * note_fields + length * lyric_slots))
+    return rows[:, :n * note_fields].reshape(count, note_fields, n), rows[:, n * note_fields:].reshape(count, length, lyric_slots)
+
+def _pick(u, options):
+    """Map uniform draws in [0, 1) to indices into options."""
+    return (u * len(options)).astype(np.intp)
+
+def _lyrics_from_draws(draws, templates, slots):
+    """Fill templates from a (lines, 1 + len(slots)) block of draws; slots are (field, words) pairs."""
+    picks = [_pick(draws[:, 0], templates).tolist()]
+    picks += [_pick(draws[:, i + 1], words).tolist() for i, (_, words) in enumerate(slots)]
+    lines = []
+    for template, *chosen in zip(*picks):
+        lines.append(templates[template].format(**{field: words[w] for (field, words), w in zip(slots, chosen)}))
+    return '\n'.join(lines)
 
+def _batch_lyrics(draws, templates, slots, model):
+    """Lyrics of every song in a batch from its (length, columns) block of draws."""
+    if model is None:
+        return [_lyrics_from_draws(d, templates, slots) for d in draws]
+    count, length, _ = draws.shape
+    lines = model.sample(draws.reshape(count * length, -1))  # every line of the batch in one pass
+    return ['\n'.join(lines[i * length:(i + 1) * length]) for i in range(count)]
+
+def _lyric_columns(slots, model):
+    return model.max_words if model is not None else 1 + len(slots)
+
+BASIC_LYRIC_SLOTS = [('word', WORDS), ('word2', WORDS)]
+ADVANCED_LYRIC_SLOTS = [('word1', GENERIC_WORDS), ('word2', GENERIC_WORDS), ('word3', GENERIC_WORDS),
+                        ('verb1', GENERIC_VERBS), ('verb2', GENERIC_VERBS)]
+
+@timed
+def generate_songs(count: int, title: str, key: str, scale: str, length: int, clef: str = 'treble', with_lyrics: bool = True, seed=None, compact: bool = False):
+    """Generate count songs in the generate_song format from one seeded numpy draw.
+
+    With compact=True the songs are returned as CompactSong arrays and no
+    per-note dicts are built.
+    """
+    scale_notes = get_scale(key, scale)
+    if not scale_notes:
+        if compact:
+            return [CompactSong([], []) for _ in range(count)]
+        return [{'notes': [], 'lyrics': ''} for _ in range(count)]
+    model = lyric_model()
+    notes, lyric_draws = _draw_rows(count, length, 3, _lyric_columns(BASIC_LYRIC_SLOTS, model), seed)
+    lyrics = _batch_lyrics(lyric_draws, LYRIC_TEMPLATES, BASIC_LYRIC_SLOTS, model) if with_lyrics else [''] * count
+    pitch, duration, dynamic = _pick(notes[:, 0], scale_notes), _pick(notes[:, 1], DURATIONS), _pick(notes[:, 2], DYNAMICS)
+    if compact:
+        midi = 60 + scale_pitch_classes(key, scale)[pitch]  # generated notes sit in octave 4
+        durations = np.array(DURATIONS, dtype=np.float32)[duration]
+        clefs = np.full(pitch.shape[1], CLEF_CODES[clef])
+        return [CompactSong(midi[i], durations[i], dynamic[i], clefs, lyrics=lyrics[i]) for i in range(count)]
+    freqs = [NOTE_FREQS[n] for n in scale_notes]
+    songs = []
+    for i in range(count):
+        song = [{
+            'note': scale_notes[p],
+            'duration': DURATIONS[d],
+            'duration_name': DURATION_NAMES[DURATIONS[d]],
+            'dynamic': DYNAMICS[y],
+            'clef': clef,
+            'frequency': freqs[p]
+        } for p, d, y in zip(pitch[i].tolist(), duration[i].tolist(), dynamic[i].tolist())]
+        songs.append({'notes': song, 'lyrics': lyrics[i]})
+    return songs
+
+@timed
+def generate_any_songs(count: int, title: str, key: str, scale: str, length: int, clef: str = 'treble', with_lyrics: bool = True, seed=None, compact: bool = False):
+    """Generate count songs in the generate_any_song format from one seeded numpy draw."""
+    scale_notes = get_scale(key, scale)
+    if not scale_notes:
+        if compact:
+            return [CompactSong([], [], layout='melody', chords=[]) for _ in range(count)]
+        return [{'notes': [], 'chords': [], 'lyrics': ''} for _ in range(count)]
+    model = lyric_model()
+    notes, lyric_draws = _draw_rows(count, length, 2, _lyric_columns(ADVANCED_LYRIC_SLOTS, model), seed)
+    lyrics = _batch_lyrics(lyric_draws, GENERIC_TEMPLATES, ADVANCED_LYRIC_SLOTS, model) if with_lyrics else [''] * count
+    pitch, duration = _pick(notes[:, 0], scale_notes), _pick(notes[:, 1], DURATIONS)
+    if compact:
+        midi = 60 + scale_pitch_classes(key, scale)[pitch]
+        durations = np.array(DURATIONS, dtype=np.float32)[duration]
+        clefs = np.full(pitch.shape[1], CLEF_CODES[clef])
+        return [CompactSong(midi[i], durations[i], clef=clefs, layout='melody', chords=_progression(scale_notes, length),
+                            lyrics=lyrics[i])
+                for i in range(count)]
+    songs = []
+    for i in range(count):
+        melody = [{'note': scale_notes[p], 'duration': DURATIONS[d], 'clef': clef}
+                  for p, d in zip(pitch[i].tolist(), duration[i].tolist())]
+        songs.append({'melody': melody, 'chords': _progression(scale_notes, length), 'lyrics': lyrics[i]})
+    return songs
+
+def iter_bars(key: str, scale: str, length=None, clef: str = 'treble', with_lyrics: bool = True, seed=None, style: str = 'notes'):
+    """Yield a song one bar at a time: {'bar': i, 'notes': [...], 'chord': {...}, 'lyrics': line}.
+
+    style='notes' gives generate_song note dicts, style='melody' generate_any_song
+    ones; the chord follows the same I-IV-V progression. length=None never
+    stops. Only a bar counter and one numpy Generator are kept, so an endless
+    stream runs in constant memory. Without a seed the generator is seeded from
+    the random module (random.seed() applies); a seeded stream is reproducible
+    but is not the same song as generate_song(..., seed=seed).
+    """
+    scale_notes = get_scale(key, scale)
+    if not scale_notes:
+        return
+    melody = style == 'melody'
+    options = (scale_notes, DURATIONS) if melody else (scale_notes, DURATIONS, DYNAMICS)
+    templates, slots = (GENERIC_TEMPLATES, ADVANCED_LYRIC_SLOTS) if melody else (LYRIC_TEMPLATES, BASIC_LYRIC_SLOTS)
+    model = lyric_model()
+    note_columns = len(options) * BAR_NOTES
+    columns = note_columns + _lyric_columns(slots, model)
+    freqs = [NOTE_FREQS[n] for n in scale_notes]
+    rng = np.random.default_rng(random.getrandbits(64) if seed is None else seed)
+    bar = 0
+    while length is None or bar < length:
+        u = rng.random(columns)
+        picks = [_pick(u[i * BAR_NOTES:(i + 1) * BAR_NOTES], choices).tolist() for i, choices in enumerate(options)]
+        if melody:
+            notes = [{'note': scale_notes[p], 'duration': DURATIONS[d], 'clef': clef} for p, d in zip(*picks)]
+        else:
+            notes = [{
+                'note': scale_notes[p],
+                'duration': DURATIONS[d],
+                'duration_name': DURATION_NAMES[DURATIONS[d]],
+                'dynamic': DYNAMICS[y],
+                'clef': clef,
+                'frequency': freqs[p]
+            } for p, d, y in zip(*picks)]
+        lyrics = _batch_lyrics(u[None, None, note_columns:], templates, slots, model)[0] if with_lyrics else ''
+        yield {'bar': bar, 'notes': notes, 'chord': _bar_chord(scale_notes, bar), 'lyrics': lyrics}
+        bar += 1
+
+@timed
+def export_midi(song, filename="output.mid", tempo=None, octave=4):
+    """Write a song to a MIDI file; dynamics become note velocities and tempo defaults to the song's own."""
+    from smf import write_smf
+    write_smf(song, filename, tempo=tempo, octave=octave)
+
+def _export_midi_job(args):
+    from smf import write_smf
+    song, filename, tempo, octave = args
+    write_smf(song, filename, tempo=tempo, octave=octave)
+    return filename
+
+@timed
+def export_midi_batch(songs, filenames, tempo=None, octave=4, workers=None):
+    """Export many songs to MIDI files across a process pool; returns the filenames written."""
+    # CompactSongs are much cheaper to send to the workers than lists of note dicts
+    jobs = [(as_compact(song), filename, tempo, octave) for song, filename in zip(songs, filenames)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_export_midi_job, jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count())))))
+
+def export_midi_bars(bars, filename="output.mid", tempo=120, octave=4):
+    """Write bars (e.g. from iter_bars) to a MIDI file as they arrive; returns the number of bars written."""
+    from smf import write_smf_bars
+    return write_smf_bars(bars, filename, tempo=tempo, octave=octave)
+
+@timed
 def import_midi(filename):
-    mid = MidiFile(filename)
-    notes = []
-    for track in mid.tracks:
-        time = 0
-        for msg in track:
-            if msg.type == 'note_on' and msg.velocity > 0:
-                notes.append({'note': NOTES[(msg.note - 60) % 12], 'duration': 1, 'velocity': msg.velocity})
-    return notes
-
-def play_song_with_soundfont(song, soundfont_path, instrument=0):
-    fs = fluidsynth.Synth()
-    fs.start(driver="dsound")
-    sfid = fs.sfload(soundfont_path)
-    fs.program_select(0, sfid, 0, instrument)
-    sample_rate = 44100
-    notes = song['notes'] if 'notes' in song else song.get('melody', [])
-    for note in notes:
-        midi_note = 60 + NOTES.index(note['note'])  # C4 = 60
-        duration = int(note['duration'] * 1000)  # ms
-        fs.noteon(0, midi_note, 100)
-        fluidsynth.sleep(duration / 1000)
-        fs.noteoff(0, midi_note)
-    fs.delete()
+    """Read a MIDI file into a CompactSong with real durations, octaves and dynamics."""
+    from smf import read_smf
+    return read_smf(filename)
+
+def play_song_with_soundfont(song, soundfont_path, instrument=0, tempo=120, player=None, loop=False):
+    """Render the song offline through a pooled synth, then play the buffer on a Player.
+
+    With a player (the GUI's) this returns once playback has started and
+    stop, volume and mute act on it; without one it plays on a new Player and
+    blocks until the song ends.
+    """
+    from audio.playback import Player
+    from audio.soundfont import GAIN, render_soundfont
+    # The synth renders at GAIN, the level a sine song has at volume GAIN; scaled to full, the player's volume applies
+    samples = render_soundfont(song, soundfont_path, instrument, tempo) / GAIN
+    if player is not None:
+        return player.play_buffer(samples, loop)
+    player = Player()
+    player.volume = GAIN
+    player.play_buffer(samples, loop)
+    player.wait()
+    player.close()
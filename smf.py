@@ -0,0 +1,222 @@
+# Standard MIDI File reader and writer working directly on note arrays
+import struct
+import numpy as np
+from theory import DYNAMICS
+from core.song import CompactSong, CLEF_CODES, as_compact
+
+PPQ = 480  # ticks per quarter note
+
+# MIDI velocity for each entry of DYNAMICS
+DYNAMIC_VELOCITY = {'pp': 33, 'p': 49, 'mp': 64, 'mf': 80, 'f': 96, 'ff': 112}
+VELOCITIES = np.array([DYNAMIC_VELOCITY[d] for d in DYNAMICS], dtype=np.uint8)
+
+NOTE_OFF = 0x80
+NOTE_ON = 0x90
+END_OF_TRACK = b'\x00\xff\x2f\x00'
+
+
+def _varlen(values):
+    """Encode non-negative ints as MIDI variable-length quantities.
+
+    Returns (bytes_matrix, lengths): row i holds the big-endian 7-bit groups of
+    values[i], right-aligned in 4 columns, with the continuation bit set on all
+    but the last group.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    groups = np.stack([(values >> shift) & 0x7F for shift in (21, 14, 7, 0)], axis=1).astype(np.uint8)
+    lengths = 1 + (values >= 1 << 7) + (values >= 1 << 14) + (values >= 1 << 21)
+    groups[:, :3] |= 0x80
+    return groups, lengths
+
+
+def _track_events(song, octave, ppq, channel):
+    """Sorted (tick, status, pitch, velocity) arrays for every note on/off of a CompactSong."""
+    pitch = np.clip(song.pitch.astype(np.int64) + 12 * (octave - 4), 0, 127)
+    start = np.rint(song.onset.astype(np.float64) * ppq).astype(np.int64)
+    end = start + np.rint(song.duration.astype(np.float64) * ppq).astype(np.int64)
+    velocity = VELOCITIES[song.dynamic]
+    n = len(song)
+    ticks = np.concatenate([end, start])
+    status = np.concatenate([np.full(n, NOTE_OFF | channel), np.full(n, NOTE_ON | channel)]).astype(np.uint8)
+    pitches = np.concatenate([pitch, pitch]).astype(np.uint8)
+    velocities = np.concatenate([np.full(n, 64, dtype=np.uint8), velocity])
+    # Stable sort keeps note-offs ahead of note-ons at the same tick
+    order = np.argsort(ticks, kind='stable')
+    return ticks[order], status[order], pitches[order], velocities[order]
+
+
+def encode_track(song, tempo=None, octave=4, ppq=PPQ, channel=0):
+    """Return the MTrk chunk for a song as bytes; tempo defaults to the song's own."""
+    song = as_compact(song)
+    tempo = tempo or song.tempo
+    data = _tempo_meta(tempo) + _event_bytes(*_track_events(song, octave, ppq, channel)) + END_OF_TRACK
+    return b'MTrk' + struct.pack('>I', len(data)) + data
+
+
+def _tempo_meta(tempo):
+    return b'\x00\xff\x51\x03' + (round(60_000_000 / tempo)).to_bytes(3, 'big')
+
+
+def _event_bytes(ticks, status, pitches, velocities, last_tick=0):
+    """Encode sorted note events as delta-time + 3 bytes each, the first delta counted from last_tick."""
+    deltas = np.diff(ticks, prepend=last_tick)
+    groups, lengths = _varlen(deltas)
+    sizes = lengths + 3
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    body = np.empty(int(ends[-1]) if len(ends) else 0, dtype=np.uint8)
+    # Scatter the delta-time bytes column by column, then the three event bytes
+    for col in range(4):
+        keep = lengths >= 4 - col
+        body[starts[keep] + lengths[keep] - (4 - col)] = groups[keep, col]
+    body[ends - 3] = status
+    body[ends - 2] = pitches
+    body[ends - 1] = velocities
+    return body.tobytes()
+
+
+def encode_smf(song, tempo=None, octave=4, ppq=PPQ, channel=0):
+    """Return a format-0 Standard MIDI File for a song as bytes."""
+    header = b'MThd' + struct.pack('>IHHH', 6, 0, 1, ppq)
+    return header + encode_track(song, tempo, octave, ppq, channel)
+
+
+def write_smf(song, filename, tempo=None, octave=4, ppq=PPQ, channel=0):
+    with open(filename, 'wb') as f:
+        f.write(encode_smf(song, tempo, octave, ppq, channel))
+
+
+def write_smf_bars(bars, filename, tempo=120, octave=4, ppq=PPQ, channel=0):
+    """Write a format-0 file from an iterable of bars ({'notes': [...]}), encoding each bar as it arrives.
+
+    The track length is patched into the MTrk header once the bars run out,
+    so only one bar is held at a time. Returns the number of bars written.
+    """
+    count = 0
+    with open(filename, 'wb') as f:
+        f.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, ppq) + b'MTrk\0\0\0\0')
+        size = f.write(_tempo_meta(tempo))
+        last_tick = 0  # the last event is the final note-off, where the next bar starts
+        for bar in bars:
+            song = as_compact(bar)
+            if len(song):
+                ticks, status, pitches, velocities = _track_events(song, octave, ppq, channel)
+                ticks += last_tick  # whole ticks, so endless streams do not drift
+                size += f.write(_event_bytes(ticks, status, pitches, velocities, last_tick))
+                last_tick = int(ticks[-1])
+            count += 1
+        size += f.write(END_OF_TRACK)
+        f.seek(18)
+        f.write(struct.pack('>I', size))
+    return count
+
+
+# Reading
+
+def _read_varlen(data, pos):
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def _parse_track(data, notes, tempos):
+    """Append (start, end, channel, pitch, velocity) notes and (tick, usec_per_quarter) tempos from one MTrk body."""
+    pos = 0
+    tick = 0
+    status = 0
+    sounding = {}  # (channel, pitch) -> list of (start tick, velocity)
+    end = len(data)
+    while pos < end:
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        message = status
+        if data[pos] & 0x80:
+            message = data[pos]
+            pos += 1
+            if message < 0xF0:
+                status = message  # only channel messages set the running status
+        kind = message & 0xF0
+        if message == 0xFF:
+            meta = data[pos]
+            length, pos = _read_varlen(data, pos + 1)
+            if meta == 0x51 and length == 3:
+                tempos.append((tick, int.from_bytes(data[pos:pos + 3], 'big')))
+            elif meta == 0x2F:
+                break
+            pos += length
+        elif message in (0xF0, 0xF7):
+            length, pos = _read_varlen(data, pos)
+            pos += length
+        elif kind in (0x80, 0x90):
+            pitch, velocity = data[pos], data[pos + 1]
+            pos += 2
+            key = (message & 0x0F, pitch)
+            if kind == 0x90 and velocity > 0:
+                sounding.setdefault(key, []).append((tick, velocity))
+            elif sounding.get(key):
+                start, on_velocity = sounding[key].pop(0)
+                notes.append((start, tick, key[0], pitch, on_velocity))
+        elif kind in (0xC0, 0xD0):
+            pos += 1
+        else:
+            pos += 2
+    # Notes never switched off end with the track
+    for (channel, pitch), starts in sounding.items():
+        for start, velocity in starts:
+            notes.append((start, tick, channel, pitch, velocity))
+
+
+def _ticks_to_seconds(ticks, tempos, ppq):
+    """Map absolute ticks to seconds through a tempo map of (tick, usec_per_quarter)."""
+    tempos = sorted(tempos) or [(0, 500000)]
+    if tempos[0][0] != 0:
+        tempos.insert(0, (0, 500000))
+    change_ticks = np.array([t for t, _ in tempos], dtype=np.int64)
+    per_tick = np.array([usec for _, usec in tempos], dtype=np.float64) / (1e6 * ppq)
+    change_seconds = np.concatenate([[0.0], np.cumsum(np.diff(change_ticks) * per_tick[:-1])])
+    k = np.searchsorted(change_ticks, ticks, side='right') - 1
+    return change_seconds[k] + (ticks - change_ticks[k]) * per_tick[k]
+
+
+def read_smf(filename):
+    """Read a MIDI file into a CompactSong, one track chunk at a time.
+
+    Note-ons are paired with their note-offs, absolute times follow every tempo
+    change, and onsets/durations are expressed in quarter notes at the file's
+    initial tempo (stored as song.tempo). Velocities map to the nearest dynamic.
+    """
+    notes, tempos = [], []
+    with open(filename, 'rb') as f:
+        header = f.read(14)
+        if len(header) < 14 or header[:4] != b'MThd':
+            raise ValueError(f"{filename}: not a MIDI file")
+        length, _, tracks, ppq = struct.unpack('>IHHH', header[4:])
+        f.seek(length - 6, 1)
+        if ppq & 0x8000:
+            raise ValueError(f"{filename}: SMPTE time division is not supported")
+        for _ in range(tracks):
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk, length = struct.unpack('>4sI', header)
+            data = f.read(length)
+            if chunk == b'MTrk':
+                _parse_track(data, notes, tempos)
+    if any(usec == 0 for _, usec in tempos):
+        raise ValueError(f"{filename}: tempo of zero microseconds per quarter note")
+    tempos.sort()
+    initial_bpm = 60_000_000 / (tempos[0][1] if tempos and tempos[0][0] == 0 else 500000)
+    if not notes:
+        return CompactSong([], [], tempo=initial_bpm)
+    start, end, channel, pitch, velocity = (np.array(col) for col in zip(*sorted(notes)))
+    beats_per_second = initial_bpm / 60
+    onset = _ticks_to_seconds(start, tempos, ppq) * beats_per_second
+    duration = _ticks_to_seconds(end, tempos, ppq) * beats_per_second - onset
+    midpoints = (VELOCITIES[1:].astype(np.int64) + VELOCITIES[:-1]) / 2
+    dynamic = np.searchsorted(midpoints, velocity)
+    clef = np.where(pitch < 60, CLEF_CODES['bass'], CLEF_CODES['treble'])
+    return CompactSong(pitch, duration, dynamic, clef, onset, tempo=initial_bpm)
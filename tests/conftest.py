@@ -0,0 +1,84 @@
+import os
+import sys
+import types
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeOutputStream:
+    """Stands in for sounddevice.OutputStream; tests pull blocks through the callback themselves."""
+    def __init__(self, samplerate, blocksize, channels, dtype, latency, callback):
+        self.blocksize = blocksize
+        self.channels = channels
+        self.callback = callback
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    def pull(self, blocks):
+        """Run the callback for blocks blocks; returns what it wrote, shape (frames, channels)."""
+        out = np.zeros((blocks * self.blocksize, self.channels), dtype=np.float32)
+        for i in range(blocks):
+            self.callback(out[i * self.blocksize:(i + 1) * self.blocksize], self.blocksize, None, None)
+        return out
+
+
+@pytest.fixture
+def player(monkeypatch):
+    from audio.playback import Player
+    monkeypatch.setitem(sys.modules, 'sounddevice', types.SimpleNamespace(OutputStream=FakeOutputStream))
+    p = Player()
+    yield p
+    p.close()
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    import db
+    monkeypatch.setattr(db, 'DB_NAME', str(tmp_path / 'songs.db'))
+    db.init_db()
+    return db
+
+
+class FakeSynth:
+    """Stands in for fluidsynth.Synth: every frame is full-scale while any note sounds."""
+    def __init__(self, gain=0.2, samplerate=44100):
+        self.notes = set()
+
+    def sfload(self, path):
+        return 1
+
+    def program_select(self, channel, sfid, bank, program):
+        pass
+
+    def noteon(self, channel, pitch, velocity):
+        self.notes.add(pitch)
+
+    def noteoff(self, channel, pitch):
+        self.notes.discard(pitch)
+
+    def cc(self, channel, control, value):
+        self.notes.clear()
+
+    def get_samples(self, n):
+        return np.full(2 * n, 32767 if self.notes else 0, dtype=np.int16)
+
+    def delete(self):
+        pass
+
+
+@pytest.fixture
+def fake_fluidsynth(monkeypatch):
+    from audio import soundfont
+    monkeypatch.setitem(sys.modules, 'fluidsynth', types.SimpleNamespace(Synth=FakeSynth))
+    monkeypatch.setattr(soundfont, 'pool', soundfont.SynthPool())
+    yield
+    soundfont.pool.close()
@@ -0,0 +1,152 @@
+import io
+import json
+import re
+import wave
+import pytest
+from fastapi.testclient import TestClient
+import metrics
+from audio.export import VOLUME, pcm16
+from audio.render import SAMPLE_RATE, render_song
+
+
+@pytest.fixture
+def api(monkeypatch):
+    import api
+    monkeypatch.setattr(api, 'WORKERS', 2)
+    return api
+
+
+@pytest.fixture
+def client(api):
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_import_leaves_metrics_alone(api):
+    before = metrics.enabled
+    metrics.enable(False)
+    try:
+        with TestClient(api.app) as client:
+            assert metrics.enabled == api.METRICS
+            client.get('/generate', params={'length': 2, 'seed': 1})
+        assert metrics.enabled is False
+    finally:
+        metrics.enable(before)
+
+
+def test_profile_holds_only_job_stacks(api, monkeypatch, tmp_path):
+    monkeypatch.setattr(api, 'PROFILE_DIR', str(tmp_path))
+    monkeypatch.setattr(api, 'PROFILE_INTERVAL', 0.0005)
+    with TestClient(api.app) as client:
+        r = client.get('/generate', params={'length': 2048, 'stream': 'true'})
+        assert r.status_code == 200
+        path = tmp_path / (r.headers['x-profile-id'] + '.folded')
+        assert path.exists()
+        stacks = [line.rsplit(' ', 1)[0] for line in path.read_text().splitlines()]
+    assert stacks and all(stack.split(';')[0] in ('worker', 'thread') for stack in stacks)
+
+
+def test_seeded_response_is_cached_with_an_etag(client, api):
+    params = {'length': 2, 'seed': 7}
+    first = client.get('/generate', params=params)
+    etag = first.headers['etag']
+    assert client.get('/generate', params=params).content == first.content
+    assert client.get('/generate', params=params, headers={'If-None-Match': etag}).status_code == 304
+    assert json.loads(first.content)['notes'] == api.generate_song('Untitled', 'C', 'major', 2, seed=7)
+
+
+def test_etag_follows_lyric_model_and_version(client, api, monkeypatch):
+    params = {'length': 2, 'seed': 7}
+    etag = client.get('/generate', params=params).headers['etag']
+    monkeypatch.setattr(api, 'lyric_model_id', lambda: '/models/new.model:10:1')
+    retrained = client.get('/generate', params=params).headers['etag']
+    monkeypatch.setattr(api, 'CACHE_VERSION', api.CACHE_VERSION + 1)
+    assert len({etag, retrained, client.get('/generate', params=params).headers['etag']}) == 3
+
+
+def test_every_stream_path_emits_the_same_bar_schema(client, api):
+    paths = {}
+    for name, params in (('chunked', {}), ('seeded', {'seed': 3})):
+        r = client.get('/generate', params={'length': 40, 'stream': 'true', **params})
+        header, *bars = [json.loads(line) for line in r.text.splitlines()]
+        assert header['length'] == 40 and [bar['bar'] for bar in bars] == list(range(40))
+        paths[name] = bars
+    endless = api.iter_bars('C', 'major', None, seed=3)
+    paths['endless'] = [json.loads(line) for line in api._next_bars(endless, 40).splitlines()]
+    for bars in paths.values():
+        assert all(bar.keys() == {'bar', 'notes', 'chord', 'lyrics'} for bar in bars)
+        assert [bar['chord'] for bar in bars] == [bar['chord'] for bar in paths['endless']]
+
+
+def test_seeded_stream_matches_the_whole_song(client):
+    params = {'length': 20, 'seed': 9}
+    song = json.loads(client.get('/generate', params=params).content)['notes']
+    bars = [json.loads(line) for line in client.get('/generate', params={**params, 'stream': 'true'}).text.splitlines()[1:]]
+    assert [note for bar in bars for note in bar['notes']] == song['notes']
+    assert [bar['lyrics'] for bar in bars] == song['lyrics'].split('\n')
+
+
+def test_render_streams_a_complete_wav(client, api):
+    r = client.get('/render', params={'length': 2, 'seed': 5, 'tempo': 100})
+    assert r.status_code == 200 and r.headers['content-type'] == 'audio/wav'
+    with wave.open(io.BytesIO(r.content)) as f:
+        assert (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (1, 2, SAMPLE_RATE)
+        frames = f.readframes(f.getnframes())
+    assert len(r.content) == 44 + len(frames)  # the header's data size is what was streamed
+    song = api.generate_song('Untitled', 'C', 'major', 2, seed=5)
+    assert frames == pcm16(render_song(song, 100, VOLUME))
+    assert client.get('/render', params={'tempo': 0}).status_code == 400
+
+
+def _series(text):
+    """{metric name: {labels without le: [(le, value)] or value}} of a Prometheus text scrape."""
+    series = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        sample, value = line.rsplit(' ', 1)
+        name, _, labels = sample.partition('{')
+        labels = dict(pair.split('=', 1) for pair in re.findall(r'\w+="[^"]*"', labels))
+        le = labels.pop('le', None)
+        key = tuple(sorted(labels.items()))
+        if le is None:
+            series.setdefault(name, {})[key] = float(value)
+        else:
+            series.setdefault(name, {}).setdefault(key, []).append((le, float(value)))
+    return series
+
+
+def test_metrics_scrape_is_valid_prometheus_text(client):
+    assert client.get('/generate', params={'length': 2, 'seed': 11}).status_code == 200
+    r = client.get('/metrics')
+    assert r.headers['content-type'].startswith('text/plain; version=0.0.4')
+    types = dict(line.split()[2:] for line in r.text.splitlines() if line.startswith('# TYPE'))
+    for name in ('music_request_seconds', 'music_pool_job_seconds', 'music_function_seconds'):
+        assert types[name] == 'histogram'
+    for name in ('hits', 'misses', 'evictions', 'not_modified'):
+        assert types[f'music_cache_{name}_total'] == 'counter'
+    assert types['music_cache_entries'] == 'gauge'
+    series = _series(r.text)
+    for name, kind in types.items():
+        if kind != 'histogram':
+            assert set(series[name]) == {()}
+            continue
+        for labels, buckets in series[name + '_bucket'].items():
+            counts = [count for _, count in buckets]
+            assert counts == sorted(counts) and buckets[-1][0] == '"+Inf"'
+            assert counts[-1] == series[name + '_count'][labels]
+    requests = series['music_request_seconds_count']
+    assert requests[(('method', '"GET"'), ('route', '"/generate"'), ('status', '"200"'))] >= 1
+
+
+def test_out_of_range_counts_and_lengths_are_rejected(client, api):
+    for body in ({'count': -3}, {'count': 0}, {'count': api.MAX_BATCH_SONGS + 1}, {'length': -1},
+                 {'length': api.MAX_LENGTH + 1}):
+        assert client.post('/generate/batch', json=body).status_code == 422
+    for path in ('/generate', '/render'):
+        for length in (-1, api.MAX_LENGTH + 1):
+            assert client.get(path, params={'length': length}).status_code == 422
+    r = client.post('/generate/batch', json={'count': 3, 'length': 2, 'seed': 4})
+    body = json.loads(r.content)
+    assert body['count'] == 3
+    assert body['songs'] == [song.to_dict() for song in api.generate_songs(3, 'Untitled', 'C', 'major', 2, seed=[4, 0], compact=True)]
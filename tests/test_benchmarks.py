@@ -0,0 +1,31 @@
+from benchmarks.run import run_one
+
+
+class _Growing:
+    """Each call appends to a list; setup starts it empty."""
+    calls = []
+
+    def setup(self):
+        self.items = []
+        _Growing.calls.append('setup')
+
+    def teardown(self):
+        _Growing.calls.append(len(self.items))
+
+    def time_append(self):
+        self.items.append(0)
+
+
+def test_setup_runs_once_around_the_group():
+    _Growing.calls = []
+    result = run_one(_Growing, 'time_append', None, 3)
+    assert _Growing.calls == ['setup', 1 + 3 * result['number']] and result['number'] > 1
+
+
+def test_number_gives_every_sample_a_fresh_setup():
+    class PerSample(_Growing):
+        number = 1
+    _Growing.calls = []
+    result = run_one(PerSample, 'time_append', None, 3)
+    assert _Growing.calls == ['setup', 1] * 3
+    assert (result['repeat'], result['number']) == (3, 1)
@@ -0,0 +1,23 @@
+from cache import ResponseCache, cache_key
+
+
+def test_cache_key_is_stable_and_order_independent():
+    assert cache_key(a=1, b='x') == cache_key(b='x', a=1)
+    assert cache_key(a=1, b='x') != cache_key(a=2, b='x')
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2)
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    cache.get('a')
+    cache.put('c', b'3')
+    assert cache.get('b') is None and cache.get('a') == b'1' and cache.get('c') == b'3'
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    ResponseCache(maxsize=1, disk_path=path).put('k', b'body')
+    restarted = ResponseCache(maxsize=1, disk_path=path)
+    assert restarted.get('k') is None
+    assert restarted.get_disk('k') == b'body'
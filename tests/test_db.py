@@ -0,0 +1,79 @@
+import sqlite3
+import numpy as np
+import pytest
+from core.song import as_compact
+from music import generate_song
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """A database as written before schema version 1: notes stored as str() of note dicts."""
+    import db
+    path = str(tmp_path / 'legacy.db')
+    song = generate_song('Old song', 'C', 'major', 4, seed=1)
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE songs (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, key TEXT, scale TEXT, '
+                 'clef TEXT, notes TEXT, lyrics TEXT)')
+    conn.executemany('INSERT INTO songs (title, key, scale, clef, notes, lyrics) VALUES (?, ?, ?, ?, ?, ?)',
+                     [('Old song', 'C', 'major', 'treble', str(song['notes']), 'walking in the rain'),
+                      ('Broken', 'C', 'major', 'treble', 'not a list', '')])
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(db, 'DB_NAME', path)
+    yield db, song
+    db.close_connection()
+
+
+def test_migrations_upgrade_legacy_rows(legacy_db):
+    db, song = legacy_db
+    db.init_db()
+    conn = db.get_connection()
+    assert conn.execute('PRAGMA user_version').fetchone()[0] == len(db.MIGRATIONS)
+    formats = dict(conn.execute('SELECT title, notes_format FROM songs'))
+    assert formats == {'Old song': db.NOTES_PACKED, 'Broken': db.NOTES_REPR}
+    assert db.get_song(1)['song'].to_dict()['notes'] == song['notes']
+
+
+def test_pages_follow_the_cursor(temp_db):
+    song = generate_song('t', 'C', 'major', 2, seed=1)
+    temp_db.save_songs([(f'Song {i:02}', 'C' if i % 2 else 'G', 'major', 'treble', song, '') for i in range(25)],
+                       chunk_size=7)
+    titles, cursor = [], 0
+    while cursor is not None:
+        rows, cursor = temp_db.get_songs_page(cursor, 10, key='C', columns=('id', 'title'))
+        titles += [title for _, title in rows]
+    assert titles == [f'Song {i:02}' for i in range(1, 25, 2)]
+    assert np.array_equal(temp_db.get_song(1)['song'].pitch, as_compact(song).pitch)
+
+
+def test_text_search_matches_phrase_prefixes_and_fields(temp_db):
+    song = generate_song('t', 'C', 'major', 2, seed=1)
+    love = temp_db.save_song('Love song', 'C', 'major', 'treble', song, 'love in the sky tonight')
+    rain = temp_db.save_song('Rain', 'C', 'major', 'treble', song, 'no love in the rain')
+    assert [row[0] for row in temp_db.search_songs('love in the sk')] == [love]
+    assert {row[0] for row in temp_db.search_songs('love')} == {love, rain}
+    assert [row[0] for row in temp_db.search_songs('love', field='title')] == [love]
+    assert temp_db.search_songs('  ') == []
+
+
+def test_melody_search_finds_a_transposed_fragment(temp_db):
+    songs = [as_compact(generate_song(f'Song {i}', 'C', 'major', 8, seed=i)) for i in range(20)]
+    temp_db.save_songs([(f'Song {i}', 'C', 'major', 'treble', song, '') for i, song in enumerate(songs)])
+    query = songs[7].pitch[5:15].astype(int) + 5
+    assert temp_db.search_melody(query)[0][:2] == (8, 'Song 7')
+    assert temp_db.search_melody([60, 62]) == []
+
+
+def test_migrated_rows_are_searchable(legacy_db):
+    db, song = legacy_db
+    db.init_db()
+    assert [row[1] for row in db.search_songs('rain')] == ['Old song']
+    assert db.search_melody(as_compact(song).pitch[:8])[0][1] == 'Old song'
+
+
+def test_get_songs_lists_pages_without_notes(temp_db):
+    song = generate_song('t', 'C', 'major', 2, seed=1)
+    temp_db.save_songs([(f'Song {i}', 'D' if i % 3 else 'C', 'major', 'treble', song, '') for i in range(250)])
+    rows = temp_db.get_songs()
+    assert [row[0] for row in rows] == list(range(1, 251)) and len(rows[0]) == len(temp_db.LIST_COLUMNS)
+    assert [title for _, title in temp_db.get_songs(columns=('id', 'title'), key='C')] == [f'Song {i}' for i in range(0, 250, 3)]
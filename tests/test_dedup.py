@@ -0,0 +1,47 @@
+import numpy as np
+import dedup
+from core.song import CompactSong, as_compact
+from music import generate_song
+
+
+def _song(seed, length=16):
+    return as_compact(generate_song('t', 'C', 'major', length, seed=seed))
+
+
+def _shifted(song, semitones=0, changed=()):
+    pitch = song.pitch.astype(np.int64) + semitones
+    pitch[list(changed)] += 1
+    return CompactSong(pitch, song.duration, song.dynamic, song.clef, song.onset)
+
+
+def test_signatures_ignore_key_and_track_small_edits():
+    song = _song(1)
+    sig = dedup.signature(song)
+    assert dedup.similarity(sig, dedup.signature(_shifted(song, 5))) == 1
+    assert 0.8 <= dedup.similarity(sig, dedup.signature(_shifted(song, changed=[30]))) < 1
+    assert dedup.similarity(sig, dedup.signature(_song(2))) < 0.3
+    assert dedup.signature(CompactSong([60], [1.0])) is None
+
+
+def test_batch_signatures_match_single_ones():
+    songs = [_song(seed, length) for seed, length in ((1, 16), (2, 1), (3, 8))] + [CompactSong([60, 62], [1.0, 1.0])]
+    for batch, song in zip(dedup.signatures(songs), songs):
+        np.testing.assert_array_equal(batch, dedup.signature(song))
+
+
+def test_save_skips_near_duplicates(temp_db):
+    song = _song(1)
+    first = temp_db.save_song('a', 'C', 'major', 'treble', song, '', duplicate_threshold=0.8)
+    assert temp_db.find_duplicates(_shifted(song, 3))[0] == (first, 1.0)
+    assert temp_db.save_song('b', 'D', 'major', 'treble', _shifted(song, 2), '', duplicate_threshold=0.8) is None
+    batch = [('c', 'C', 'major', 'treble', _song(2), ''), ('d', 'C', 'major', 'treble', _shifted(_song(2), 7), ''),
+             ('e', 'C', 'major', 'treble', _shifted(song, changed=[30]), '')]
+    assert temp_db.save_songs(batch, duplicate_threshold=0.8) == 1
+    assert [title for _, title in temp_db.get_songs_page(columns=('id', 'title'))[0]] == ['a', 'c']
+
+
+def test_cluster_groups_near_duplicates(temp_db):
+    song, other = _song(1), _song(2)
+    rows = [song, _song(3), _shifted(song, 4), other, _shifted(song, changed=[30]), _shifted(other, -2)]
+    temp_db.save_songs([(str(i), 'C', 'major', 'treble', s, '') for i, s in enumerate(rows)])
+    assert dedup.cluster(workers=2, page_rows=2) == [[1, 3, 5], [4, 6]]
@@ -0,0 +1,56 @@
+import sys
+import types
+import wave
+import numpy as np
+import pytest
+from audio.export import BLOCK, VOLUME, export_audio, pcm16, render_chunks, wav_chunks
+from audio.render import SAMPLE_RATE, render_song
+from music import generate_song
+
+SONG = generate_song('t', 'C', 'major', 2, seed=4)
+
+
+def _read_wav(path):
+    with wave.open(path, 'rb') as f:
+        params = f.getnchannels(), f.getsampwidth(), f.getframerate()
+        return params, np.frombuffer(f.readframes(f.getnframes()), dtype='<i2')
+
+
+def test_chunks_add_up_to_the_whole_render():
+    blocks = [block.copy() for block in render_chunks(SONG, tempo=100, block=1000)]
+    assert all(len(block) == 1000 for block in blocks[:-1])
+    np.testing.assert_array_equal(np.concatenate(blocks), render_song(SONG, 100, VOLUME))
+
+
+def test_wav_header_matches_the_streamed_frames(tmp_path):
+    path = str(tmp_path / 'song.wav')
+    with open(path, 'wb') as f:
+        for chunk in wav_chunks(SONG, block=BLOCK // 4):
+            f.write(chunk)
+    params, frames = _read_wav(path)
+    assert params == (1, 2, SAMPLE_RATE)
+    assert (tmp_path / 'song.wav').stat().st_size == 44 + 2 * len(frames)
+    np.testing.assert_array_equal(frames, np.frombuffer(pcm16(render_song(SONG, 120, VOLUME)), dtype='<i2'))
+
+
+def test_export_audio_round_trip_and_codec_path(tmp_path, monkeypatch):
+    path = export_audio(SONG, str(tmp_path / 'song.wav'), tempo=90)
+    _, frames = _read_wav(path)
+    expected = render_song(SONG, 90, VOLUME)
+    np.testing.assert_allclose(frames / 32767, expected, atol=1 / 32767)
+    written = []
+    class SoundFile:
+        def __init__(self, filename, mode, samplerate, channels, subtype, format):
+            written.append((filename, samplerate, channels, format))
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            pass
+        def write(self, samples):
+            written.append(samples.copy())
+    monkeypatch.setitem(sys.modules, 'soundfile', types.SimpleNamespace(SoundFile=SoundFile))
+    export_audio(SONG, str(tmp_path / 'song.flac'), tempo=90, block=5000)
+    assert written[0] == (str(tmp_path / 'song.flac'), SAMPLE_RATE, 1, 'FLAC')
+    np.testing.assert_array_equal(np.concatenate(written[1:]), expected)
+    with pytest.raises(ValueError):
+        export_audio(SONG, str(tmp_path / 'song.mp3'))
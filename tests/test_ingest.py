@@ -0,0 +1,34 @@
+import struct
+from ingest import ingest_directory
+from music import export_midi, generate_song
+from smf import PPQ, read_smf
+
+
+def _track_file(path, events):
+    with open(path, 'wb') as f:
+        f.write(b'MThd' + struct.pack('>IHHH', 6, 0, 1, PPQ) + b'MTrk' + struct.pack('>I', len(events)) + events)
+
+
+def test_corrupt_files_are_reported_not_fatal(temp_db, tmp_path):
+    for i in range(3):
+        export_midi(generate_song('t', 'C', 'major', 2, seed=i), str(tmp_path / f'good{i}.mid'))
+    data = (tmp_path / 'good0.mid').read_bytes()
+    tempo = data.index(b'\xff\x51\x03') + 3
+    (tmp_path / 'zero_tempo.mid').write_bytes(data[:tempo] + b'\0\0\0' + data[tempo + 3:])
+    (tmp_path / 'truncated.mid').write_bytes(data[:30])
+    (tmp_path / 'not_midi.mid').write_bytes(b'hello')
+    saved, failed, _ = ingest_directory(str(tmp_path), workers=2)
+    assert saved == 3
+    assert sorted(path.rsplit('/', 1)[1] for path, _ in failed) == ['not_midi.mid', 'truncated.mid', 'zero_tempo.mid']
+    assert all(error for _, error in failed)
+    assert [row[1] for row in temp_db.get_songs_page(columns=('id', 'title'))[0]] == ['good0', 'good1', 'good2']
+
+
+def test_meta_events_do_not_take_over_running_status(tmp_path):
+    path = str(tmp_path / 'running.mid')
+    # note-on C4, a text meta event, then a running-status note-on E4 and two running-status note-offs
+    _track_file(path, b'\x00\x90\x3c\x50' + b'\x00\xff\x01\x02hi' + b'\x00\x40\x50'
+                + bytes([0x83, 0x60]) + b'\x3c\x00' + b'\x00\x40\x00' + b'\x00\xff\x2f\x00')
+    song = read_smf(path)
+    assert song.pitch.tolist() == [60, 64]
+    assert song.duration.tolist() == [1, 1]
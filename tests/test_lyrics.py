@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+import music
+from lyrics import LyricModel, tokenize
+
+CORPUS = ["Walking in the rain tonight", "walking in the light, oh", "Dancing in the rain!", "the night is young"]
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = str(tmp_path / 'lyrics.model')
+    LyricModel.train(CORPUS).save(path)
+    return path
+
+
+def test_samples_follow_the_corpus():
+    model = LyricModel.train(CORPUS)
+    words = {word for line in CORPUS for word in tokenize(line)}
+    lines = model.generate(50, 1)
+    assert all(set(tokenize(line)) <= words for line in lines)
+    assert {tuple(tokenize(line)[:2]) for line in lines} <= {tuple(tokenize(line)[:2]) for line in CORPUS}
+    assert LyricModel.train(["one line only"]).generate(3, 0) == ["One line only"] * 3
+
+
+def test_saved_model_loads_mapped_and_samples_the_same(model_path):
+    model = LyricModel.train(CORPUS)
+    loaded = LyricModel.load(model_path)
+    assert loaded.vocab == model.vocab and loaded.order == model.order
+    for name in ('indptr', 'tokens', 'cumulative', 'next_state'):
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(model, name))
+        assert not getattr(loaded, name).flags.writeable  # a view into the read-only mapping
+    assert loaded.generate(20, 7) == model.generate(20, 7)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.model'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        LyricModel.load(str(path))
+
+
+def test_songs_use_the_model_named_by_the_environment(model_path, monkeypatch):
+    code = "import music; print(music.lyric_model_id()); print(music.generate_song('t', 'C', 'major', 6, seed=3)['lyrics'])"
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env={**os.environ, 'MUSIC_LYRICS_MODEL': model_path},
+                         capture_output=True, text=True, check=True).stdout.splitlines()
+    assert out[0].startswith(os.path.abspath(model_path) + ':')
+    monkeypatch.setattr(music, 'LYRICS_MODEL_PATH', model_path)
+    monkeypatch.setattr(music, '_lyric_model', None)
+    assert out[1:] == music.generate_song('t', 'C', 'major', 6, seed=3)['lyrics'].split('\n')
+    words = {word for line in CORPUS for word in tokenize(line)}
+    assert len(out) == 7 and all(set(tokenize(line)) <= words for line in out[1:])
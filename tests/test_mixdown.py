@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from audio import mixdown
+from audio.mixdown import Mixer, pan_gains
+from music import generate_song
+from theory import Track
+
+
+def _track(name, seed, instrument='Piano', **kwargs):
+    track = Track(name, instrument, **kwargs)
+    track.notes = generate_song(name, 'C', 'major', 2, seed=seed)
+    return track
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Names of the tracks render_track was called for, in call order."""
+    calls = []
+    render_track = mixdown.render_track
+    def counting(track, *args):
+        calls.append(track.name)
+        return render_track(track, *args)
+    monkeypatch.setattr(mixdown, 'render_track', counting)
+    return calls
+
+
+def test_only_changed_tracks_are_rendered_again(renders):
+    tracks = [_track('a', 1), _track('b', 2), _track('drums', 3, 'Drums')]
+    mixer = Mixer()
+    first = mixer.mix(tracks)
+    assert sorted(renders) == ['a', 'b', 'drums'] and mixer.rendered == 3
+    renders.clear()
+    tracks[1].gain, tracks[1].pan, tracks[0].muted = 0.5, -1.0, True
+    assert not np.array_equal(mixer.mix(tracks), first)
+    tracks[0].muted = False
+    mixer.mix(tracks)
+    assert renders == [] and mixer.rendered == 0
+    tracks[1].notes = generate_song('b', 'C', 'major', 2, seed=9)
+    mixer.mix(tracks)
+    assert renders == ['b'] and mixer.rendered == 1
+
+
+def test_pan_gains_are_constant_power():
+    np.testing.assert_allclose(pan_gains(-1), (1, 0), atol=1e-12)
+    np.testing.assert_allclose(pan_gains(1), (0, 1), atol=1e-12)
+    np.testing.assert_allclose(pan_gains(0), (np.sqrt(0.5), np.sqrt(0.5)))
+    np.testing.assert_allclose(pan_gains(5), pan_gains(1))
+    for pan in np.linspace(-1, 1, 9):
+        left, right = pan_gains(pan)
+        assert left ** 2 + right ** 2 == pytest.approx(1)
+
+
+def test_mix_applies_gain_pan_and_mute():
+    a, b = _track('a', 1), _track('b', 2, gain=0.5, pan=1.0)
+    mixer = Mixer()
+    alone_a = mixer.mix([a])
+    b_render = Mixer().mix([_track('b', 2, pan=1.0)])
+    both = mixer.mix([a, b])
+    n = max(len(alone_a), len(b_render))
+    pad = lambda x: np.pad(x, ((0, n - len(x)), (0, 0)))
+    np.testing.assert_allclose(both, pad(alone_a) + 0.5 * pad(b_render), atol=1e-6)
+    np.testing.assert_allclose(b_render[:, 0], 0, atol=1e-6)
+    b.muted = True
+    np.testing.assert_array_equal(mixer.mix([a, b]), alone_a)
+    a.muted = True
+    assert mixer.mix([a, b]).shape == (0, 2)
@@ -0,0 +1,19 @@
+import pytest
+from music import generate_any_song, generate_any_songs, generate_song, generate_songs
+
+
+@pytest.mark.parametrize('batch', [generate_songs, generate_any_songs])
+def test_batch_rows_do_not_depend_on_the_batch_size(batch):
+    rows = batch(7, 't', 'D', 'minor', 4, seed=21)
+    assert batch(3, 't', 'D', 'minor', 4, seed=21) == rows[:3]
+    assert batch(1, 't', 'D', 'minor', 4, seed=21) == rows[:1]
+    compact = batch(5, 't', 'D', 'minor', 4, seed=21, compact=True)
+    assert [song.to_dict() for song in compact] == rows[:5]
+    assert batch(3, 't', 'D', 'minor', 4, seed=[21, 1]) != rows[:3]  # the API seeds chunk j with [seed, j]
+
+
+@pytest.mark.parametrize('single, batch', [(generate_song, generate_songs), (generate_any_song, generate_any_songs)])
+def test_seeded_song_is_row_zero_of_a_seeded_batch(single, batch):
+    for seed in (0, 5, 2**40):
+        assert single('t', 'A', 'major', 6, seed=seed) == batch(4, 't', 'A', 'major', 6, seed=seed)[0]
+    assert single('t', 'A', 'major', 6, seed=5) != single('t', 'A', 'major', 6, seed=6)
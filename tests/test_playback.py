@@ -0,0 +1,137 @@
+import time
+import numpy as np
+import pytest
+from music import generate_song, iter_bars
+from audio.render import render_song
+
+
+def pull_until(player, timeout=5):
+    """Drain output block by block until the player reports the song finished.
+
+    A block is only pulled once the feeder has buffered it (or rendered the
+    end), so the output has no underrun gaps however slow the feeder is.
+    """
+    chunks = []
+    deadline = time.monotonic() + timeout
+    while player.is_playing and time.monotonic() < deadline:
+        if len(player._ring) >= player.blocksize or player._render_pos >= player.plan.total:
+            chunks.append(player._stream.pull(1))
+        else:
+            time.sleep(0.0005)
+    return np.concatenate(chunks) if chunks else np.zeros((0, player.channels), dtype=np.float32)
+
+
+def test_play_outputs_the_rendered_song(player):
+    song = generate_song('t', 'C', 'major', 2, seed=1)
+    player.play(song, tempo=480)
+    out = pull_until(player)
+    ref = render_song(song, 480, volume=player.volume)
+    start = np.flatnonzero(out[:, 0])[0] - 1
+    assert not player.is_playing
+    np.testing.assert_allclose(out[start:start + len(ref), 0], ref, atol=1e-6)
+    np.testing.assert_array_equal(out[:, 0], out[:, 1])
+
+
+def test_play_buffer_is_stereo_and_stoppable(player):
+    samples = np.zeros((20000, 2), dtype=np.float32)
+    samples[:, 0], samples[:, 1] = 0.5, -0.25
+    player.volume = 1.0
+    player.play_buffer(samples)
+    out = pull_until(player)
+    played = out[np.any(out != 0, axis=1)]
+    assert len(played) == len(samples)
+    np.testing.assert_array_equal(played, samples)
+    player.play_buffer(samples)
+    player.stop()
+    assert not player.play_buffer(samples[:0]).total and not player.is_playing
+
+
+def test_play_buffer_keeps_position_on_swap(player):
+    samples = np.ones((20000, 2), dtype=np.float32)
+    player.play_buffer(samples)
+    deadline = time.monotonic() + 5
+    while player._play_pos < 2000 and time.monotonic() < deadline:
+        player._stream.pull(1)
+    pos = player._play_pos
+    player.play_buffer(samples * 0.5, keep_position=True)
+    assert player._play_pos == pos and player.is_playing
+    player.set_tempo(60)  # a prerendered buffer ignores tempo changes
+    assert player._play_pos == pos
+
+
+def test_set_tempo_after_stopping_bars(player):
+    player.play_bars(iter_bars('C', 'major', None, seed=3), tempo=120)
+    player._stream.pull(4)
+    player.set_tempo(90)
+    assert player._bar_tempo == 90
+    player.stop()
+    player.set_tempo(140)  # a stopped bar stream has no song to re-plan
+    assert not player.is_playing
+
+
+def test_set_tempo_when_idle(player):
+    player.set_tempo(100)
+    assert player.plan is None
+
+
+def test_soundfont_song_plays_through_the_player(player, fake_fluidsynth):
+    from music import play_song_with_soundfont
+    song = generate_song('t', 'C', 'major', 1, seed=2)
+    slow = play_song_with_soundfont(song, 'fake.sf2', tempo=120, player=player)
+    assert player.plan is slow and player.is_playing
+    player.stop()
+    fast = play_song_with_soundfont(song, 'fake.sf2', tempo=240, player=player)
+    assert fast.samples.shape[1] == 2 and fast.total < slow.total
+    from audio.soundfont import GAIN
+    player.volume = GAIN  # the synth's own level, as the GUI's default volume gives
+    out = pull_until(player)
+    assert np.abs(out).max() == pytest.approx(1.0, abs=1e-3)
+
+
+def _pull_buffered(player, blocks, timeout=5):
+    """Pull blocks blocks, each only once the feeder has buffered it."""
+    chunks = []
+    deadline = time.monotonic() + timeout
+    while len(chunks) < blocks and time.monotonic() < deadline:
+        if len(player._ring) >= player.blocksize:
+            chunks.append(player._stream.pull(1))
+        else:
+            time.sleep(0.0005)
+    return np.concatenate(chunks)
+
+
+def test_loop_replays_the_first_render(player, monkeypatch):
+    from audio.render import RenderPlan
+    rendered = []
+    render = RenderPlan.render
+    def counting(self, start=0, stop=None, out=None, volume=1.0):
+        rendered.append(min(self.total if stop is None else stop, self.total) - start)
+        return render(self, start, stop, out, volume)
+    monkeypatch.setattr(RenderPlan, 'render', counting)
+    song = generate_song('t', 'C', 'major', 1, seed=1)
+    player.play(song, tempo=960, loop=True)
+    total = player.plan.total
+    out = _pull_buffered(player, 3 * total // player.blocksize)[:, 0]
+    player.stop()
+    start = np.flatnonzero(out)[0] - 1
+    np.testing.assert_array_equal(out[start:start + total], out[start + total:start + 2 * total])
+    assert sum(rendered) == total  # later passes come from the kept samples
+
+
+def test_play_position_follows_streamed_bars(player):
+    from audio.render import RenderPlan
+    bars = list(iter_bars('C', 'major', 4, seed=2))
+    starts = np.cumsum([0] + [RenderPlan(bar, 240).total for bar in bars])
+    player.play_bars(iter(bars), tempo=240)
+    plans, played = [], 0
+    while played < starts[-2]:
+        _pull_buffered(player, 1)
+        played += player.blocksize
+        with player._lock:
+            plan, pos = player.plan, player._play_pos
+        if not plans or plans[-1] is not plan:
+            plans.append(plan)
+        # A bar's plan is swapped in while the ring still holds the end of the one before
+        assert played == starts[len(plans) - 1] + pos
+    assert len(plans) >= 3
+    player.stop()
@@ -0,0 +1,85 @@
+import numpy as np
+from audio.render import (CHORD_GAIN, ENVELOPE, MAX_VOICES, SAMPLE_RATE, RenderPlan, chord_frequencies, envelope_tables,
+                          render_song)
+from music import generate_any_song, generate_song
+
+C_MAJOR = {'root': 'C', 'chord': ['C', 'E', 'G']}
+
+
+def _song(freqs, duration=0.5, chords=()):
+    return {'notes': [{'note': 'A', 'duration': duration, 'frequency': f} for f in freqs], 'chords': list(chords)}
+
+
+def _sine(freq, n, phase=0.0):
+    return np.sin(phase + 2 * np.pi * freq * np.arange(n) / SAMPLE_RATE)
+
+
+def test_chord_bar_renders_the_sum_of_its_voices():
+    freqs = [440.0, 494.0, 523.0, 587.0]
+    plan = RenderPlan(_song(freqs, chords=[C_MAJOR]), envelope=None)
+    assert plan.voices == 4
+    n = SAMPLE_RATE // 2  # duration 0.5 at 120 bpm
+    melody, phase = [], 0.0
+    for f in freqs:
+        melody.append(_sine(f, n, phase))
+        phase += 2 * np.pi * f * n / SAMPLE_RATE
+    expected = np.concatenate(melody)
+    for f in chord_frequencies(C_MAJOR):
+        expected += CHORD_GAIN * _sine(f, 4 * n)
+    np.testing.assert_allclose(plan.render(), expected, atol=2e-3)
+    np.testing.assert_allclose(chord_frequencies(C_MAJOR), [130.81, 164.81, 196.0], atol=0.01)
+
+
+def test_chords_beyond_max_voices_are_truncated():
+    big = {'root': 'C', 'chord': ['C', 'E', 'G', 'B', 'D']}
+    song = _song([440.0] * 4, chords=[big])
+    plan = RenderPlan(song, envelope=None)
+    assert plan.voices == MAX_VOICES
+    first = RenderPlan(_song([440.0] * 4, chords=[{'root': 'C', 'chord': big['chord'][:MAX_VOICES - 1]}]), envelope=None)
+    np.testing.assert_array_equal(plan.render(), first.render())
+    assert RenderPlan(song, max_voices=1).voices == 1
+
+
+def test_envelope_has_no_clicks_at_note_edges():
+    attack, decay, sustain, release = ENVELOPE
+    head, tail = envelope_tables()
+    assert head[0] == 0 and head[-1] == np.float32(sustain) and tail[-1] == 1
+    plan = RenderPlan(_song([440.0, 660.0], duration=1))
+    out = plan.render()
+    edges = plan.offsets.tolist()  # note boundaries: 0, one beat, the end
+    for edge in edges[1:-1]:
+        assert np.abs(out[edge - 1:edge + 1]).max() < 2 / len(tail)
+    assert out[0] == 0 and abs(out[-1]) <= 1 / len(tail)
+    # Between the ramps the note holds the sustain level
+    middle = out[edges[0] + int(2 * (attack + decay) * SAMPLE_RATE):edges[1] - len(tail)]
+    assert abs(np.abs(middle).max() - sustain) < 1e-3
+
+
+def _adsr(n):
+    """ENVELOPE gains of an n-sample note, worked out piece by piece."""
+    attack, decay, sustain, release = ENVELOPE
+    a, d, r = int(attack * SAMPLE_RATE), int(decay * SAMPLE_RATE), int(release * SAMPLE_RATE)
+    i = np.arange(n)
+    head = np.where(i < a, i / a, np.where(i < a + d, 1 - (1 - sustain) * (i - a) / d, sustain))
+    return head * np.minimum(1, (n - i) / r)
+
+
+def test_one_note_is_a_sine_at_its_frequency():
+    song = _song([261.63], duration=0.75)
+    n = int(SAMPLE_RATE * 0.75)
+    np.testing.assert_allclose(RenderPlan(song, envelope=None).render(), _sine(261.63, n), atol=1e-5)
+    np.testing.assert_allclose(render_song(song), 0.2 * _sine(261.63, n) * _adsr(n), atol=1e-5)
+    np.testing.assert_allclose(render_song(song, tempo=60), 0.2 * _sine(261.63, 2 * n) * _adsr(2 * n), atol=1e-5)
+
+
+def test_ranges_concatenate_to_the_full_render():
+    rng = np.random.default_rng(0)
+    songs = [generate_song('t', 'E', 'minor', 4, seed=1), generate_any_song('t', 'F', 'major', 4, seed=2)]
+    for song in songs:
+        for reverse in (False, True):
+            plan = RenderPlan(song, 100, reverse=reverse)
+            full = plan.render()
+            cuts = np.unique(np.concatenate([[0, plan.total], rng.integers(0, plan.total, 40), plan.offsets[1:4]]))
+            parts = [plan.render(start, stop) for start, stop in zip(cuts[:-1], cuts[1:])]
+            np.testing.assert_array_equal(np.concatenate(parts), full)
+            np.testing.assert_array_equal(plan.render(plan.total - 5, plan.total + 100), full[-5:])
@@ -0,0 +1,28 @@
+import numpy as np
+from audio.render import SAMPLE_RATE
+from audio.scope import Spectrum, column_starts, minmax_envelope
+
+
+def test_minmax_envelope_covers_every_sample():
+    samples = np.zeros(1000, dtype=np.float32)
+    samples[0], samples[-1] = 1.0, -1.0
+    lows, highs = minmax_envelope(samples, 300)
+    assert len(highs) == 300
+    assert highs[0] == 1.0 and lows[-1] == -1.0
+
+
+def test_minmax_envelope_wider_than_input():
+    lows, highs = minmax_envelope(np.arange(5.0), 10)
+    np.testing.assert_array_equal(highs, np.arange(5.0))
+
+
+def test_low_tone_survives_spectrum_decimation():
+    spectrum = Spectrum(2048, SAMPLE_RATE)
+    t = np.arange(2048) / SAMPLE_RATE
+    db = spectrum(np.sin(2 * np.pi * 440 * t).astype(np.float32))[1:]
+    for width in (600, 900):
+        _, highs = minmax_envelope(db, width)
+        column = int(np.argmax(highs))
+        assert highs[column] > -10
+        start = spectrum.freqs[1:][column_starts(len(db), width)[column]]
+        assert abs(start - 440) < 50
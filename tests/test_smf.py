@@ -0,0 +1,75 @@
+import mido
+import numpy as np
+from core.song import as_compact
+from music import export_midi, export_midi_bars, generate_song, import_midi, iter_bars
+from smf import DYNAMIC_VELOCITY, PPQ, VELOCITIES, read_smf
+from theory import NOTES
+
+
+def test_round_trip_keeps_pitch_timing_and_dynamics(tmp_path):
+    song = as_compact(generate_song('t', 'C', 'major', 8, seed=3))
+    path = str(tmp_path / 'song.mid')
+    export_midi(song, path, tempo=90, octave=5)
+    back = import_midi(path)
+    np.testing.assert_array_equal(back.pitch, song.pitch + 12)
+    np.testing.assert_allclose(back.onset, song.onset)
+    np.testing.assert_allclose(back.duration, song.duration)
+    np.testing.assert_array_equal(back.dynamic, song.dynamic)
+    assert round(back.tempo) == 90
+
+
+def test_written_file_is_valid_midi(tmp_path):
+    song = as_compact(generate_song('t', 'A', 'minor', 4, seed=1))
+    path = str(tmp_path / 'song.mid')
+    export_midi(song, path)
+    midi = mido.MidiFile(path)
+    assert midi.ticks_per_beat == PPQ
+    ons = [msg for msg in midi.tracks[0] if msg.type == 'note_on' and msg.velocity]
+    assert [msg.note for msg in ons] == song.pitch.tolist()
+    assert [msg.velocity for msg in ons] == VELOCITIES[song.dynamic].tolist()
+
+
+def test_reader_follows_tempo_changes(tmp_path):
+    # One beat at 120 bpm, then the tempo halves: the second note is twice as long in real time
+    track = mido.MidiTrack([
+        mido.MetaMessage('set_tempo', tempo=500000, time=0),
+        mido.Message('note_on', note=60, velocity=80, time=0),
+        mido.Message('note_off', note=60, velocity=64, time=PPQ),
+        mido.MetaMessage('set_tempo', tempo=1000000, time=0),
+        mido.Message('note_on', note=64, velocity=80, time=0),
+        mido.Message('note_off', note=64, velocity=64, time=PPQ),
+    ])
+    path = str(tmp_path / 'tempo.mid')
+    mido.MidiFile(tracks=[track], ticks_per_beat=PPQ).save(path)
+    song = read_smf(path)
+    assert song.tempo == 120
+    np.testing.assert_allclose(song.onset, [0, 1])
+    np.testing.assert_allclose(song.duration, [1, 2])
+
+
+def test_bars_are_written_back_to_back(tmp_path):
+    bars = list(iter_bars('D', 'major', 6, seed=4))
+    path = str(tmp_path / 'bars.mid')
+    assert export_midi_bars(iter(bars), path) == 6
+    expected = as_compact({'notes': [note for bar in bars for note in bar['notes']]})
+    assert len(mido.MidiFile(path).tracks[0]) == 2 * len(expected) + 2  # the length field was patched
+    song = read_smf(path)
+    np.testing.assert_array_equal(song.pitch, expected.pitch)
+    np.testing.assert_allclose(song.duration, expected.duration)
+    np.testing.assert_allclose(song.onset, np.concatenate([[0], np.cumsum(expected.duration)[:-1]]))
+
+
+def test_velocities_follow_dynamics_and_the_rest_matches_the_old_writer(tmp_path):
+    assert DYNAMIC_VELOCITY == {'pp': 33, 'p': 49, 'mp': 64, 'mf': 80, 'f': 96, 'ff': 112}
+    song = generate_song('t', 'C', 'major', 8, seed=6)
+    path = str(tmp_path / 'song.mid')
+    export_midi(song, path, tempo=120)
+    # The mido writer export_midi replaced wrote the same back-to-back events with every velocity 64;
+    # only note-on velocities differ, following the note's dynamic
+    old = []
+    for note in song['notes']:
+        pitch, ticks = 60 + NOTES.index(note['note']), int(PPQ * note['duration'])
+        old += [('note_on', pitch, DYNAMIC_VELOCITY[note['dynamic']], 0), ('note_off', pitch, 64, ticks)]
+    new = [(msg.type, msg.note, msg.velocity, msg.time) for msg in mido.MidiFile(path).tracks[0] if not msg.is_meta]
+    assert new == old
+    assert import_midi(path).to_dict()['notes'][0]['dynamic'] == song['notes'][0]['dynamic']
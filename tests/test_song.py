@@ -0,0 +1,31 @@
+import numpy as np
+import theory
+from core.song import CompactSong, NOTE_TABLE_FREQS, as_compact
+from music import generate_song, generate_any_song
+
+
+def test_dict_round_trip_keeps_stored_frequencies():
+    song = generate_song('t', 'C', 'major', 4, seed=3)
+    compact = CompactSong.from_dict(song)
+    assert compact.to_dict()['notes'] == song['notes']
+    assert [n.frequency for n in compact] == [n['frequency'] for n in song['notes']]
+
+
+def test_note_table_is_the_rounded_table_not_equal_temperament():
+    assert NOTE_TABLE_FREQS[60] == theory.NOTE_FREQS['C']
+    np.testing.assert_allclose(NOTE_TABLE_FREQS, theory.PITCH_FREQS[:128], rtol=1e-4)
+
+
+def test_binary_round_trip():
+    song = as_compact(generate_song('t', 'D', 'minor', 8, seed=5))
+    back = CompactSong.from_bytes(song.to_bytes(), song.lyrics)
+    for field in ('pitch', 'duration', 'dynamic', 'clef', 'onset'):
+        np.testing.assert_array_equal(getattr(back, field), getattr(song, field))
+    assert back.layout == song.layout and back.to_dict() == song.to_dict()
+
+
+def test_melody_layout_round_trip_keeps_chords():
+    song = generate_any_song('t', 'G', 'major', 4, seed=2)
+    compact = CompactSong.from_dict(song)
+    assert compact.layout == 'melody'
+    assert compact.to_dict() == song
@@ -0,0 +1,21 @@
+import os
+import pytest
+from benchmarks import bench_startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('module', sorted(bench_startup.BUDGETS))
+def test_import_within_budget_without_backends(module, monkeypatch):
+    monkeypatch.chdir(ROOT)  # the probe imports from the working directory
+    seconds, loaded = bench_startup.measure(module, runs=3)
+    assert seconds <= bench_startup.BUDGETS[module]
+    assert loaded == []
+
+
+@pytest.mark.parametrize('module', ['music', 'theory'])
+def test_audio_and_plotting_backends_load_lazily(module, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    _, loaded = bench_startup.measure(module, runs=1)
+    assert not {'sounddevice', 'fluidsynth', 'matplotlib', 'soundfile'} & set(loaded)
+    assert {'sounddevice', 'fluidsynth', 'matplotlib', 'soundfile'} <= set(bench_startup.LAZY_MODULES)
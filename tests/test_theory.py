@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+import theory
+from theory import GUITAR, PITCH_FREQS, PITCH_INDEX, Fretboard, nearest_pitch, nearest_pitches, pitch_freq, pitch_midi
+
+
+def test_nearest_pitch_splits_at_the_geometric_midpoint():
+    a4, bb4 = PITCH_FREQS[69], PITCH_FREQS[70]
+    midpoint = theory.PITCH_EDGES[69]
+    assert midpoint == pytest.approx(np.sqrt(a4 * bb4))
+    assert nearest_pitch(a4) == 69 and nearest_pitch(midpoint) == 69
+    assert nearest_pitch(np.nextafter(midpoint, np.inf)) == 70
+    assert nearest_pitch(a4 * 2 ** (49 / 1200)) == 69 and nearest_pitch(a4 * 2 ** (51 / 1200)) == 70
+    freqs = np.array([0.0, 1.0, PITCH_FREQS[0], midpoint, 261.63, PITCH_FREQS[127], 1e6])
+    assert nearest_pitches(freqs).tolist() == [0, 0, 0, 69, 60, 127, 127]
+    assert nearest_pitches(freqs).tolist() == [nearest_pitch(f) for f in freqs]
+
+
+def test_pitch_index_accepts_flats_and_covers_the_range():
+    assert PITCH_INDEX['Db4'] == PITCH_INDEX['C#4'] == 61
+    assert PITCH_INDEX['Bb-1'] == 10 and PITCH_INDEX['G9'] == 127
+    assert all(PITCH_INDEX[theory.FLATS[sharp] + '3'] == PITCH_INDEX[sharp + '3'] for sharp in theory.FLATS)
+    assert pitch_midi('C-1') == 0 and pitch_midi(127) == 127 and pitch_freq('A4') == 440.0
+    for bad in (-1, 128, 'Ab9', 'H4'):
+        with pytest.raises(KeyError):
+            pitch_midi(bad)
+
+
+def test_guitar_positions():
+    assert GUITAR.positions('E4') == [(4, 9), (5, 5), (6, 0)]
+    assert GUITAR.positions('A2') == [(1, 5), (2, 0)]
+    assert GUITAR.positions(40) == [(1, 0)] and GUITAR.positions('D#2') == []
+    assert GUITAR.pitch_at(1, 12) == PITCH_INDEX['E3'] and GUITAR.pitch_at(6, 12) == PITCH_INDEX['E5']
+    for string in range(1, 7):
+        for fret in range(13):
+            assert (string, fret) in GUITAR.positions(GUITAR.pitch_at(string, fret))
+    assert Fretboard(('D2',) + theory.GUITAR_TUNING[1:], frets=2).positions('E2') == [(1, 2)]
+
+
+# The list-based helpers the tables replaced
+def _old_scale(root, steps):
+    idx = theory.NOTE_TO_INT[root]
+    notes = [root]
+    for step in steps:
+        idx = (idx + step) % 12
+        notes.append(theory.INT_TO_NOTE[idx])
+    return notes
+
+
+def _old_chord(root, formula):
+    return [theory.INT_TO_NOTE[(theory.NOTE_TO_INT[root] + i) % 12] for i in formula]
+
+
+@pytest.mark.parametrize('pattern', list(theory.SCALE_PATTERNS) + ['minor'])
+def test_scale_tables_match_the_list_helpers(pattern):
+    steps = theory.SCALE_PATTERNS[theory.SCALE_ALIASES.get(pattern, pattern)]
+    for root in theory.NOTES:
+        expected = _old_scale(root, steps)
+        assert theory.get_scale(root, pattern) == expected
+        assert [theory.NOTES[pc] for pc in theory.scale_pitch_classes(root, pattern)] == expected
+    assert theory.get_scale('A', 'minor') == ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'A']
+
+
+@pytest.mark.parametrize('chord_type', list(theory.CHORDS))
+def test_chord_tables_match_the_list_helpers(chord_type):
+    formula = theory.CHORDS[chord_type]
+    for r, root in enumerate(theory.NOTES):
+        expected = _old_chord(root, formula)
+        assert theory.get_chord(root, chord_type) == expected
+        assert [theory.NOTES[pc] for pc in theory.chord_pitch_classes(root, chord_type)] == expected
+        assert (theory.CHORD_TABLE[theory.CHORD_NAMES.index(chord_type), r, len(formula):] == -1).all()
+
+
+def test_melody_operations_match_the_list_helpers():
+    melody = np.array([[60, 64, 67, 72, 71], [62, 57, 59, 50, 74]])
+    for shift in (-13, -1, 0, 5, 12):
+        pcs = theory.transpose_pitches(melody % 12, shift, pitch_classes=True)
+        assert [[theory.NOTES[pc] for pc in row] for row in pcs] == \
+            [[theory.transpose(theory.NOTES[p % 12], shift) for p in row] for row in melody]
+        np.testing.assert_array_equal(theory.intervals(theory.transpose_pitches(melody, shift)), theory.intervals(melody))
+    inverted = theory.invert_pitches(melody)
+    np.testing.assert_array_equal(inverted[:, 0], melody[:, 0])
+    np.testing.assert_array_equal(theory.intervals(inverted), -theory.intervals(melody))
+    np.testing.assert_array_equal(theory.invert_pitches(inverted), melody)
+    np.testing.assert_array_equal(theory.invert_pitches([60, 67], axis=64), [68, 61])
+    for row in melody:
+        assert theory.retrograde_pitches(row).tolist() == theory.retrograde_melody(row.tolist())
+    np.testing.assert_array_equal(theory.retrograde_pitches(melody), melody[:, ::-1])
@@ -0,0 +1,45 @@
+import numpy as np
+from audio.voices import VoiceEngine
+
+BLOCK = 4096  # longer than the default 80 ms release
+
+
+def _sounding(engine):
+    return sorted(engine._key[engine._key >= 0].tolist())
+
+
+def test_oldest_voice_is_stolen():
+    engine = VoiceEngine(max_voices=2)
+    assert engine.note_on('C4') and engine.note_on('E4')
+    engine.render(np.zeros(64, dtype=np.float32))
+    engine.note_on('G4')
+    engine.render(np.zeros(64, dtype=np.float32))
+    assert _sounding(engine) == [64, 67]
+    engine.note_on('E4')  # pressing a held key retriggers its own voice
+    engine.note_on('A4')
+    engine.render(np.zeros(64, dtype=np.float32))
+    assert _sounding(engine) == [64, 69]
+    assert not engine.note_on('H4') and not engine.note_on('C9')
+
+
+def test_note_off_releases_only_that_key():
+    engine = VoiceEngine()
+    engine.note_on('C4')
+    engine.note_on('Eb4')
+    engine.render(np.zeros(BLOCK, dtype=np.float32))
+    engine.note_off('D#4')
+    out = engine.render(np.zeros(BLOCK, dtype=np.float32))
+    assert _sounding(engine) == [60]
+    assert np.abs(out).max() > 0
+
+
+def test_all_notes_off_silences_the_next_block():
+    engine = VoiceEngine()
+    for name in ('C4', 'E4', 'G4'):
+        engine.note_on(name)
+    assert np.abs(engine.render(np.zeros(BLOCK, dtype=np.float32))).max() > 0
+    engine.all_notes_off()
+    released = engine.render(np.zeros(BLOCK, dtype=np.float32))
+    assert np.abs(released[:64]).max() > 0 and np.all(released[-100:] == 0)
+    assert _sounding(engine) == []
+    assert np.all(engine.render(np.zeros(BLOCK, dtype=np.float32)) == 0)
@@ -1,10 +1,28 @@
+import bisect
 import math
+import numpy as np
 
 # Note names and mapping
 NOTES = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 NOTE_TO_INT = {n: i for i, n in enumerate(NOTES)}
 INT_TO_NOTE = {i: n for i, n in enumerate(NOTES)}
 
+# Note durations in quarter notes (1 = quarter, 0.5 = eighth, etc.)
+DURATIONS = [1, 0.5, 2, 0.25]  # quarter, eighth, half, sixteenth
+DURATION_NAMES = {1: 'quarter', 0.5: 'eighth', 2: 'half', 0.25: 'sixteenth'}
+
+# Dynamics
+DYNAMICS = ['pp', 'p', 'mp', 'mf', 'f', 'ff']
+
+# Clefs
+CLEFS = ['treble', 'bass']
+
+# Note frequencies for A4 = 440Hz
+NOTE_FREQS = {
+    'C': 261.63, 'C#': 277.18, 'D': 293.66, 'D#': 311.13, 'E': 329.63, 'F': 349.23,
+    'F#': 369.99, 'G': 392.00, 'G#': 415.30, 'A': 440.00, 'A#': 466.16, 'B': 493.88
+}
+
 # Frequency math (A4 = 440Hz)
 def note_to_freq(note, octave):
     n = NOTE_TO_INT[note]
@@ -17,6 +35,69 @@ def freq_to_note(freq):
     octave = midi // 12 - 1
     return note, octave
 
+# Pitch registry: one entry per MIDI number (0-127), shared by the keyboard,
+# guitar and drum code. Names are sharps with scientific octaves (60 = "C4");
+# flat spellings ("Db4") are accepted on lookup.
+PITCH_COUNT = 128
+PITCH_NAMES = [NOTES[m % 12] + str(m // 12 - 1) for m in range(PITCH_COUNT)]
+PITCH_FREQS = 440.0 * 2 ** ((np.arange(PITCH_COUNT) - 69) / 12)
+FLATS = {'C#': 'Db', 'D#': 'Eb', 'F#': 'Gb', 'G#': 'Ab', 'A#': 'Bb'}
+PITCH_INDEX = {name: m for m, name in enumerate(PITCH_NAMES)}
+PITCH_INDEX.update({FLATS[name[:2]] + name[2:]: m for m, name in enumerate(PITCH_NAMES) if name[:2] in FLATS})
+# Geometric midpoints between neighbouring pitches: bisecting them gives the nearest pitch in cents
+PITCH_EDGES = 440.0 * 2 ** ((np.arange(PITCH_COUNT - 1) + 0.5 - 69) / 12)
+_pitch_edges = PITCH_EDGES.tolist()
+KEYBOARD_LOW, KEYBOARD_HIGH = 21, 108  # A0 .. C8, the 88 piano keys
+
+def pitch_midi(pitch):
+    """MIDI number of a pitch given by MIDI number or name; KeyError if it is out of range or unknown."""
+    if isinstance(pitch, str):
+        return PITCH_INDEX[pitch]
+    if not 0 <= pitch < PITCH_COUNT:
+        raise KeyError(pitch)
+    return int(pitch)
+
+def pitch_name(pitch):
+    return PITCH_NAMES[pitch_midi(pitch)]
+
+def pitch_freq(pitch):
+    return float(PITCH_FREQS[pitch_midi(pitch)])
+
+def nearest_pitch(freq):
+    """MIDI number closest to freq (Hz), clamped to 0-127."""
+    return bisect.bisect_left(_pitch_edges, freq)
+
+def nearest_pitches(freqs):
+    return np.searchsorted(PITCH_EDGES, freqs)
+
+# Guitar fretboard: MIDI number of every string/fret position plus the reverse lookup
+GUITAR_TUNING = ('E2', 'A2', 'D3', 'G3', 'B3', 'E4')
+
+class Fretboard:
+    __slots__ = ('strings', 'frets', 'midi', '_positions')
+    def __init__(self, strings=GUITAR_TUNING, frets=12):
+        self.strings = tuple(strings)
+        self.frets = frets
+        # midi[s, f]: string s (0 = lowest) at fret f
+        self.midi = np.array([pitch_midi(s) for s in self.strings])[:, None] + np.arange(frets + 1)
+        self._positions = {}
+        for s, row in enumerate(self.midi.tolist()):
+            for f, m in enumerate(row):
+                self._positions.setdefault(m, []).append((s + 1, f))
+    def positions(self, pitch):
+        """Every (string, fret) that sounds pitch, strings numbered from 1 (lowest)."""
+        return list(self._positions.get(pitch_midi(pitch), ()))
+    def pitch_at(self, string, fret):
+        return int(self.midi[string - 1, fret])
+    def __repr__(self):
+        return f"Fretboard({'-'.join(self.strings)}, {self.frets} frets)"
+
+GUITAR = Fretboard()
+
+# General MIDI percussion numbers of the drum kit
+DRUM_NAMES = {36: 'Kick', 38: 'Snare', 42: 'Hi-Hat Closed', 46: 'Hi-Hat Open', 41: 'Tom Low',
+              45: 'Tom Mid', 48: 'Tom High', 49: 'Crash', 51: 'Ride'}
+
 # Intervals
 def interval(note1, note2):
     return (NOTE_TO_INT[note2] - NOTE_TO_INT[note1]) % 12
@@ -39,14 +120,6 @@ SCALE_PATTERNS = {
     'locrian':      [1, 2, 2, 1, 2, 2, 2],
 }
 
-def get_scale(root, pattern):
-    idx = NOTE_TO_INT[root]
-    notes = [root]
-    for step in SCALE_PATTERNS[pattern]:
-        idx = (idx + step) % 12
-        notes.append(INT_TO_NOTE[idx])
-    return notes
-
 # Chord formulas
 CHORDS = {
     'major':      [0, 4, 7],
@@ -61,9 +134,57 @@ CHORDS = {
     'sus4':       [0, 5, 7],
 }
 
+# Names accepted for scale patterns besides SCALE_PATTERNS keys
+SCALE_ALIASES = {'minor': 'natural_minor'}
+
+# Lookup tables, built once at import time, for every root x scale pattern and
+# root x chord type. Rows hold pitch classes (0 = C); scales include the octave
+# root as their 8th degree, chords are padded with -1 to four notes.
+SCALE_NAMES = list(SCALE_PATTERNS)
+CHORD_NAMES = list(CHORDS)
+SCALE_TABLE = np.array([[(root + np.concatenate([[0], np.cumsum(steps)])) % 12 for root in range(12)]
+                        for steps in SCALE_PATTERNS.values()], dtype=np.int64)
+CHORD_TABLE = np.array([[[(root + i) % 12 for i in formula] + [-1] * (4 - len(formula)) for root in range(12)]
+                        for formula in CHORDS.values()], dtype=np.int64)
+CHORD_SIZES = {name: len(formula) for name, formula in CHORDS.items()}
+SCALE_NOTES = {(root, pattern): tuple(NOTES[pc] for pc in SCALE_TABLE[p, r])
+               for p, pattern in enumerate(SCALE_NAMES) for r, root in enumerate(NOTES)}
+SCALE_NOTES.update({(root, alias): SCALE_NOTES[(root, pattern)] for alias, pattern in SCALE_ALIASES.items() for root in NOTES})
+CHORD_NOTES = {(root, chord_type): tuple(NOTES[pc] for pc in CHORD_TABLE[c, r, :CHORD_SIZES[chord_type]])
+               for c, chord_type in enumerate(CHORD_NAMES) for r, root in enumerate(NOTES)}
+
+def get_scale(root, pattern):
+    return list(SCALE_NOTES[(root, pattern)])
+
 def get_chord(root, chord_type):
-    idx = NOTE_TO_INT[root]
-    return [INT_TO_NOTE[(idx + i) % 12] for i in CHORDS[chord_type]]
+    return list(CHORD_NOTES[(root, chord_type)])
+
+def scale_pitch_classes(root, pattern):
+    """Pitch classes of a scale as an int array (8 degrees, octave root last)."""
+    return SCALE_TABLE[SCALE_NAMES.index(SCALE_ALIASES.get(pattern, pattern)), NOTE_TO_INT[root]]
+
+def chord_pitch_classes(root, chord_type):
+    return CHORD_TABLE[CHORD_NAMES.index(chord_type), NOTE_TO_INT[root], :CHORD_SIZES[chord_type]]
+
+# Array versions of the melody operations. They take MIDI numbers (or pitch
+# classes) of one melody, or of many melodies along the last axis.
+def transpose_pitches(pitches, semitones, pitch_classes=False):
+    shifted = np.asarray(pitches) + semitones
+    return shifted % 12 if pitch_classes else shifted
+
+def intervals(pitches):
+    """Semitone steps between consecutive notes; invariant under transposition."""
+    return np.diff(np.asarray(pitches), axis=-1)
+
+def invert_pitches(pitches, axis=None):
+    """Mirror each melody around axis (default: its first note)."""
+    pitches = np.asarray(pitches)
+    if axis is None:
+        axis = pitches[..., :1]
+    return 2 * axis - pitches
+
+def retrograde_pitches(pitches):
+    return np.asarray(pitches)[..., ::-1]
 
 # Invert chord
 def invert_chord(chord, n=1):
@@ -83,6 +204,7 @@ def harmonics(freq, n=5):
 # Example: get_scale('C', 'major'), get_chord('C', 'maj7'), note_to_freq('A', 4)
 
 class Note:
+    __slots__ = ('name', 'octave', 'duration', 'dynamic', 'frequency')
     def __init__(self, name, octave, duration=1.0, dynamic='mf'):
         self.name = name
         self.octave = octave
@@ -93,6 +215,7 @@ class Note:
         return f"{self.name}{self.octave}({self.duration}, {self.dynamic})"
 
 class Chord:
+    __slots__ = ('root', 'chord_type', 'notes')
     def __init__(self, root, chord_type):
         self.root = root
         self.chord_type = chord_type
@@ -101,6 +224,7 @@ class Chord:
         return f"{self.root} {self.chord_type}: {self.notes}"
 
 class Scale:
+    __slots__ = ('root', 'pattern', 'notes')
     def __init__(self, root, pattern):
         self.root = root
         self.pattern = pattern
@@ -109,6 +233,7 @@ class Scale:
         return f"{self.root} {self.pattern}: {self.notes}"
 
 class Song:
+    __slots__ = ('title', 'key', 'scale', 'melody', 'chords', 'lyrics')
     def __init__(self, title, key, scale, melody, chords, lyrics):
         self.title = title
         self.key = key
@@ -120,16 +245,21 @@ class Song:
         return f"Song: {self.title}\nKey: {self.key} {self.scale}\nMelody: {self.melody}\nChords: {self.chords}\nLyrics:\n{self.lyrics}"
 
 class Track:
-    def __init__(self, name="Track", instrument="Piano"):
+    __slots__ = ('name', 'instrument', 'notes', 'gain', 'pan', 'muted')
+    def __init__(self, name="Track", instrument="Piano", gain=1.0, pan=0.0, muted=False):
         self.name = name
         self.instrument = instrument
         self.notes = []
+        self.gain = gain    # linear, applied at mixdown
+        self.pan = pan      # -1 (left) .. 1 (right)
+        self.muted = muted
     def add_note(self, note):
         self.notes.append(note)
     def __repr__(self):
         return f"{self.name} ({self.instrument}): {self.notes}"
 
 class MultiTrackSong:
+    __slots__ = ('title', 'key', 'scale', 'tracks')
     def __init__(self, title, key, scale):
         self.title = title
         self.key = key